@@ -7,18 +7,28 @@ This module builds shared parts for other modules.
 # --------------------------------------------------------------------------------
 
 import json
+import os
 
-from fastapi.templating import Jinja2Templates
+from app.utils.timing import TimedJinja2Templates
 
 
 # --------------------------------------------------------------------------------
 # Read Configuration
 # --------------------------------------------------------------------------------
 
+# Relative data paths in config.json resolve against CATTY_DATA_DIR when it is set,
+# so releases deployed side by side share one database
+data_dir = os.environ.get('CATTY_DATA_DIR', '')
+
+
+def data_path(path: str) -> str:
+  return os.path.join(data_dir, path)
+
+
 with open('config.json') as config_json:
   config = json.load(config_json)
   users = config['users']
-  db_path = config['db_path']
+  db_path = data_path(config['db_path'])
 
 
 # --------------------------------------------------------------------------------
@@ -32,4 +42,4 @@ secret_key = config['secret_key']
 # Templates
 # --------------------------------------------------------------------------------
 
-templates = Jinja2Templates(directory="templates")
+templates = TimedJinja2Templates(directory="templates")
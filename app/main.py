@@ -6,32 +6,167 @@ This module is the main module for the FastAPI app.
 # Imports
 # --------------------------------------------------------------------------------
 
+import asyncio
+import logging
+
+from app import config, db_path, templates
+from app.utils.assets import PrecompressedStaticFiles, static_url
+from app.utils.compaction import compaction_config, compactor
+from app.utils.compression import CompressionMiddleware
+from app.utils.durability import DurabilityMiddleware, FileLock, flush_all
 from app.utils.exceptions import UnauthorizedPageException
-from app.routers import api, login, reminders, root
-
+from app.utils.health import readiness
+from app.utils.idempotency import IdempotencyMiddleware
+from app.utils.loop_monitor import LoopMonitorMiddleware, loop_monitor, loop_monitor_config
+from app.utils.metrics import MetricsMiddleware
+from app.utils.profiling import ProfilingMiddleware, profile_store, profiling_config
+from app.utils.rate_limit import RateLimitMiddleware
+from app.utils.scheduler import reminder_scheduler, scheduler_config
+from app.utils.timing import ServerTimingMiddleware
+from app.routers import api, login, monitoring, reminders, root
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.openapi.utils import get_openapi
 from fastapi.responses import JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
 from starlette.exceptions import HTTPException
 
 
+# --------------------------------------------------------------------------------
+# Background Jobs
+# --------------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+JOBS_LOCK_RETRY_SECONDS = 1
+
+# Only one process sharing the database runs the scheduler and the compactor,
+# so during a rolling deploy the new version takes them over once the old one exits
+jobs_lock = FileLock(db_path + '.jobs.lock')
+
+
+async def run_background_jobs() -> None:
+  if not jobs_lock.acquire(blocking=False):
+    logger.info('Another process runs the background jobs for this database, waiting for it to exit')
+    while not jobs_lock.acquire(blocking=False):
+      await asyncio.sleep(JOBS_LOCK_RETRY_SECONDS)
+
+  if scheduler_config.get('enabled', True):
+    reminder_scheduler.start()
+
+  if compaction_config.get('enabled', True):
+    compactor.start()
+
+
+async def stop_background_jobs(jobs_task: asyncio.Task) -> None:
+  jobs_task.cancel()
+  if not jobs_lock.held:
+    return
+
+  if compaction_config.get('enabled', True):
+    await compactor.stop()
+
+  if scheduler_config.get('enabled', True):
+    await reminder_scheduler.stop()
+
+  jobs_lock.release()
+
+
+# --------------------------------------------------------------------------------
+# Lifespan
+# --------------------------------------------------------------------------------
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+  monitor_loop = loop_monitor_config.get('enabled', True)
+
+  if monitor_loop:
+    loop_monitor.start()
+
+  warmup_task = asyncio.create_task(readiness.run_warmup())
+  jobs_task = asyncio.create_task(run_background_jobs())
+
+  yield
+
+  warmup_task.cancel()
+  await stop_background_jobs(jobs_task)
+
+  if monitor_loop:
+    await loop_monitor.stop()
+
+  # Commits still staged under the group or relaxed modes reach the disk before exiting
+  await asyncio.to_thread(flush_all)
+
+
 # --------------------------------------------------------------------------------
 # App Creation
 # --------------------------------------------------------------------------------
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.include_router(root.router)
 app.include_router(api.router)
 app.include_router(login.router)
 app.include_router(reminders.router)
+app.include_router(monitoring.router)
+
+
+# --------------------------------------------------------------------------------
+# Middleware
+# --------------------------------------------------------------------------------
+
+app.add_middleware(DurabilityMiddleware)
+
+app.add_middleware(
+  ProfilingMiddleware,
+  store=profile_store,
+  sample_rate=profiling_config.get('sample_rate', 0),
+  interval=profiling_config.get('interval_ms', 1) / 1000)
+
+server_timing = config.get('server_timing', {})
+
+if server_timing.get('enabled', True):
+  app.add_middleware(ServerTimingMiddleware, log_requests=server_timing.get('log', False))
+
+idempotency = config.get('idempotency', {})
+
+if idempotency.get('enabled', True):
+  app.add_middleware(
+    IdempotencyMiddleware,
+    ttl=idempotency.get('ttl_hours', 24) * 3600,
+    max_keys=idempotency.get('max_keys', 10000),
+    max_bytes=idempotency.get('max_megabytes', 64) * 1024 * 1024)
+
+compression = config.get('compression', {})
+
+if compression.get('enabled', True):
+  app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=compression.get('minimum_size', 1024),
+    gzip_level=compression.get('gzip_level', 5),
+    brotli_quality=compression.get('brotli_quality', 4),
+    zstd_level=compression.get('zstd_level', 3))
+
+rate_limit = config.get('rate_limit', {})
+
+if rate_limit.get('enabled', True):
+  app.add_middleware(
+    RateLimitMiddleware,
+    classes=rate_limit.get('classes'),
+    max_concurrent=rate_limit.get('max_concurrent', 64),
+    queue_timeout=rate_limit.get('queue_timeout_ms', 500) / 1000)
+
+app.add_middleware(MetricsMiddleware)
+
+if loop_monitor_config.get('enabled', True):
+  app.add_middleware(LoopMonitorMiddleware)
 
 
 # --------------------------------------------------------------------------------
 # Static Files
 # --------------------------------------------------------------------------------
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
+templates.env.globals["static_url"] = static_url
 
 
 # --------------------------------------------------------------------------------
@@ -87,6 +222,10 @@ def custom_openapi():
         "name": "HTMX Partials",
         "description": "Routes that serve partial web page contents for HTMX-based requests.",
       },
+      {
+        "name": "Monitoring",
+        "description": "Routes for metrics and operational monitoring.",
+      },
     ]
   )
 
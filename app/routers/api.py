@@ -7,12 +7,22 @@ which provides a "backdoor" for reminder data management.
 # Imports
 # --------------------------------------------------------------------------------
 
-from app.utils.auth import get_storage_for_api
+import asyncio
+import itertools
+import json
+
+from app.utils.auth import get_storage_for_api, get_username_for_api
+from app.utils.profiling import to_thread
+from app.utils.recurrence import RecurrenceRule, occurrences_in_window
+from app.utils.responses import model_response
+from app.utils.scheduler import reminder_scheduler, sse_notifier
 from app.utils.storage import ReminderList, ReminderItem, ReminderStorage
 
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
-from typing import Dict, List, Optional
+from datetime import datetime
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import AfterValidator, BaseModel, ConfigDict
+from typing import Annotated, AsyncIterator, Dict, List, Literal, Optional
 
 
 # --------------------------------------------------------------------------------
@@ -33,8 +43,52 @@ class NewReminderListName(BaseModel):
   name: str
 
 
+def _normalize_recurrence(recurrence: str) -> str:
+  return str(RecurrenceRule.parse(recurrence))
+
+
+RecurrenceText = Annotated[str, AfterValidator(_normalize_recurrence)]
+
+
 class NewReminderItem(BaseModel):
   description: str
+  due_at: Optional[datetime] = None
+  remind_at: Optional[datetime] = None
+  recurrence: Optional[RecurrenceText] = None
+
+
+class ReminderItemDescription(BaseModel):
+  # Schedule fields belong to the schedule route, so sending them here is an error rather than ignored
+  model_config = ConfigDict(extra='forbid')
+
+  description: str
+
+
+class ReminderItemSchedule(BaseModel):
+  due_at: Optional[datetime] = None
+  remind_at: Optional[datetime] = None
+  recurrence: Optional[RecurrenceText] = None
+
+
+class ItemPosition(BaseModel):
+  after_id: Optional[int] = None
+
+
+class BulkItemAction(BaseModel):
+  item_ids: List[int]
+  action: Literal['complete', 'incomplete', 'delete']
+
+
+class BulkItemResult(BaseModel):
+  changed: List[int]
+  deleted: List[int]
+  created: List[int]
+
+
+class ReminderOccurrence(BaseModel):
+  item_id: int
+  description: str
+  at: datetime
 
 
 class SelectedListId(BaseModel):
@@ -52,10 +106,12 @@ class SelectedListId(BaseModel):
 )
 async def get_reminders(
   storage: ReminderStorage = Depends(get_storage_for_api)
-) -> list[ReminderList]:
+) -> Response:
   """Gets the list of all reminder lists owned by the user."""
 
-  return storage.get_lists()
+  # Off the loop, so concurrent identical reads can overlap and share one single-flight read
+  reminder_lists = await to_thread(storage.get_lists)
+  return model_response(reminder_lists, List[ReminderList])
 
 
 @router.post(
@@ -66,11 +122,11 @@ async def get_reminders(
 async def post_reminders(
   reminder_list: NewReminderListName,
   storage: ReminderStorage = Depends(get_storage_for_api)
-) -> ReminderList:
+) -> Response:
   """Creates a new reminder list for the user."""
 
   list_id = storage.create_list(reminder_list.name)
-  return storage.get_list(list_id)
+  return model_response(storage.get_list(list_id), ReminderList)
 
 
 @router.get(
@@ -81,10 +137,10 @@ async def post_reminders(
 async def get_list_id(
   list_id: int,
   storage: ReminderStorage = Depends(get_storage_for_api)
-) -> ReminderList:
+) -> Response:
   """Gets a reminder list by ID."""
 
-  return storage.get_list(list_id)
+  return model_response(storage.get_list(list_id), ReminderList)
 
 
 @router.patch(
@@ -96,11 +152,11 @@ async def patch_list_id(
   list_id: int,
   reminder_list: NewReminderListName,
   storage: ReminderStorage = Depends(get_storage_for_api)
-) -> ReminderList:
+) -> Response:
   """Updates a reminder list's name."""
   
   storage.update_list_name(list_id, reminder_list.name)
-  return storage.get_list(list_id)
+  return model_response(storage.get_list(list_id), ReminderList)
 
 
 @router.delete(
@@ -130,10 +186,79 @@ async def delete_list_id(
 async def get_list_id_items(
   list_id: int,
   storage: ReminderStorage = Depends(get_storage_for_api)
-) -> List[ReminderItem]:
+) -> Response:
   """Gets all reminder items for a list."""
 
-  return storage.get_items(list_id)
+  reminder_items = await to_thread(storage.get_items, list_id)
+  return model_response(reminder_items, List[ReminderItem])
+
+
+@router.post(
+  path="/reminders/{list_id}/items/complete",
+  summary="Mark every item in a list as completed",
+  response_model=List[ReminderItem]
+)
+async def post_list_id_items_complete(
+  list_id: int,
+  storage: ReminderStorage = Depends(get_storage_for_api)
+) -> Response:
+  """Marks every item in a list as completed in one write, and returns the list's items."""
+
+  result = storage.set_list_completed(list_id, True)
+  reminder_scheduler.sync_bulk(storage.owner, result)
+  return model_response(storage.get_items(list_id), List[ReminderItem])
+
+
+@router.post(
+  path="/reminders/{list_id}/items/incomplete",
+  summary="Mark every item in a list as not completed",
+  response_model=List[ReminderItem]
+)
+async def post_list_id_items_incomplete(
+  list_id: int,
+  storage: ReminderStorage = Depends(get_storage_for_api)
+) -> Response:
+  """Marks every item in a list as not completed in one write, and returns the list's items."""
+
+  result = storage.set_list_completed(list_id, False)
+  reminder_scheduler.sync_bulk(storage.owner, result)
+  return model_response(storage.get_items(list_id), List[ReminderItem])
+
+
+@router.delete(
+  path="/reminders/{list_id}/items/completed",
+  summary="Delete every completed item in a list",
+  response_model=List[ReminderItem]
+)
+async def delete_list_id_items_completed(
+  list_id: int,
+  storage: ReminderStorage = Depends(get_storage_for_api)
+) -> Response:
+  """Deletes every completed item in a list in one write, and returns the remaining items."""
+
+  result = storage.delete_completed_items(list_id)
+  reminder_scheduler.sync_bulk(storage.owner, result)
+  return model_response(storage.get_items(list_id), List[ReminderItem])
+
+
+@router.post(
+  path="/reminders/items/bulk",
+  summary="Complete, uncomplete or delete several reminder items at once",
+  response_model=BulkItemResult
+)
+async def post_items_bulk(
+  bulk_action: BulkItemAction,
+  storage: ReminderStorage = Depends(get_storage_for_api)
+) -> Response:
+  """
+  Applies one action to every given item in one write.
+  If any item is missing or belongs to someone else, nothing is changed.
+  """
+
+  result = storage.update_items(bulk_action.item_ids, bulk_action.action)
+  reminder_scheduler.sync_bulk(storage.owner, result)
+  bulk_result = BulkItemResult(changed=result.changed, deleted=result.deleted, created=result.created)
+  return model_response(bulk_result, BulkItemResult)
 
 
 @router.post(
@@ -145,11 +270,41 @@ async def post_reminders_list_id_items(
   list_id: int,
   reminder_item: NewReminderItem,
   storage: ReminderStorage = Depends(get_storage_for_api)
-) -> ReminderItem:
+) -> Response:
   """Adds a new item to a reminder list."""
 
-  item_id = storage.add_item(list_id, reminder_item.description)
-  return storage.get_item(item_id)
+  item_id = storage.add_item(
+    list_id,
+    reminder_item.description,
+    reminder_item.due_at,
+    reminder_item.remind_at,
+    reminder_item.recurrence)
+  reminder_scheduler.schedule(item_id, storage.owner, reminder_item.remind_at)
+  return model_response(storage.get_item(item_id), ReminderItem)
+
+
+@router.get(
+  path="/reminders/{list_id}/occurrences",
+  summary="Get the occurrences of a list's items in a time window",
+  response_model=List[ReminderOccurrence]
+)
+async def get_list_id_occurrences(
+  list_id: int,
+  start: datetime,
+  end: datetime,
+  limit: int = Query(default=500, ge=1, le=5000),
+  storage: ReminderStorage = Depends(get_storage_for_api)
+) -> Response:
+  """
+  Gets every due time of a list's items between start and end, in order,
+  expanding recurring items on the fly.
+  """
+
+  items = [item for item in storage.get_items(list_id) if not item.completed]
+  occurrences = occurrences_in_window(items, start, end)
+  return model_response([
+    ReminderOccurrence(item_id=item.id, description=item.description, at=at)
+    for at, item in itertools.islice(occurrences, limit)], List[ReminderOccurrence])
 
 
 @router.get(
@@ -160,10 +315,10 @@ async def post_reminders_list_id_items(
 async def get_items_item_id(
   item_id: int,
   storage: ReminderStorage = Depends(get_storage_for_api)
-) -> ReminderItem:
+) -> Response:
   """Gets a reminder item by ID."""
 
-  return storage.get_item(item_id)
+  return model_response(storage.get_item(item_id), ReminderItem)
 
 
 @router.patch(
@@ -173,13 +328,51 @@ async def get_items_item_id(
 )
 async def patch_items_item_id(
   item_id: int,
-  reminder_item: NewReminderItem,
+  reminder_item: ReminderItemDescription,
   storage: ReminderStorage = Depends(get_storage_for_api)
-) -> ReminderItem:
-  """Updates a reminder item's description."""
+) -> Response:
+  """Updates a reminder item's description. Use the schedule route to change its times or recurrence."""
   
   storage.update_item_description(item_id, reminder_item.description)
-  return storage.get_item(item_id)
+  return model_response(storage.get_item(item_id), ReminderItem)
+
+
+@router.patch(
+  path="/reminders/items/schedule/{item_id}",
+  summary="Set or clear a reminder item's due time, reminder time and recurrence",
+  response_model=ReminderItem
+)
+async def patch_items_schedule_item_id(
+  item_id: int,
+  schedule: ReminderItemSchedule,
+  storage: ReminderStorage = Depends(get_storage_for_api)
+) -> Response:
+  """Sets or clears a reminder item's due time, reminder time and recurrence rule."""
+
+  storage.update_item_schedule(item_id, schedule.due_at, schedule.remind_at, schedule.recurrence)
+  reminder_item = storage.get_item(item_id)
+  reminder_scheduler.sync_item(storage.owner, reminder_item)
+  return model_response(reminder_item, ReminderItem)
+
+
+@router.patch(
+  path="/reminders/items/position/{item_id}",
+  summary="Move a reminder item within its list",
+  response_model=ReminderItem
+)
+async def patch_items_position_item_id(
+  item_id: int,
+  position: ItemPosition,
+  storage: ReminderStorage = Depends(get_storage_for_api)
+) -> Response:
+  """
+  Moves a reminder item to just after another item in the same list,
+  or to the top of the list when after_id is null.
+  Only the moved item's rank changes.
+  """
+
+  storage.move_item(item_id, position.after_id)
+  return model_response(storage.get_item(item_id), ReminderItem)
 
 
 @router.patch(
@@ -190,11 +383,19 @@ async def patch_items_item_id(
 async def patch_items_strike_item_id(
   item_id: int,
   storage: ReminderStorage = Depends(get_storage_for_api)
-) -> ReminderItem:
-  """Toggles the completed status of a reminder item."""
+) -> Response:
+  """
+  Toggles the completed status of a reminder item.
+  Completing a recurring item also adds its next occurrence to the list.
+  """
   
-  storage.strike_item(item_id)
-  return storage.get_item(item_id)
+  next_item_id = storage.strike_item(item_id)
+  if next_item_id is not None:
+    reminder_scheduler.sync_item(storage.owner, storage.get_item(next_item_id))
+
+  reminder_item = storage.get_item(item_id)
+  reminder_scheduler.sync_item(storage.owner, reminder_item)
+  return model_response(reminder_item, ReminderItem)
 
 
 @router.delete(
@@ -209,9 +410,41 @@ async def delete_items_item_id(
   """Deletes a reminder item by ID."""
 
   storage.delete_item(item_id)
+  reminder_scheduler.cancel(item_id)
   return dict()
 
 
+# --------------------------------------------------------------------------------
+# Routes for reminder notifications
+# --------------------------------------------------------------------------------
+
+async def _reminder_events(owner: str) -> AsyncIterator[str]:
+  queue = sse_notifier.subscribe(owner)
+  try:
+    while True:
+      try:
+        event = await asyncio.wait_for(queue.get(), timeout=15)
+        yield f"event: reminder\ndata: {json.dumps(event)}\n\n"
+      except asyncio.TimeoutError:
+        # Comments keep proxies from closing an idle stream
+        yield ": keep-alive\n\n"
+  finally:
+    sse_notifier.unsubscribe(owner, queue)
+
+
+@router.get(
+  path="/notifications",
+  summary="Stream the user's reminders as server-sent events",
+  response_class=StreamingResponse
+)
+async def get_notifications(
+  username: str = Depends(get_username_for_api)
+) -> StreamingResponse:
+  """Streams a "reminder" event each time one of the user's reminders comes due."""
+
+  return StreamingResponse(_reminder_events(username), media_type="text/event-stream")
+
+
 # --------------------------------------------------------------------------------
 # Routes for selected lists
 # --------------------------------------------------------------------------------
@@ -223,11 +456,11 @@ async def delete_items_item_id(
 )
 async def get_selected(
   storage: ReminderStorage = Depends(get_storage_for_api)
-) -> SelectedListId:
+) -> Response:
   """Gets the selected reminder list."""
 
   list_id = storage.get_selected_list_id()
-  return SelectedListId(list_id=list_id)
+  return model_response(SelectedListId(list_id=list_id), SelectedListId)
 
 
 @router.post(
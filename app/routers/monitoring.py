@@ -0,0 +1,149 @@
+"""
+This module provides routes for monitoring the app.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import asyncio
+
+from app import db_path
+from app.utils.admin import require_admin_token
+from app.utils.health import readiness
+from app.utils.loop_monitor import loop_monitor
+from app.utils.metrics import CONTENT_TYPE, registry
+from app.utils.profiling import profile_store, require_profile_token
+from app.utils.snapshots import create_snapshot_in_subprocess, snapshot_store
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import FileResponse, JSONResponse, Response
+from typing import Dict, List
+
+
+# --------------------------------------------------------------------------------
+# Router
+# --------------------------------------------------------------------------------
+
+router = APIRouter(tags=["Monitoring"])
+
+
+# --------------------------------------------------------------------------------
+# Routes
+# --------------------------------------------------------------------------------
+
+@router.get(
+  path="/healthz",
+  summary="Liveness probe",
+  response_model=Dict
+)
+async def get_healthz() -> Dict:
+  """Reports that the process is up and serving requests."""
+
+  return {'status': 'ok'}
+
+
+@router.get(
+  path="/readyz",
+  summary="Readiness probe with a timed storage read",
+  response_model=Dict
+)
+async def get_readyz():
+  """Reports whether warmup has finished and storage answers quickly; 503 when not ready."""
+
+  result = await readiness.check()
+  status_code = 200 if result['status'] == 'ready' else 503
+  return JSONResponse(result, status_code=status_code)
+
+
+@router.get(
+  path="/metrics",
+  summary="Gets app metrics in the Prometheus text format",
+  response_class=Response
+)
+async def get_metrics():
+  """Exposes request, storage, database and cache metrics for Prometheus scraping."""
+
+  return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
+@router.get(
+  path="/profiles",
+  summary="Lists stored request profiles, newest first",
+  response_model=List[str],
+  dependencies=[Depends(require_profile_token)]
+)
+async def get_profiles() -> List[str]:
+  """Lists the IDs of stored request profiles. Requires a profile token."""
+
+  return profile_store.list()
+
+
+@router.get(
+  path="/profiles/{profile_id}",
+  summary="Downloads a stored request profile",
+  response_class=FileResponse,
+  dependencies=[Depends(require_profile_token)]
+)
+async def get_profile(profile_id: str):
+  """Downloads a request profile in the speedscope format. Requires a profile token."""
+
+  path = profile_store.path(profile_id)
+  return FileResponse(path, media_type="application/json", filename=f"{profile_id}.speedscope.json")
+
+
+@router.get(
+  path="/loop-stalls",
+  summary="Lists recent event loop stalls with the blocking stack and route",
+  response_model=List[Dict],
+  dependencies=[Depends(require_profile_token)]
+)
+async def get_loop_stalls() -> List[Dict]:
+  """Lists recent event loop stalls, oldest first. Requires a profile token."""
+
+  return loop_monitor.recent_stalls()
+
+
+@router.get(
+  path="/snapshots",
+  summary="Lists database snapshots, oldest first",
+  response_model=List[Dict],
+  dependencies=[Depends(require_admin_token)]
+)
+async def get_snapshots() -> List[Dict]:
+  """Lists full and incremental database snapshots. Requires an admin token."""
+
+  return snapshot_store.list()
+
+
+@router.post(
+  path="/snapshots",
+  summary="Takes a point-in-time database snapshot",
+  response_model=Dict,
+  dependencies=[Depends(require_admin_token)]
+)
+async def post_snapshots(incremental: bool = False) -> Dict:
+  """
+  Takes a consistent snapshot of the database without pausing writes.
+  Incremental snapshots store only the changes since the previous snapshot.
+  Requires an admin token.
+  """
+
+  return await create_snapshot_in_subprocess(incremental)
+
+
+@router.post(
+  path="/snapshots/{snapshot_id}/restore",
+  summary="Replaces the database with a snapshot",
+  response_model=Dict,
+  dependencies=[Depends(require_admin_token)]
+)
+async def post_snapshots_restore(snapshot_id: str) -> Dict:
+  """
+  Replaces the database with a snapshot, as one commit of this server,
+  so commits it has staged but not flushed cannot overwrite the restored data.
+  Requires an admin token.
+  """
+
+  await asyncio.to_thread(snapshot_store.restore, snapshot_id, db_path)
+  return {'restored': snapshot_id}
@@ -8,10 +8,13 @@ This module provides routes for the reminders pages.
 
 from app import templates
 from app.utils.auth import get_storage_for_page
-from app.utils.storage import ReminderStorage
+from app.utils.profiling import to_thread
+from app.utils.scheduler import reminder_scheduler
+from app.utils.storage import ReminderItem, ReminderStorage
 
 from fastapi import APIRouter, Depends, Form, Request
 from fastapi.responses import HTMLResponse
+from typing import List, Literal, Optional
 
 
 # --------------------------------------------------------------------------------
@@ -33,7 +36,8 @@ def _build_full_page_context(request: Request, storage: ReminderStorage):
     'request': request,
     'owner': storage.owner,
     'reminder_lists': reminder_lists,
-    'selected_list': selected_list}
+    'selected_list': selected_list,
+    'selected_list_id': selected_list.id if selected_list else None}
 
 
 def _get_reminders_grid(request: Request, storage: ReminderStorage):
@@ -41,6 +45,18 @@ def _get_reminders_grid(request: Request, storage: ReminderStorage):
   return templates.TemplateResponse("partials/reminders/content.html", context)
 
 
+def _get_item_rows(request: Request, storage: ReminderStorage, reminder_items: List[ReminderItem], list_id: int):
+  # The list's row rides along out of band, so its item counts stay current.
+  # Its stored counts and the selected ID are all the row needs, so no list's items are read.
+  reminder_list = storage.get_list(list_id)
+  context = {
+    'request': request,
+    'reminder_items': reminder_items,
+    'reminder_list': reminder_list,
+    'selected_list_id': storage.get_selected_list_id()}
+  return templates.TemplateResponse("partials/reminders/item-rows.html", context)
+
+
 # --------------------------------------------------------------------------------
 # Routes
 # --------------------------------------------------------------------------------
@@ -55,7 +71,8 @@ async def get_reminders(
   request: Request,
   storage: ReminderStorage = Depends(get_storage_for_page)
 ):
-  context = _build_full_page_context(request, storage)
+  # Off the loop, so concurrent identical reads can overlap and share one single-flight read
+  context = await to_thread(_build_full_page_context, request, storage)
   return templates.TemplateResponse("pages/reminders.html", context)
 
 
@@ -75,8 +92,8 @@ async def get_reminders_list_row(
   storage: ReminderStorage = Depends(get_storage_for_page)
 ):
   reminder_list = storage.get_list(list_id)
-  selected_list = storage.get_selected_list()
-  context = {'request': request, 'reminder_list': reminder_list, 'selected_list': selected_list}
+  selected_list_id = storage.get_selected_list_id()
+  context = {'request': request, 'reminder_list': reminder_list, 'selected_list_id': selected_list_id}
   return templates.TemplateResponse("partials/reminders/list-row.html", context)
 
 
@@ -125,8 +142,8 @@ async def get_reminders_list_row_edit(
   storage: ReminderStorage = Depends(get_storage_for_page)
 ):
   reminder_list = storage.get_list(list_id)
-  selected_list = storage.get_selected_list()
-  context = {'request': request, 'reminder_list': reminder_list, 'selected_list': selected_list}
+  selected_list_id = storage.get_selected_list_id()
+  context = {'request': request, 'reminder_list': reminder_list, 'selected_list_id': selected_list_id}
   return templates.TemplateResponse("partials/reminders/list-row-edit.html", context)
 
 
@@ -217,10 +234,13 @@ async def get_reminders_item_row(
 )
 async def delete_reminders_item_row(
   item_id: int,
+  request: Request,
   storage: ReminderStorage = Depends(get_storage_for_page)
 ):
+  list_id = storage.get_item(item_id).list_id
   storage.delete_item(item_id)
-  return ""
+  reminder_scheduler.cancel(item_id)
+  return _get_item_rows(request, storage, [], list_id)
 
 
 @router.patch(
@@ -252,7 +272,32 @@ async def patch_reminders_item_row_strike(
   request: Request,
   storage: ReminderStorage = Depends(get_storage_for_page)
 ):
-  storage.strike_item(item_id)
+  next_item_id = storage.strike_item(item_id)
+  reminder_item = storage.get_item(item_id)
+  reminder_scheduler.sync_item(storage.owner, reminder_item)
+
+  if next_item_id is None:
+    return _get_item_rows(request, storage, [reminder_item], reminder_item.list_id)
+
+  # The next occurrence of a recurring item goes in right after the completed row
+  next_item = storage.get_item(next_item_id)
+  reminder_scheduler.sync_item(storage.owner, next_item)
+  return _get_item_rows(request, storage, [reminder_item, next_item], reminder_item.list_id)
+
+
+@router.patch(
+  path="/item-row-position/{item_id}",
+  summary="Partial: Moves a reminder item row to just after another row, or to the top",
+  tags=["HTMX Partials"],
+  response_class=HTMLResponse
+)
+async def patch_reminders_item_row_position(
+  item_id: int,
+  request: Request,
+  storage: ReminderStorage = Depends(get_storage_for_page),
+  after_id: Optional[int] = Form(None)
+):
+  storage.move_item(item_id, after_id)
   reminder_item = storage.get_item(item_id)
   context = {'request': request, 'reminder_item': reminder_item}
   return templates.TemplateResponse("partials/reminders/item-row.html", context)
@@ -316,3 +361,76 @@ async def get_reminders_new_item_row_edit(
 ):
   context = {'request': request}
   return templates.TemplateResponse("partials/reminders/new-item-row-edit.html", context)
+
+
+# --------------------------------------------------------------------------------
+# Routes for bulk item actions
+# --------------------------------------------------------------------------------
+
+@router.post(
+  path="/items-complete-all",
+  summary="Partial: Marks every item in the selected list as completed",
+  tags=["HTMX Partials"],
+  response_class=HTMLResponse
+)
+async def post_reminders_items_complete_all(
+  request: Request,
+  storage: ReminderStorage = Depends(get_storage_for_page)
+):
+  # With no list selected there is nothing to change, and the grid stays as it is
+  list_id = storage.get_selected_list_id()
+  if list_id is not None:
+    result = storage.set_list_completed(list_id, True)
+    reminder_scheduler.sync_bulk(storage.owner, result)
+  return _get_reminders_grid(request, storage)
+
+
+@router.post(
+  path="/items-incomplete-all",
+  summary="Partial: Marks every item in the selected list as not completed",
+  tags=["HTMX Partials"],
+  response_class=HTMLResponse
+)
+async def post_reminders_items_incomplete_all(
+  request: Request,
+  storage: ReminderStorage = Depends(get_storage_for_page)
+):
+  list_id = storage.get_selected_list_id()
+  if list_id is not None:
+    result = storage.set_list_completed(list_id, False)
+    reminder_scheduler.sync_bulk(storage.owner, result)
+  return _get_reminders_grid(request, storage)
+
+
+@router.delete(
+  path="/items-completed",
+  summary="Partial: Deletes every completed item in the selected list",
+  tags=["HTMX Partials"],
+  response_class=HTMLResponse
+)
+async def delete_reminders_items_completed(
+  request: Request,
+  storage: ReminderStorage = Depends(get_storage_for_page)
+):
+  list_id = storage.get_selected_list_id()
+  if list_id is not None:
+    result = storage.delete_completed_items(list_id)
+    reminder_scheduler.sync_bulk(storage.owner, result)
+  return _get_reminders_grid(request, storage)
+
+
+@router.post(
+  path="/items-bulk",
+  summary="Partial: Completes, uncompletes or deletes the checked items",
+  tags=["HTMX Partials"],
+  response_class=HTMLResponse
+)
+async def post_reminders_items_bulk(
+  request: Request,
+  storage: ReminderStorage = Depends(get_storage_for_page),
+  action: Literal['complete', 'incomplete', 'delete'] = Form(),
+  item_ids: List[int] = Form(default=[])
+):
+  result = storage.update_items(item_ids, action)
+  reminder_scheduler.sync_bulk(storage.owner, result)
+  return _get_reminders_grid(request, storage)
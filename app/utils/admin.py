@@ -0,0 +1,76 @@
+"""
+This module provides admin tokens for destructive operations, such as restoring a snapshot.
+
+Admin tokens are signed with a key derived from the app secret with a salt of their own,
+so a profile token, or any other token signed with the secret itself, is never accepted as one.
+Send them in the X-Catty-Admin header.
+
+Mint a token with:
+
+  python -m app.utils.admin token --ttl 600
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import hashlib
+import hmac
+import time
+import jwt
+
+from app import secret_key
+from app.utils.exceptions import UnauthorizedException
+from fastapi import Header
+from typing import Optional
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+admin_header_name = "X-Catty-Admin"
+
+_admin_salt = b"catty-admin-token"
+_admin_key = hmac.new(str(secret_key).encode("utf-8"), _admin_salt, hashlib.sha256).hexdigest()
+
+
+# --------------------------------------------------------------------------------
+# Tokens
+# --------------------------------------------------------------------------------
+
+def serialize_admin_token(ttl_seconds: int = 600) -> str:
+  claims = {"scope": "admin", "exp": int(time.time()) + ttl_seconds}
+  return jwt.encode(claims, _admin_key, algorithm="HS256")
+
+
+def is_valid_admin_token(token: Optional[str]) -> bool:
+  if not token:
+    return False
+
+  try:
+    data = jwt.decode(token, _admin_key, algorithms=["HS256"])
+    return data.get("scope") == "admin"
+  except:
+    return False
+
+
+def require_admin_token(x_catty_admin: Optional[str] = Header(default=None)) -> None:
+  if not is_valid_admin_token(x_catty_admin):
+    raise UnauthorizedException()
+
+
+# --------------------------------------------------------------------------------
+# Command Line
+# --------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Catty admin tools")
+  subparsers = parser.add_subparsers(dest="command", required=True)
+  token_parser = subparsers.add_parser("token", help="Print a signed admin token")
+  token_parser.add_argument("--ttl", type=int, default=600, help="Token lifetime in seconds")
+  args = parser.parse_args()
+
+  if args.command == "token":
+    print(serialize_admin_token(args.ttl))
@@ -0,0 +1,251 @@
+"""
+This module builds and serves fingerprinted, precompressed static assets.
+
+The build step copies every asset under static/ into static/dist/
+with a content hash in its filename, converts TTF fonts to WOFF2,
+rewrites url() references in CSS to the hashed names,
+and writes gzip and brotli variants next to each compressible file.
+Templates call static_url() to get the hashed URL from the build manifest.
+
+Build the assets with:
+
+  python -m app.utils.assets build
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+import shutil
+import stat
+
+import anyio
+
+from app.utils.compression import choose_encoding
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from typing import Dict, List, Optional, Tuple
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+try:
+  from fontTools.ttLib import TTFont
+except ImportError:
+  TTFont = None
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+STATIC_DIR = 'static'
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# README screenshots are only used on GitHub, so they are not served to the app
+EXCLUDED_DIRS = {DIST_DIR, os.path.join('img', 'readme')}
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.ico', '.json', '.ttf', '.txt', '.html'}
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# Precompressed variants written by build(), by content encoding
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+CSS_URL_PATTERN = re.compile(r'''url\((['"]?)/static/([^'")]+)\1\)''')
+
+
+# --------------------------------------------------------------------------------
+# Build
+# --------------------------------------------------------------------------------
+
+def _fingerprint(relative_path: str, content: bytes) -> str:
+  digest = hashlib.sha256(content).hexdigest()[:12]
+  root, extension = os.path.splitext(relative_path)
+  return f'{root}.{digest}{extension}'
+
+
+def _to_woff2(content: bytes) -> Optional[bytes]:
+  if TTFont is None or brotli is None:
+    return None
+
+  font = TTFont(io.BytesIO(content))
+  font.flavor = 'woff2'
+  output = io.BytesIO()
+  font.save(output)
+  return output.getvalue()
+
+
+def _write_variants(path: str, content: bytes) -> None:
+  gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+  if len(gzipped) < len(content):
+    with open(path + '.gz', 'wb') as gz_file:
+      gz_file.write(gzipped)
+
+  if brotli is not None:
+    brotlied = brotli.compress(content, quality=11)
+    if len(brotlied) < len(content):
+      with open(path + '.br', 'wb') as br_file:
+        br_file.write(brotlied)
+
+
+def _source_files(source_dir: str) -> List[str]:
+  relative_paths = []
+  for root, dirs, files in os.walk(source_dir):
+    relative_root = os.path.relpath(root, source_dir)
+    dirs[:] = [d for d in dirs if os.path.normpath(os.path.join(relative_root, d)) not in EXCLUDED_DIRS]
+    for name in files:
+      relative_paths.append(os.path.normpath(os.path.join(relative_root, name)).replace(os.sep, '/'))
+
+  # CSS goes last, so the files it references already have hashed names
+  relative_paths.sort(key=lambda path: (path.endswith('.css'), path))
+  return relative_paths
+
+
+def build(source_dir: str = STATIC_DIR, clean: bool = False) -> Dict[str, str]:
+  # Old hashed files are kept by default, so pages rendered by a draining old version still load
+  dist_dir = os.path.join(source_dir, DIST_DIR)
+  if clean:
+    shutil.rmtree(dist_dir, ignore_errors=True)
+  os.makedirs(dist_dir, exist_ok=True)
+
+  manifest: Dict[str, str] = {}
+
+  def rewrite_css_url(match) -> str:
+    quote, path = match.group(1), match.group(2)
+    hashed = manifest.get(path)
+    return f'url({quote}/static/{DIST_DIR}/{hashed}{quote})' if hashed else match.group(0)
+
+  for relative_path in _source_files(source_dir):
+    with open(os.path.join(source_dir, relative_path), 'rb') as source_file:
+      content = source_file.read()
+
+    output_path = relative_path
+    if relative_path.endswith('.css'):
+      content = CSS_URL_PATTERN.sub(rewrite_css_url, content.decode('utf-8')).encode('utf-8')
+    elif relative_path.endswith('.ttf'):
+      woff2 = _to_woff2(content)
+      if woff2:
+        content = woff2
+        output_path = relative_path[:-len('.ttf')] + '.woff2'
+
+    hashed_path = _fingerprint(output_path, content)
+    manifest[relative_path] = hashed_path
+
+    full_path = os.path.join(dist_dir, hashed_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'wb') as output_file:
+      output_file.write(content)
+
+    if os.path.splitext(output_path)[1] in COMPRESSIBLE_EXTENSIONS:
+      _write_variants(full_path, content)
+
+  with open(os.path.join(dist_dir, MANIFEST_NAME), 'w') as manifest_file:
+    json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+  return manifest
+
+
+# --------------------------------------------------------------------------------
+# Template Helper
+# --------------------------------------------------------------------------------
+
+def _load_manifest(source_dir: str = STATIC_DIR) -> Dict[str, str]:
+  try:
+    with open(os.path.join(source_dir, DIST_DIR, MANIFEST_NAME)) as manifest_file:
+      return json.load(manifest_file)
+  except (OSError, ValueError):
+    return {}
+
+
+_manifest = _load_manifest()
+
+
+def static_url(path: str) -> str:
+  """Returns the fingerprinted URL for a static asset, or its plain URL before a build."""
+
+  hashed = _manifest.get(path)
+  return f'/static/{DIST_DIR}/{hashed}' if hashed else f'/static/{path}'
+
+
+# --------------------------------------------------------------------------------
+# Static Files
+# --------------------------------------------------------------------------------
+
+class PrecompressedStaticFiles(StaticFiles):
+  """
+  StaticFiles that serves .br or .gz variants when the client accepts them.
+  Fingerprinted files under dist/ never change, so they are cached forever;
+  everything else must be revalidated with its ETag.
+  """
+
+  def _accepted_encodings(self, scope) -> List[Tuple[str, str]]:
+    # Best first, so a file without the best variant falls back to the next one the client accepts
+    accept_encoding = Headers(scope=scope).get('accept-encoding', '')
+    remaining = list(PRECOMPRESSED_SUFFIXES)
+
+    encodings = []
+    while True:
+      encoding = choose_encoding(accept_encoding, remaining)
+      if encoding is None:
+        return encodings
+      encodings.append((encoding, PRECOMPRESSED_SUFFIXES[encoding]))
+      remaining.remove(encoding)
+
+
+  async def get_response(self, path: str, scope) -> Response:
+    response = None
+
+    for encoding, suffix in self._accepted_encodings(scope):
+      full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+      if stat_result and stat.S_ISREG(stat_result.st_mode):
+        response = self.file_response(full_path, stat_result, scope)
+        response.headers['content-encoding'] = encoding
+        content_type, _ = mimetypes.guess_type(path)
+        if content_type:
+          response.headers['content-type'] = content_type
+        break
+
+    if response is None:
+      response = await super().get_response(path, scope)
+
+    if response.status_code in (200, 304):
+      immutable = path.startswith(DIST_DIR + '/') or path.startswith(DIST_DIR + os.sep)
+      response.headers['cache-control'] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+      response.headers['vary'] = 'Accept-Encoding'
+
+    return response
+
+
+# --------------------------------------------------------------------------------
+# Command Line
+# --------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Catty static asset tools')
+  subparsers = parser.add_subparsers(dest='command', required=True)
+  build_parser = subparsers.add_parser('build', help='Fingerprint and precompress static assets')
+  build_parser.add_argument('--source', default=STATIC_DIR, help='Static asset directory')
+  build_parser.add_argument('--clean', action='store_true', help='Delete previously built assets first')
+  args = parser.parse_args()
+
+  if args.command == 'build':
+    built = build(args.source, args.clean)
+    print(f'Built {len(built)} assets into {os.path.join(args.source, DIST_DIR)}')
+    if brotli is None:
+      print('Warning: brotli is not installed, so no .br variants were written')
+    if TTFont is None:
+      print('Warning: fonttools is not installed, so fonts were not converted to WOFF2')
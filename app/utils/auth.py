@@ -12,6 +12,7 @@ import secrets
 from app import db_path, users, secret_key
 from app.utils.exceptions import UnauthorizedException, UnauthorizedPageException
 from app.utils.storage import ReminderStorage
+from app.utils.timing import phase
 
 from fastapi import Cookie, Depends, Form
 from fastapi.security import HTTPBasic
@@ -75,12 +76,13 @@ def get_auth_cookie(reminders_session: Optional[str] = Cookie(default=None)) ->
   cookie = None
 
   if reminders_session:
-    username = deserialize_token(reminders_session)
-    if username and username in users:
-      cookie = AuthCookie(
-        name=auth_cookie_name,
-        username=username,
-        token=reminders_session)
+    with phase('auth'):
+      username = deserialize_token(reminders_session)
+      if username and username in users:
+        cookie = AuthCookie(
+          name=auth_cookie_name,
+          username=username,
+          token=reminders_session)
   
   return cookie
 
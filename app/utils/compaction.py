@@ -0,0 +1,265 @@
+"""
+This module compacts the reminder database in the background.
+
+A compaction pass reads one version of the database file, builds a cleaned copy on the side,
+and swaps it in with an atomic rename, so writers are only held back for the swap itself.
+If a writer replaced the file while the copy was being built, the pass starts over on the new version.
+Under steady writes every attempt can lose that race, so after max_attempts the pass builds
+its copy with writers held back instead, which always finishes and only delays writes for one copy.
+
+A pass purges:
+
+  * items whose list no longer exists
+  * selected_lists rows that point at nothing (list_id None, a deleted list, or another owner's list),
+    plus duplicate rows for the same owner
+  * next_occurrence_id links to deleted items
+
+rebalances the item ranks of lists that have grown long ones (see app.utils.ranks),
+and rewrites the file without the slack left by earlier edits.
+
+Run one pass by hand with:
+
+  python -m app.utils.compaction
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+from app import config, db_path
+from app.utils.durability import committer_for, flush, write_json_atomically
+from app.utils.metrics import registry
+from app.utils.ranks import rebalance_items
+from app.utils.storage import ITEMS_TABLE, LISTS_TABLE, SELECTED_TABLE, file_version, working_set, write_lock
+from typing import Dict, Optional, Tuple
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+logger = logging.getLogger('catty.compaction')
+compaction_config = config.get('compaction', {})
+
+compaction_progress = registry.gauge(
+  'catty_compaction_progress_ratio',
+  'Progress of the running compaction pass, from 0 to 1 (1 when idle).')
+
+compaction_runs = registry.counter(
+  'catty_compaction_runs_total',
+  'Compaction passes by outcome (compacted, compacted_locked, or failed).',
+  ('outcome',))
+
+compaction_purged = registry.counter(
+  'catty_compaction_purged_documents_total',
+  'Documents removed by compaction, by table.',
+  ('table',))
+
+compaction_rebalanced = registry.counter(
+  'catty_compaction_rebalanced_lists_total',
+  'Reminder lists whose item ranks compaction respaced.')
+
+compaction_reclaimed = registry.counter(
+  'catty_compaction_reclaimed_bytes_total',
+  'Bytes the database file shrank by across all compaction passes.')
+
+compaction_last_reclaimed = registry.gauge(
+  'catty_compaction_last_reclaimed_bytes',
+  'Bytes the database file shrank by in the latest compaction pass.')
+
+compaction_duration = registry.gauge(
+  'catty_compaction_last_duration_seconds',
+  'How long the latest compaction pass took.')
+
+compaction_progress.set(1)
+
+
+# --------------------------------------------------------------------------------
+# Compaction
+# --------------------------------------------------------------------------------
+
+def compact_tables(tables: Dict[str, Dict[str, dict]], on_progress=None) -> Dict[str, int]:
+  """Purges orphaned and stale documents from the raw tables in place, and returns counts by table."""
+
+  lists = tables.get(LISTS_TABLE, {})
+  items = tables.get(ITEMS_TABLE, {})
+  selected = tables.get(SELECTED_TABLE, {})
+  total = max(1, len(items) + len(selected))
+  done = 0
+  purged = {ITEMS_TABLE: 0, SELECTED_TABLE: 0}
+
+  list_owners = {int(list_id): reminder_list['owner'] for list_id, reminder_list in lists.items()}
+
+  for item_id in list(items):
+    if items[item_id].get('list_id') not in list_owners:
+      del items[item_id]
+      purged[ITEMS_TABLE] += 1
+
+    done += 1
+    if on_progress and done % 1000 == 0:
+      on_progress(done / total)
+
+  for item in items.values():
+    if 'next_occurrence_id' in item and str(item['next_occurrence_id']) not in items:
+      del item['next_occurrence_id']
+
+  seen_owners = set()
+  for row_id in list(selected):
+    row = selected[row_id]
+    owner = row.get('owner')
+    if owner in seen_owners or list_owners.get(row.get('list_id')) != owner:
+      del selected[row_id]
+      purged[SELECTED_TABLE] += 1
+    else:
+      seen_owners.add(owner)
+
+    done += 1
+    if on_progress and done % 1000 == 0:
+      on_progress(done / total)
+
+  return purged
+
+
+class Compactor:
+
+  def __init__(self, db_path: str, interval: float = 3600.0, max_attempts: int = 3) -> None:
+    self.db_path = db_path
+    self.interval = interval
+    self.max_attempts = max_attempts
+    self.last_result: Optional[Dict] = None
+    self._task: Optional[asyncio.Task] = None
+
+
+  def compact(self) -> Dict:
+    """Runs one compaction pass and returns what it did."""
+
+    start = time.perf_counter()
+    compaction_progress.set(0)
+
+    try:
+      for attempt in range(1, self.max_attempts + 1):
+        flush(self.db_path)
+        version = file_version(self.db_path)
+        if version is None:
+          return self._finish('compacted', start, {}, 0)
+
+        # Build the compacted copy without holding the lock, so writers carry on meanwhile
+        content, tables, purged, rebalanced = self._build()
+
+        with write_lock, committer_for(self.db_path).writing():
+          # Commits staged meanwhile are not in the file yet, and must not be overwritten by it
+          flush(self.db_path)
+          if file_version(self.db_path) != version:
+            logger.info(f'Database changed during compaction attempt {attempt}, retrying')
+            continue
+
+          reclaimed = self._swap(content, tables)
+
+        return self._finish('compacted', start, purged, reclaimed, rebalanced)
+
+      # Writers kept winning the race, so this copy is built while they wait
+      logger.info(f'Database changed during all {self.max_attempts} compaction attempts, compacting under the write lock')
+      with write_lock, committer_for(self.db_path).writing():
+        flush(self.db_path)
+        if file_version(self.db_path) is None:
+          return self._finish('compacted', start, {}, 0)
+        content, tables, purged, rebalanced = self._build()
+        reclaimed = self._swap(content, tables)
+
+      return self._finish('compacted_locked', start, purged, reclaimed, rebalanced)
+
+    except Exception:
+      compaction_runs.inc(('failed',))
+      logger.exception('Compaction failed')
+      raise
+
+    finally:
+      compaction_progress.set(1)
+
+
+  def _build(self) -> Tuple[str, Dict[str, Dict[str, dict]], Dict[str, int], int]:
+    with open(self.db_path) as db_file:
+      content = db_file.read()
+    tables = json.loads(content) if content.strip() else {}
+    purged = compact_tables(tables, on_progress=lambda ratio: compaction_progress.set(ratio * 0.9))
+    rebalanced = rebalance_items(tables.get(ITEMS_TABLE, {}))
+    return content, tables, purged, rebalanced
+
+
+  def _swap(self, content: str, tables: Dict[str, Dict[str, dict]]) -> int:
+    # Called under write_lock, and returns the bytes reclaimed
+    write_json_atomically(self.db_path, tables)
+    working_set.invalidate(self.db_path)
+    return max(0, len(content.encode('utf-8')) - os.path.getsize(self.db_path))
+
+
+  def _finish(self, outcome: str, start: float, purged: Dict[str, int], reclaimed: int, rebalanced: int = 0) -> Dict:
+    elapsed = time.perf_counter() - start
+    compaction_runs.inc((outcome,))
+    compaction_duration.set(elapsed)
+    compaction_last_reclaimed.set(reclaimed)
+    compaction_reclaimed.inc(amount=reclaimed)
+    compaction_rebalanced.inc(amount=rebalanced)
+    for table, count in purged.items():
+      compaction_purged.inc((table,), count)
+
+    self.last_result = {
+      'outcome': outcome,
+      'purged': purged,
+      'reclaimed_bytes': reclaimed,
+      'rebalanced_lists': rebalanced,
+      'duration_seconds': round(elapsed, 3),
+      'finished_at': time.time(),
+    }
+    logger.info(f'Compaction {outcome}: purged {purged}, reclaimed {reclaimed} bytes in {elapsed:.3f} s')
+    return self.last_result
+
+
+  # Background Job
+
+  async def _run(self) -> None:
+    while True:
+      await asyncio.sleep(self.interval)
+      try:
+        await asyncio.to_thread(self.compact)
+      except Exception:
+        pass
+
+
+  def start(self) -> None:
+    self._task = asyncio.get_running_loop().create_task(self._run())
+
+
+  async def stop(self) -> None:
+    if self._task:
+      self._task.cancel()
+      try:
+        await self._task
+      except asyncio.CancelledError:
+        pass
+
+
+# --------------------------------------------------------------------------------
+# Shared Compactor
+# --------------------------------------------------------------------------------
+
+compactor = Compactor(db_path, interval=compaction_config.get('interval_minutes', 60) * 60)
+
+
+# --------------------------------------------------------------------------------
+# Command Line
+# --------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Compact the Catty reminder database')
+  parser.add_argument('--db', default=db_path, help='Database file to compact')
+  args = parser.parse_args()
+
+  print(json.dumps(Compactor(args.db).compact(), indent=2))
@@ -0,0 +1,257 @@
+"""
+This module provides content-negotiated response compression.
+
+Responses are compressed with zstd, brotli or gzip, whichever the client prefers
+among the codecs installed here. Levels are tuned for latency rather than ratio,
+small bodies are sent as-is, and streaming responses are compressed chunk by chunk
+with a flush after each chunk, so nothing is held back from the client.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from typing import Dict, List, Optional
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+COMPRESSIBLE_TYPES = (
+  'text/',
+  'application/json',
+  'application/javascript',
+  'application/xml',
+  'image/svg+xml',
+)
+
+# When the client rates codecs equally, prefer the one that is fastest for its ratio
+SERVER_PREFERENCE = ('zstd', 'br', 'gzip')
+
+
+# --------------------------------------------------------------------------------
+# Compressors
+# --------------------------------------------------------------------------------
+
+class GzipCompressor:
+
+  def __init__(self, level: int) -> None:
+    self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+  def compress(self, data: bytes) -> bytes:
+    return self._compressor.compress(data)
+
+
+  def flush(self) -> bytes:
+    return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+  def finish(self) -> bytes:
+    return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+
+  def __init__(self, quality: int) -> None:
+    self._compressor = brotli.Compressor(quality=quality)
+
+
+  def compress(self, data: bytes) -> bytes:
+    return self._compressor.process(data)
+
+
+  def flush(self) -> bytes:
+    return self._compressor.flush()
+
+
+  def finish(self) -> bytes:
+    return self._compressor.finish()
+
+
+class ZstdCompressor:
+
+  def __init__(self, level: int) -> None:
+    self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+
+  def compress(self, data: bytes) -> bytes:
+    return self._compressor.compress(data)
+
+
+  def flush(self) -> bytes:
+    return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+
+  def finish(self) -> bytes:
+    return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encodings() -> List[str]:
+  encodings = []
+  if zstandard is not None:
+    encodings.append('zstd')
+  if brotli is not None:
+    encodings.append('br')
+  encodings.append('gzip')
+  return encodings
+
+
+def make_compressor(encoding: str, levels: Dict[str, int]):
+  if encoding == 'zstd':
+    return ZstdCompressor(levels['zstd'])
+  elif encoding == 'br':
+    return BrotliCompressor(levels['br'])
+  else:
+    return GzipCompressor(levels['gzip'])
+
+
+# --------------------------------------------------------------------------------
+# Negotiation
+# --------------------------------------------------------------------------------
+
+def choose_encoding(accept_encoding: str, supported: List[str]) -> Optional[str]:
+  """Picks the best supported encoding from an Accept-Encoding header, or None for identity."""
+
+  qualities = {}
+  for part in accept_encoding.split(','):
+    token, _, params = part.strip().partition(';')
+    token = token.strip().lower()
+    if not token:
+      continue
+
+    quality = 1.0
+    params = params.strip()
+    if params.startswith('q='):
+      try:
+        quality = float(params[2:])
+      except ValueError:
+        quality = 0.0
+    qualities[token] = quality
+
+  wildcard = qualities.get('*', 0.0)
+  candidates = [
+    (qualities.get(encoding, wildcard), -SERVER_PREFERENCE.index(encoding), encoding)
+    for encoding in supported]
+  candidates = [candidate for candidate in candidates if candidate[0] > 0]
+
+  return max(candidates)[2] if candidates else None
+
+
+# --------------------------------------------------------------------------------
+# Middleware
+# --------------------------------------------------------------------------------
+
+class CompressionMiddleware:
+
+  def __init__(
+    self,
+    app,
+    minimum_size: int = 1024,
+    gzip_level: int = 5,
+    brotli_quality: int = 4,
+    zstd_level: int = 3
+  ) -> None:
+    self.app = app
+    self.minimum_size = minimum_size
+    self.levels = {'gzip': gzip_level, 'br': brotli_quality, 'zstd': zstd_level}
+    self.supported = available_encodings()
+
+
+  async def __call__(self, scope, receive, send) -> None:
+    if scope['type'] != 'http':
+      await self.app(scope, receive, send)
+      return
+
+    accept_encoding = Headers(scope=scope).get('accept-encoding', '')
+    encoding = choose_encoding(accept_encoding, self.supported) if accept_encoding else None
+    if encoding is None:
+      await self.app(scope, receive, send)
+      return
+
+    responder = _CompressionResponder(send, encoding, self.levels, self.minimum_size)
+    await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+
+  def __init__(self, send, encoding: str, levels: Dict[str, int], minimum_size: int) -> None:
+    self._send = send
+    self.encoding = encoding
+    self.levels = levels
+    self.minimum_size = minimum_size
+    self.start_message = None
+    self.compressor = None
+    self.passthrough = False
+
+
+  def _should_compress(self, headers: MutableHeaders) -> bool:
+    if self.start_message['status'] in (204, 206, 304):
+      return False
+    if 'content-encoding' in headers:
+      return False
+    content_type = headers.get('content-type', '')
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+  async def send(self, message) -> None:
+    message_type = message['type']
+
+    if message_type == 'http.response.start':
+      # Hold the headers back until the first body chunk shows how big the response is
+      self.start_message = message
+      return
+    elif message_type != 'http.response.body' or self.passthrough:
+      await self._send(message)
+      return
+
+    body = message.get('body', b'')
+    more_body = message.get('more_body', False)
+
+    if self.compressor is None:
+      headers = MutableHeaders(raw=list(self.start_message['headers']))
+      self.start_message['headers'] = headers.raw
+
+      if not self._should_compress(headers) or (not more_body and len(body) < self.minimum_size):
+        if headers.get('content-type', '').startswith(COMPRESSIBLE_TYPES):
+          headers.add_vary_header('Accept-Encoding')
+        self.passthrough = True
+        await self._send(self.start_message)
+        await self._send(message)
+        return
+
+      self.compressor = make_compressor(self.encoding, self.levels)
+      headers['content-encoding'] = self.encoding
+      headers.add_vary_header('Accept-Encoding')
+
+      if not more_body:
+        compressed = self.compressor.compress(body) + self.compressor.finish()
+        headers['content-length'] = str(len(compressed))
+        await self._send(self.start_message)
+        await self._send({'type': 'http.response.body', 'body': compressed})
+        return
+
+      # Streaming: the final size is unknown, so fall back to chunked transfer
+      del headers['content-length']
+      await self._send(self.start_message)
+
+    if more_body:
+      chunk = self.compressor.compress(body) + self.compressor.flush()
+    else:
+      chunk = self.compressor.compress(body) + self.compressor.finish()
+
+    await self._send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
@@ -0,0 +1,106 @@
+"""
+This module verifies and repairs the denormalized item counters on reminder lists.
+
+Each list stores item_count and completed_count, which storage keeps current
+in the same write as every item change, so rendering a list never scans its items.
+Lists created before the counters existed have none; storage leaves those alone,
+and a repair pass (run at startup and by hand) fills them in.
+
+  python -m app.utils.counters verify
+  python -m app.utils.counters repair
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import json
+import sys
+
+from app import db_path
+from app.utils.storage import ITEMS_TABLE, LISTS_TABLE, AtomicJSONStorage, working_set, write_lock
+from typing import Dict, List, Tuple
+
+
+# --------------------------------------------------------------------------------
+# Counting
+# --------------------------------------------------------------------------------
+
+def count_items(tables: Dict[str, Dict[str, dict]]) -> Dict[str, Tuple[int, int]]:
+  """Counts (items, completed items) per list ID with one pass over the items table."""
+
+  counts = {list_id: [0, 0] for list_id in tables.get(LISTS_TABLE, {})}
+  for item in tables.get(ITEMS_TABLE, {}).values():
+    list_counts = counts.get(str(item['list_id']))
+    if list_counts is not None:
+      list_counts[0] += 1
+      list_counts[1] += int(item['completed'])
+  return {list_id: tuple(list_counts) for list_id, list_counts in counts.items()}
+
+
+def find_drift(tables: Dict[str, Dict[str, dict]]) -> List[Dict]:
+  """Lists every list whose stored counters are missing or disagree with its items."""
+
+  drift = []
+  lists = tables.get(LISTS_TABLE, {})
+  for list_id, (item_count, completed_count) in count_items(tables).items():
+    stored = lists[list_id]
+    if stored.get('item_count') != item_count or stored.get('completed_count') != completed_count:
+      drift.append({
+        'list_id': int(list_id),
+        'stored': [stored.get('item_count'), stored.get('completed_count')],
+        'actual': [item_count, completed_count],
+      })
+  return drift
+
+
+def repair_tables(tables: Dict[str, Dict[str, dict]]) -> List[Dict]:
+  drift = find_drift(tables)
+  lists = tables.get(LISTS_TABLE, {})
+  for entry in drift:
+    item_count, completed_count = entry['actual']
+    lists[str(entry['list_id'])].update(item_count=item_count, completed_count=completed_count)
+  return drift
+
+
+# --------------------------------------------------------------------------------
+# Database Passes
+# --------------------------------------------------------------------------------
+
+def verify(path: str) -> List[Dict]:
+  tables = AtomicJSONStorage(path).read() or {}
+  return find_drift(tables)
+
+
+def repair(path: str) -> List[Dict]:
+  """Rebuilds drifted counters in one write, and returns what was fixed."""
+
+  storage = AtomicJSONStorage(path)
+  with write_lock, storage.committer.writing():
+    tables = storage.read() or {}
+    drift = repair_tables(tables)
+
+    # A clean database is left untouched, so starting the app does not rewrite the file
+    if drift:
+      storage.write(tables)
+      working_set.invalidate(path)
+
+  storage.sync()
+  return drift
+
+
+# --------------------------------------------------------------------------------
+# Command Line
+# --------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Verify or repair the Catty list item counters')
+  parser.add_argument('command', choices=['verify', 'repair'])
+  parser.add_argument('--db', default=db_path, help='Database file to check')
+  args = parser.parse_args()
+
+  drift = verify(args.db) if args.command == 'verify' else repair(args.db)
+  print(json.dumps(drift, indent=2))
+  if args.command == 'verify' and drift:
+    sys.exit(1)
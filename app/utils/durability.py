@@ -0,0 +1,397 @@
+"""
+This module decides when committed writes reach the disk.
+
+Every commit produces a complete new version of the database,
+and the durability mode in config.json decides how versions become durable:
+
+  strict    Each commit is written and fsynced before it is acknowledged.
+            A crash loses nothing that was acknowledged.
+
+  group     Commits are staged in memory, and the first committer to wait becomes the leader:
+            it sleeps for group_window_ms, then writes and fsyncs the latest version once,
+            acknowledging every commit staged so far together.
+            A crash loses nothing that was acknowledged,
+            but each commit waits up to group_window_ms longer.
+
+  relaxed   Commits are acknowledged as soon as they are staged,
+            and a timer writes the latest version every flush_interval_seconds.
+            A crash loses up to flush_interval_seconds of acknowledged commits.
+
+Staged versions are visible to readers in this process straight away.
+Anything that reads or replaces the database file directly must flush() it first.
+
+Request handlers commit on the event loop thread, where waiting for a group would stop the loop,
+and with it every other commit that could join the group.
+So inside a request, DurabilityMiddleware takes over the wait: it waits in a worker thread
+once the handler is done and before the response starts, so the response still means durable.
+
+More than one process can share the database file, as the old and new versions do during a rolling deploy.
+A process takes an exclusive lock on the database's .lock file before it reads for a write,
+and keeps it until its staged commits are on disk, so the other process never writes
+on top of a version it has not read. While one process holds staged commits,
+the other's writers wait up to group_window_ms (group) or flush_interval_seconds (relaxed).
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import asyncio
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+from app import config
+from app.utils.metrics import registry
+from app.utils.profiling import to_thread
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+durability_config = config.get('durability', {})
+
+MODES = ('strict', 'group', 'relaxed')
+
+# Called with the database path after each flush replaces the file
+flush_listeners: List[Callable[[str], None]] = []
+
+# The latest generation each committer must make durable before the current request responds
+_deferred_waits: ContextVar[Optional[Dict['Committer', int]]] = ContextVar('catty_deferred_waits', default=None)
+
+storage_flushes = registry.counter(
+  'catty_storage_flushes_total',
+  'Database versions written and fsynced, by durability mode.',
+  ('mode',))
+
+commits_per_flush = registry.histogram(
+  'catty_storage_commits_per_flush',
+  'Commits made durable by each flush, by durability mode.',
+  ('mode',),
+  buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+
+# --------------------------------------------------------------------------------
+# Atomic Files
+# --------------------------------------------------------------------------------
+
+def _fsync_directory(directory: str) -> None:
+  # The rename lives in the directory, so it is only durable once the directory is synced too
+  if not hasattr(os, 'O_DIRECTORY'):
+    return
+  handle = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+  try:
+    os.fsync(handle)
+  finally:
+    os.close(handle)
+
+
+def write_text_atomically(path: str, text: str) -> None:
+  directory = os.path.dirname(os.path.abspath(path))
+  handle, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=directory)
+  try:
+    with os.fdopen(handle, 'w') as temp_file:
+      temp_file.write(text)
+      temp_file.flush()
+      os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+  except BaseException:
+    if os.path.exists(temp_path):
+      os.remove(temp_path)
+    raise
+  _fsync_directory(directory)
+
+
+def write_json_atomically(path: str, data: Dict[str, Any]) -> None:
+  write_text_atomically(path, json.dumps(data))
+
+
+# --------------------------------------------------------------------------------
+# File Locks
+# --------------------------------------------------------------------------------
+
+class FileLock:
+  """An exclusive lock shared by every process that opens the same path, where the platform has flock()."""
+
+  def __init__(self, path: str) -> None:
+    self.path = path
+    self.held = False
+    self._file = None
+
+
+  def acquire(self, blocking: bool = True) -> bool:
+    if self.held:
+      return True
+
+    if fcntl is not None:
+      lock_file = open(self.path, 'a')
+      try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+      except BlockingIOError:
+        lock_file.close()
+        return False
+      self._file = lock_file
+
+    self.held = True
+    return True
+
+
+  def release(self) -> None:
+    if not self.held:
+      return
+
+    if self._file is not None:
+      fcntl.flock(self._file, fcntl.LOCK_UN)
+      self._file.close()
+      self._file = None
+    self.held = False
+
+
+# --------------------------------------------------------------------------------
+# Committer Class
+# --------------------------------------------------------------------------------
+
+class Committer:
+  """Makes the committed versions of one database file durable according to a mode."""
+
+  def __init__(
+    self,
+    path: str,
+    mode: str = 'strict',
+    group_window: float = 0.005,
+    flush_interval: float = 1.0
+  ) -> None:
+    if mode not in MODES:
+      raise ValueError(f'Durability mode must be one of {", ".join(MODES)}')
+
+    self.path = path
+    self.mode = mode
+    self.group_window = group_window
+    self.flush_interval = flush_interval
+
+    # Commits are numbered, and everything up to durable_generation is on disk
+    self.generation = 0
+    self.durable_generation = 0
+    self._pending: Optional[str] = None
+    self._leader = False
+    self._timer: Optional[threading.Timer] = None
+    self._condition = threading.Condition()
+    self._flush_lock = threading.Lock()
+
+    # Held from the first read of a write until this process has nothing staged
+    self._file_lock = FileLock(path + '.lock')
+    self._writers = 0
+
+
+  # Committing
+
+  @contextmanager
+  def writing(self) -> Iterator[None]:
+    """Wraps a read-modify-write, so no other process writes the file until this one's commit is on disk."""
+
+    with self._condition:
+      self._writers += 1
+      try:
+        self._file_lock.acquire()
+      except BaseException:
+        self._writers -= 1
+        raise
+
+    try:
+      yield
+    finally:
+      with self._condition:
+        self._writers -= 1
+        self._release_if_idle()
+
+
+  def _release_if_idle(self) -> None:
+    if not self._writers and self._pending is None:
+      self._file_lock.release()
+
+
+  def read(self) -> Optional[str]:
+    """Returns the latest staged version that is not on disk yet, if any."""
+
+    return self._pending
+
+
+  def commit(self, data: Dict[str, Any]) -> int:
+    """Commits a version, and returns the generation to pass to wait()."""
+
+    text = json.dumps(data)
+    with self._condition:
+      self.generation += 1
+      generation = self.generation
+
+      if self.mode == 'strict':
+        self._write(text, generation, 1)
+        return generation
+
+      self._pending = text
+      self._schedule_flush()
+      return generation
+
+
+  def _schedule_flush(self) -> None:
+    if self.mode == 'relaxed' and self._timer is None:
+      self._timer = threading.Timer(self.flush_interval, self.flush)
+      self._timer.daemon = True
+      self._timer.start()
+
+
+  def wait(self, generation: int) -> None:
+    """Blocks until the given commit is durable, as far as the mode promises."""
+
+    if self.mode != 'group':
+      return
+
+    with self._condition:
+      while self.durable_generation < generation:
+        if self._leader:
+          self._condition.wait()
+          continue
+
+        # Nobody is gathering a group yet, so this committer leads one
+        self._leader = True
+        self._condition.release()
+        try:
+          time.sleep(self.group_window)
+          self.flush()
+        finally:
+          self._condition.acquire()
+          self._leader = False
+          self._condition.notify_all()
+
+
+  # Flushing
+
+  def flush(self) -> None:
+    """Writes the latest staged version, if any, and acknowledges every commit it contains."""
+
+    with self._flush_lock:
+      with self._condition:
+        text, generation = self._pending, self.generation
+        self._timer = None
+        if text is None:
+          return
+
+      # Writers keep staging versions while this one is written
+      self._write(text, generation, generation - self.durable_generation)
+
+      with self._condition:
+        # Readers use the staged version until the file has it, and a newer one stays staged
+        if self._pending is text:
+          self._pending = None
+          self._release_if_idle()
+        else:
+          self._schedule_flush()
+        self._condition.notify_all()
+
+
+  def _write(self, text: str, generation: int, commits: int) -> None:
+    write_text_atomically(self.path, text)
+    self.durable_generation = generation
+    storage_flushes.inc((self.mode,))
+    commits_per_flush.observe(commits, (self.mode,))
+    for listener in flush_listeners:
+      listener(self.path)
+
+
+# --------------------------------------------------------------------------------
+# Committers by Path
+# --------------------------------------------------------------------------------
+
+committers: Dict[str, Committer] = {}
+_committers_lock = threading.Lock()
+
+
+def committer_for(path: str) -> Committer:
+  with _committers_lock:
+    committer = committers.get(path)
+    if committer is None:
+      committer = committers[path] = Committer(
+        path,
+        durability_config.get('mode', 'strict'),
+        durability_config.get('group_window_ms', 5) / 1000,
+        durability_config.get('flush_interval_seconds', 1.0))
+    return committer
+
+
+def flush(path: str) -> None:
+  committer = committers.get(path)
+  if committer is not None:
+    committer.flush()
+
+
+@atexit.register
+def flush_all() -> None:
+  for committer in list(committers.values()):
+    committer.flush()
+
+
+# --------------------------------------------------------------------------------
+# Waiting in Requests
+# --------------------------------------------------------------------------------
+
+def _on_event_loop() -> bool:
+  try:
+    asyncio.get_running_loop()
+    return True
+  except RuntimeError:
+    return False
+
+
+def wait_for(committer: Committer, generation: int) -> None:
+  """Waits until a commit is durable, or leaves that to DurabilityMiddleware when called on its event loop."""
+
+  deferred = _deferred_waits.get()
+  if committer.mode == 'group' and deferred is not None and _on_event_loop():
+    deferred[committer] = max(deferred.get(committer, 0), generation)
+  else:
+    committer.wait(generation)
+
+
+async def _wait_deferred(deferred: Dict[Committer, int]) -> None:
+  while deferred:
+    committer, generation = deferred.popitem()
+    await to_thread(committer.wait, generation)
+
+
+class DurabilityMiddleware:
+
+  def __init__(self, app) -> None:
+    self.app = app
+
+
+  async def __call__(self, scope, receive, send) -> None:
+    if scope['type'] != 'http':
+      await self.app(scope, receive, send)
+      return
+
+    deferred: Dict[Committer, int] = {}
+    token = _deferred_waits.set(deferred)
+
+    async def send_wrapper(message):
+      if message['type'] == 'http.response.start':
+        await _wait_deferred(deferred)
+      await send(message)
+
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      _deferred_waits.reset(token)
+      # A handler that failed may still have committed before it did
+      await _wait_deferred(deferred)
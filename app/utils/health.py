@@ -0,0 +1,123 @@
+"""
+This module provides liveness and readiness checks.
+
+Readiness means the startup warmup has finished
+and a timed read against the configured database succeeds quickly enough.
+Results are cached briefly, so load balancers can probe every second
+without each probe reading the database.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import time
+
+from app import config, db_path, templates
+from app.utils.counters import repair as repair_counters
+from app.utils.metrics import registry
+from app.utils.storage import ReminderStorage
+from typing import Dict, Optional
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+logger = logging.getLogger('catty.health')
+readiness_config = config.get('readiness', {})
+
+warmup_duration = registry.gauge(
+  'catty_warmup_duration_seconds',
+  'How long the startup warmup took.')
+
+
+# --------------------------------------------------------------------------------
+# Readiness Class
+# --------------------------------------------------------------------------------
+
+class Readiness:
+
+  def __init__(self, db_path: str, cache_seconds: float = 1.0, max_storage_latency: float = 1.0) -> None:
+    self.db_path = db_path
+    self.cache_seconds = cache_seconds
+    self.max_storage_latency = max_storage_latency
+    self.warm = False
+    self._storage_result: Optional[Dict] = None
+    self._checked_at = 0.0
+    self._lock = asyncio.Lock()
+
+
+  # Warmup
+
+  def warmup(self) -> None:
+    start = time.perf_counter()
+
+    # Compile every template once, so the first real request does not pay for it
+    for name in templates.env.list_templates(extensions=['html']):
+      templates.env.get_template(name)
+
+    # Read the database once, so its file is in the page cache before the first request.
+    # A failure here must not keep the app unready forever, because check() tests storage anyway.
+    try:
+      ReminderStorage(owner='', db_path=self.db_path).ping()
+    except Exception:
+      logger.warning('Storage warmup read failed', exc_info=True)
+
+    # Lists from before item counters existed get theirs filled in once
+    try:
+      repaired = repair_counters(self.db_path)
+      if repaired:
+        logger.info(f'Repaired item counters on {len(repaired)} lists')
+    except Exception:
+      logger.warning('Item counter repair failed', exc_info=True)
+
+    elapsed = time.perf_counter() - start
+    warmup_duration.set(elapsed)
+    self.warm = True
+    logger.info(f'Warmup finished in {elapsed * 1000:.0f} ms')
+
+
+  async def run_warmup(self) -> None:
+    try:
+      await asyncio.to_thread(self.warmup)
+    except Exception:
+      logger.exception('Warmup failed')
+
+
+  # Checks
+
+  def _check_storage(self) -> Dict:
+    start = time.perf_counter()
+    try:
+      ReminderStorage(owner='', db_path=self.db_path).ping()
+    except Exception as e:
+      return {'ok': False, 'latency_ms': round((time.perf_counter() - start) * 1000, 3), 'error': str(e)}
+
+    latency = time.perf_counter() - start
+    return {'ok': latency <= self.max_storage_latency, 'latency_ms': round(latency * 1000, 3)}
+
+
+  async def check(self) -> Dict:
+    async with self._lock:
+      cached = self._storage_result is not None and time.monotonic() - self._checked_at < self.cache_seconds
+      if not cached:
+        self._storage_result = await asyncio.to_thread(self._check_storage)
+        self._checked_at = time.monotonic()
+
+    storage = self._storage_result
+    ready = self.warm and storage['ok']
+    return {
+      'status': 'ready' if ready else 'not ready',
+      'warm': self.warm,
+      'storage': storage,
+      'cached': cached,
+    }
+
+
+readiness = Readiness(
+  db_path,
+  cache_seconds=readiness_config.get('cache_ms', 1000) / 1000,
+  max_storage_latency=readiness_config.get('max_storage_latency_ms', 1000) / 1000)
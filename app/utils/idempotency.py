@@ -0,0 +1,276 @@
+"""
+This module makes retried writes safe with the Idempotency-Key header.
+
+A client that sends a POST, PUT, PATCH or DELETE with an Idempotency-Key
+gets the first response for that key recorded, and every retry with the same key
+gets that response replayed (marked with Idempotent-Replayed: true)
+instead of running the request again, so a retry after a timeout never creates a duplicate.
+
+  - Keys belong to the user that sent them. Requests without a login are not made idempotent,
+    because behind the proxy every anonymous client has the same address and would share keys.
+  - A retry that arrives while the first request is still running waits for it and gets its response.
+  - Reusing a key for a different request (method, path or body) gets 422.
+  - Server errors, responses that set cookies, and responses too large for the store are not recorded,
+    so their retries run again and a replay never hands out a session.
+  - Recorded responses expire after ttl_hours, and the least recently used are
+    forgotten first when the store goes over max_keys or max_megabytes.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import asyncio
+import hashlib
+import json
+import time
+
+from app.utils.metrics import registry
+from app.utils.rate_limit import client_key
+from collections import OrderedDict
+from starlette.datastructures import Headers
+from typing import List, Optional, Tuple
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+IDEMPOTENT_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+MAX_KEY_LENGTH = 255
+
+# Headers that describe how the first response was produced, not what it said
+UNREPLAYED_HEADERS = (b'server-timing',)
+
+idempotency_stats = registry.cache('idempotency')
+
+idempotency_rejected = registry.counter(
+  'catty_idempotency_rejected_total',
+  'Requests rejected for an invalid Idempotency-Key or one reused for a different request, by reason.',
+  ('reason',))
+
+
+# --------------------------------------------------------------------------------
+# Response Store
+# --------------------------------------------------------------------------------
+
+class _Entry:
+
+  def __init__(self, fingerprint: str) -> None:
+    self.fingerprint = fingerprint
+    self.status: Optional[int] = None
+    self.headers: List[Tuple[bytes, bytes]] = []
+    self.body = b''
+    self.expires = float('inf')
+    self.done = asyncio.Event()
+
+
+  @property
+  def size(self) -> int:
+    return len(self.body) + sum(len(name) + len(value) for name, value in self.headers)
+
+
+class IdempotencyStore:
+  """Recorded responses keyed by (client, key), expiring after ttl and bounded by count and bytes."""
+
+  def __init__(self, ttl: float = 86400, max_keys: int = 10_000, max_bytes: int = 64 * 1024 * 1024) -> None:
+    self.ttl = ttl
+    self.max_keys = max_keys
+    self.max_bytes = max_bytes
+    self.size = 0
+    self._entries: 'OrderedDict[Tuple[str, str], _Entry]' = OrderedDict()
+
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+
+  def get(self, key: Tuple[str, str], now: Optional[float] = None) -> Optional[_Entry]:
+    entry = self._entries.get(key)
+    if entry is None:
+      return None
+
+    if entry.expires <= (time.monotonic() if now is None else now):
+      self.discard(key, entry)
+      return None
+
+    self._entries.move_to_end(key)
+    return entry
+
+
+  def begin(self, key: Tuple[str, str], fingerprint: str) -> _Entry:
+    """Claims a key for a request that is about to run."""
+
+    entry = self._entries[key] = _Entry(fingerprint)
+    self._evict()
+    return entry
+
+
+  def complete(
+    self,
+    key: Tuple[str, str],
+    entry: _Entry,
+    status: int,
+    headers: List[Tuple[bytes, bytes]],
+    body: bytes,
+    now: Optional[float] = None
+  ) -> None:
+    entry.status, entry.headers, entry.body = status, headers, body
+    entry.expires = (time.monotonic() if now is None else now) + self.ttl
+    if self._entries.get(key) is entry:
+      self.size += entry.size
+      self._evict()
+
+
+  def discard(self, key: Tuple[str, str], entry: _Entry) -> None:
+    if self._entries.get(key) is entry:
+      del self._entries[key]
+      if entry.status is not None:
+        self.size -= entry.size
+
+
+  def _evict(self) -> None:
+    while self._entries and (len(self._entries) > self.max_keys or self.size > self.max_bytes):
+      key, entry = next(iter(self._entries.items()))
+      self.discard(key, entry)
+
+
+# --------------------------------------------------------------------------------
+# Middleware
+# --------------------------------------------------------------------------------
+
+def request_fingerprint(scope, body: bytes) -> str:
+  digest = hashlib.sha256()
+  for part in (scope['method'], scope['path'], scope.get('query_string', b'').decode('latin-1')):
+    digest.update(part.encode('utf-8') + b'\0')
+  digest.update(body)
+  return digest.hexdigest()
+
+
+class IdempotencyMiddleware:
+
+  def __init__(
+    self,
+    app,
+    ttl: float = 86400,
+    max_keys: int = 10_000,
+    max_bytes: int = 64 * 1024 * 1024
+  ) -> None:
+    self.app = app
+    self.store = IdempotencyStore(ttl, max_keys, max_bytes)
+
+
+  async def _send_json(self, send, status: int, detail: str) -> None:
+    body = json.dumps({'detail': detail}).encode('utf-8')
+    await send({
+      'type': 'http.response.start',
+      'status': status,
+      'headers': [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+      ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+  async def _replay(self, send, entry: _Entry) -> None:
+    await send({
+      'type': 'http.response.start',
+      'status': entry.status,
+      'headers': entry.headers + [(b'idempotent-replayed', b'true')],
+    })
+    await send({'type': 'http.response.body', 'body': entry.body})
+
+
+  async def __call__(self, scope, receive, send) -> None:
+    if scope['type'] != 'http' or scope['method'] not in IDEMPOTENT_METHODS:
+      await self.app(scope, receive, send)
+      return
+
+    idempotency_key = Headers(scope=scope).get('idempotency-key')
+    client = client_key(scope)
+    if idempotency_key is None or not client.startswith('user:'):
+      await self.app(scope, receive, send)
+      return
+
+    if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+      idempotency_rejected.inc(('invalid',))
+      await self._send_json(send, 400, f'Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters')
+      return
+
+    # The body is part of what makes two requests the same, so it is read up front
+    chunks = []
+    while True:
+      message = await receive()
+      if message['type'] != 'http.request':
+        return
+      chunks.append(message.get('body', b''))
+      if not message.get('more_body', False):
+        break
+    body = b''.join(chunks)
+
+    key = (client, idempotency_key)
+    fingerprint = request_fingerprint(scope, body)
+
+    while True:
+      entry = self.store.get(key)
+      if entry is None:
+        break
+      if entry.fingerprint != fingerprint:
+        idempotency_rejected.inc(('mismatch',))
+        await self._send_json(send, 422, 'Idempotency-Key was already used for a different request')
+        return
+      if entry.status is None:
+        # The first request is still running, and its outcome decides what this one gets
+        await entry.done.wait()
+        continue
+
+      idempotency_stats.hit()
+      await self._replay(send, entry)
+      return
+
+    idempotency_stats.miss()
+    entry = self.store.begin(key, fingerprint)
+    await self._run(scope, receive, send, key, entry, body)
+
+
+  async def _run(self, scope, receive, send, key, entry: _Entry, body: bytes) -> None:
+    body_sent = False
+    status = None
+    headers: List[Tuple[bytes, bytes]] = []
+    sets_cookie = False
+    response_chunks = []
+    response_size = 0
+    complete = False
+
+    async def replay_receive():
+      nonlocal body_sent
+      if not body_sent:
+        body_sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+      return await receive()
+
+    async def recording_send(message) -> None:
+      nonlocal status, headers, sets_cookie, response_size, complete
+      if message['type'] == 'http.response.start':
+        status = message['status']
+        headers = [
+          (name, value) for name, value in message.get('headers', [])
+          if name.lower() not in UNREPLAYED_HEADERS]
+        sets_cookie = any(name.lower() == b'set-cookie' for name, _ in headers)
+      elif message['type'] == 'http.response.body' and response_size <= self.store.max_bytes:
+        chunk = message.get('body', b'')
+        response_chunks.append(chunk)
+        response_size += len(chunk)
+        complete = not message.get('more_body', False)
+      await send(message)
+
+    try:
+      await self.app(scope, replay_receive, recording_send)
+    finally:
+      if complete and status < 500 and not sets_cookie and response_size <= self.store.max_bytes:
+        self.store.complete(key, entry, status, headers, b''.join(response_chunks))
+      else:
+        self.store.discard(key, entry)
+      entry.done.set()
@@ -0,0 +1,172 @@
+"""
+This module monitors event loop lag and catches handlers that block the loop.
+
+A heartbeat task measures how late the loop wakes it up, and exports that lag as a metric.
+A watchdog thread notices when the heartbeat stops,
+captures the stack of whatever is running on the loop thread,
+and names the route of the request that owns the running task.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+
+from app import config
+from app.utils.metrics import registry, route_template
+from collections import deque
+from typing import Dict, List, Optional
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+logger = logging.getLogger('catty.loop_monitor')
+loop_monitor_config = config.get('loop_monitor', {})
+
+loop_lag = registry.histogram(
+  'catty_event_loop_lag_seconds',
+  'How late the event loop ran the heartbeat task.',
+  buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+loop_lag_current = registry.gauge(
+  'catty_event_loop_lag_current_seconds',
+  'Event loop lag measured by the latest heartbeat.')
+
+loop_stalls = registry.counter(
+  'catty_event_loop_stalls_total',
+  'Event loop stalls over the threshold, by the route that was running.',
+  ('route',))
+
+# Maps request tasks to their ASGI scopes, so a stall can be traced back to a route
+_task_scopes: 'weakref.WeakKeyDictionary[asyncio.Task, dict]' = weakref.WeakKeyDictionary()
+
+
+# --------------------------------------------------------------------------------
+# LoopMonitor Class
+# --------------------------------------------------------------------------------
+
+class LoopMonitor:
+
+  def __init__(self, interval: float = 0.1, threshold: float = 0.25, history: int = 50) -> None:
+    self.interval = interval
+    self.threshold = threshold
+    self.stalls: deque = deque(maxlen=history)
+    self._loop: Optional[asyncio.AbstractEventLoop] = None
+    self._loop_thread_id: Optional[int] = None
+    self._last_beat = 0.0
+    self._reported_beat = 0.0
+    self._heartbeat_task: Optional[asyncio.Task] = None
+    self._watchdog: Optional[threading.Thread] = None
+    self._stop = threading.Event()
+
+
+  # Lifecycle
+
+  def start(self) -> None:
+    self._loop = asyncio.get_running_loop()
+    self._loop_thread_id = threading.get_ident()
+    self._last_beat = time.perf_counter()
+    self._stop.clear()
+    self._heartbeat_task = self._loop.create_task(self._heartbeat())
+    self._watchdog = threading.Thread(target=self._watch, name='catty-loop-watchdog', daemon=True)
+    self._watchdog.start()
+
+
+  async def stop(self) -> None:
+    self._stop.set()
+    if self._heartbeat_task:
+      self._heartbeat_task.cancel()
+      try:
+        await self._heartbeat_task
+      except asyncio.CancelledError:
+        pass
+    if self._watchdog:
+      self._watchdog.join()
+
+
+  # Loop Side
+
+  async def _heartbeat(self) -> None:
+    while True:
+      before = time.perf_counter()
+      await asyncio.sleep(self.interval)
+      now = time.perf_counter()
+      lag = max(0.0, now - before - self.interval)
+      loop_lag.observe(lag)
+      loop_lag_current.set(lag)
+      self._last_beat = now
+
+
+  # Watchdog Side
+
+  def _watch(self) -> None:
+    while not self._stop.wait(self.interval / 2):
+      last_beat = self._last_beat
+      blocked_for = time.perf_counter() - last_beat - self.interval
+      if blocked_for > self.threshold and last_beat != self._reported_beat:
+        self._reported_beat = last_beat
+        self._capture(blocked_for)
+
+
+  def _capture(self, blocked_for: float) -> None:
+    frame = sys._current_frames().get(self._loop_thread_id)
+    stack = ''.join(traceback.format_stack(frame)) if frame else ''
+
+    task = asyncio.current_task(self._loop)
+    scope = _task_scopes.get(task) if task else None
+    route = route_template(scope) if scope else '<no request>'
+
+    stall = {
+      'time': time.time(),
+      'blocked_for': round(blocked_for, 3),
+      'route': route,
+      'method': scope['method'] if scope else None,
+      'path': scope['path'] if scope else None,
+      'stack': stack,
+    }
+
+    self.stalls.append(stall)
+    loop_stalls.inc((route,))
+    logger.warning(f'Event loop blocked for over {blocked_for * 1000:.0f} ms by {route}\n{stack}')
+
+
+  def recent_stalls(self) -> List[Dict]:
+    return list(self.stalls)
+
+
+# --------------------------------------------------------------------------------
+# Middleware
+# --------------------------------------------------------------------------------
+
+class LoopMonitorMiddleware:
+  """Remembers which request each task is serving."""
+
+  def __init__(self, app) -> None:
+    self.app = app
+
+
+  async def __call__(self, scope, receive, send) -> None:
+    if scope['type'] == 'http':
+      task = asyncio.current_task()
+      if task is not None:
+        _task_scopes[task] = scope
+
+    await self.app(scope, receive, send)
+
+
+# --------------------------------------------------------------------------------
+# Shared Monitor
+# --------------------------------------------------------------------------------
+
+loop_monitor = LoopMonitor(
+  interval=loop_monitor_config.get('interval_ms', 100) / 1000,
+  threshold=loop_monitor_config.get('threshold_ms', 250) / 1000)
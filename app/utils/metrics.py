@@ -0,0 +1,477 @@
+"""
+This module provides Prometheus metrics for the app.
+
+Metrics are kept in plain Python containers, one per thread that updates them.
+Storage calls run on the event loop thread and in worker threads too
+(reads handed to worker threads, the compactor, durability flushes),
+and a thread only ever adds to its own container, so the hot path takes no lock:
+it pays for a thread-local lookup, a dict lookup and an add, and no increment is lost.
+Collecting sums the containers, taking a lock only to list them.
+A thread that has finished hands its container, values and all, to the next new thread,
+so threads started per flush do not grow the list.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import functools
+import os
+import threading
+import time
+
+from app import db_path
+from app.utils.timing import storage_call
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+# --------------------------------------------------------------------------------
+# Private Functions
+# --------------------------------------------------------------------------------
+
+def _escape(value: str) -> str:
+  return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+  pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+  if extra:
+    pairs.append(extra)
+  return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+  if value == float('inf'):
+    return '+Inf'
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# --------------------------------------------------------------------------------
+# Per-Thread Cells
+# --------------------------------------------------------------------------------
+
+class _ThreadCells:
+  """A container per thread, made by factory, that only its own thread updates."""
+
+  def __init__(self, factory: Callable[[], Any]) -> None:
+    self._factory = factory
+    self._local = threading.local()
+    self._cells: List[list] = []
+    self._lock = threading.Lock()
+
+
+  def mine(self) -> Any:
+    cell = getattr(self._local, 'cell', None)
+    if cell is None:
+      cell = self._local.cell = self._adopt()
+    return cell
+
+
+  def _adopt(self) -> Any:
+    # Runs once per thread, so updates after the first never wait for the lock
+    thread = threading.current_thread()
+    with self._lock:
+      for entry in self._cells:
+        if not entry[0].is_alive():
+          entry[0] = thread
+          return entry[1]
+      cell = self._factory()
+      self._cells.append([thread, cell])
+      return cell
+
+
+  def all(self) -> List[Any]:
+    with self._lock:
+      return [cell for _, cell in self._cells]
+
+
+# --------------------------------------------------------------------------------
+# Metric Classes
+# --------------------------------------------------------------------------------
+
+class Counter:
+
+  def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self._cells = _ThreadCells(dict)
+
+
+  def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+    values = self._cells.mine()
+    values[labels] = values.get(labels, 0) + amount
+
+
+  def get(self, labels: Tuple[str, ...] = ()) -> float:
+    return sum(values.get(labels, 0) for values in self._cells.all())
+
+
+  def values(self) -> Dict[Tuple[str, ...], float]:
+    totals: Dict[Tuple[str, ...], float] = {}
+    for values in self._cells.all():
+      # Copying a dict is atomic, so the owning thread can keep adding meanwhile
+      for labels, value in values.copy().items():
+        totals[labels] = totals.get(labels, 0) + value
+    return totals
+
+
+  def collect(self) -> List[str]:
+    values = self.values().items()
+    lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+    for labels, value in values:
+      lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+    return lines
+
+
+class Gauge:
+
+  def __init__(
+    self,
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+  ) -> None:
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self._callback = callback
+    # The gauge is its last set() value plus every inc() and dec() since,
+    # so the increments stay per thread and only set(), which is rare, takes a lock
+    self._base: Dict[Tuple[str, ...], float] = {}
+    self._changes = Counter(name, documentation, labelnames)
+    self._lock = threading.Lock()
+
+
+  def set(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+    with self._lock:
+      self._base[labels] = value - self._changes.get(labels)
+
+
+  def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+    self._changes.inc(labels, amount)
+
+
+  def dec(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+    self._changes.inc(labels, -amount)
+
+
+  def get(self, labels: Tuple[str, ...] = ()) -> float:
+    return self._base.get(labels, 0) + self._changes.get(labels)
+
+
+  def collect(self) -> List[str]:
+    if self._callback:
+      values = list(self._callback().items())
+    else:
+      with self._lock:
+        totals = dict(self._base)
+      for labels, change in self._changes.values().items():
+        totals[labels] = totals.get(labels, 0) + change
+      values = list(totals.items())
+    lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+    for labels, value in values:
+      lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+    return lines
+
+
+class Histogram:
+
+  def __init__(
+    self,
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS
+  ) -> None:
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self.buckets = tuple(sorted(buckets))
+    # Per thread, per label set: [per-bucket counts (last one is +Inf), sum]
+    self._cells = _ThreadCells(dict)
+
+
+  def observe(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+    bucket = bisect_left(self.buckets, value)
+    values = self._cells.mine()
+    state = values.get(labels)
+    if state is None:
+      state = values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+    state[0][bucket] += 1
+    state[1] += value
+
+
+  def _merged(self) -> Dict[Tuple[str, ...], Tuple[List[int], float]]:
+    merged: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+    for values in self._cells.all():
+      for labels, (counts, total) in values.copy().items():
+        merged_counts, merged_total = merged.get(labels, ([0] * len(counts), 0.0))
+        merged[labels] = ([a + b for a, b in zip(merged_counts, list(counts))], merged_total + total)
+    return merged
+
+
+  def count(self, labels: Tuple[str, ...] = ()) -> int:
+    counts, _ = self._merged().get(labels, ([], 0.0))
+    return sum(counts)
+
+
+  def collect(self) -> List[str]:
+    lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+    for labels, (counts, total) in self._merged().items():
+      # The count comes from the buckets, so it always agrees with them
+      count = sum(counts)
+      cumulative = 0
+      for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+        cumulative += bucket_count
+        le = 'le="' + _format_value(bound) + '"'
+        lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+      lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}')
+      lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {count}')
+    return lines
+
+
+class CacheStats:
+
+  def __init__(self, name: str) -> None:
+    self.name = name
+    # Per thread: [hits, misses]
+    self._cells = _ThreadCells(lambda: [0, 0])
+
+
+  def hit(self) -> None:
+    self._cells.mine()[0] += 1
+
+
+  def miss(self) -> None:
+    self._cells.mine()[1] += 1
+
+
+  @property
+  def hits(self) -> int:
+    return sum(cell[0] for cell in self._cells.all())
+
+
+  @property
+  def misses(self) -> int:
+    return sum(cell[1] for cell in self._cells.all())
+
+
+  @property
+  def ratio(self) -> float:
+    hits, misses = self.hits, self.misses
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+# --------------------------------------------------------------------------------
+# Registry
+# --------------------------------------------------------------------------------
+
+class Registry:
+
+  def __init__(self) -> None:
+    self._metrics: List = []
+    self._caches: Dict[str, CacheStats] = {}
+
+
+  def register(self, metric):
+    self._metrics.append(metric)
+    return metric
+
+
+  def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return self.register(Counter(name, documentation, labelnames))
+
+
+  def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback=None) -> Gauge:
+    return self.register(Gauge(name, documentation, labelnames, callback))
+
+
+  def histogram(
+    self,
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS
+  ) -> Histogram:
+    return self.register(Histogram(name, documentation, labelnames, buckets))
+
+
+  def cache(self, name: str) -> CacheStats:
+    if name not in self._caches:
+      self._caches[name] = CacheStats(name)
+    return self._caches[name]
+
+
+  def caches(self) -> List[CacheStats]:
+    return list(self._caches.values())
+
+
+  def render(self) -> str:
+    lines = []
+    for metric in self._metrics:
+      lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+# --------------------------------------------------------------------------------
+# App Metrics
+# --------------------------------------------------------------------------------
+
+http_requests = registry.counter(
+  'catty_http_requests_total',
+  'Total HTTP requests by method, route and status code.',
+  ('method', 'route', 'status'))
+
+http_request_duration = registry.histogram(
+  'catty_http_request_duration_seconds',
+  'HTTP request latency by method and route.',
+  ('method', 'route'))
+
+http_requests_in_flight = registry.gauge(
+  'catty_http_requests_in_flight',
+  'HTTP requests currently being served.')
+
+storage_operations = registry.counter(
+  'catty_storage_operations_total',
+  'ReminderStorage calls by method and access kind (read or write).',
+  ('method', 'kind'))
+
+storage_errors = registry.counter(
+  'catty_storage_errors_total',
+  'ReminderStorage calls that raised, by method and access kind.',
+  ('method', 'kind'))
+
+storage_operation_duration = registry.histogram(
+  'catty_storage_operation_duration_seconds',
+  'ReminderStorage call latency by method and access kind.',
+  ('method', 'kind'))
+
+
+def _db_file_size() -> Dict[Tuple[str, ...], float]:
+  try:
+    size = os.path.getsize(db_path)
+  except OSError:
+    size = 0
+  return {(db_path,): size}
+
+
+def _cache_values(attribute: str) -> Callable[[], Dict[Tuple[str, ...], float]]:
+  def collect():
+    return {(stats.name,): getattr(stats, attribute) for stats in registry.caches()}
+  return collect
+
+
+registry.gauge(
+  'catty_db_file_size_bytes',
+  'Size of the reminder database file.',
+  ('path',),
+  callback=_db_file_size)
+
+registry.gauge(
+  'catty_cache_hits',
+  'Cache hits by cache name.',
+  ('cache',),
+  callback=_cache_values('hits'))
+
+registry.gauge(
+  'catty_cache_misses',
+  'Cache misses by cache name.',
+  ('cache',),
+  callback=_cache_values('misses'))
+
+registry.gauge(
+  'catty_cache_hit_ratio',
+  'Cache hit ratio by cache name.',
+  ('cache',),
+  callback=_cache_values('ratio'))
+
+
+# --------------------------------------------------------------------------------
+# Storage Instrumentation
+# --------------------------------------------------------------------------------
+
+def storage_operation(kind: str):
+  """Decorates a ReminderStorage method to count and time its calls."""
+
+  def decorator(func):
+    labels = (func.__name__, kind)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      start = time.perf_counter()
+      try:
+        with storage_call(*labels):
+          return func(*args, **kwargs)
+      except Exception:
+        storage_errors.inc(labels)
+        raise
+      finally:
+        storage_operations.inc(labels)
+        storage_operation_duration.observe(time.perf_counter() - start, labels)
+
+    return wrapper
+  return decorator
+
+
+# --------------------------------------------------------------------------------
+# Request Instrumentation
+# --------------------------------------------------------------------------------
+
+def route_template(scope: dict) -> str:
+  """Returns a low-cardinality route label for a request scope after routing."""
+
+  route = scope.get('route')
+  if route is not None:
+    return route.path
+  elif 'endpoint' in scope:
+    # Mounted apps like /static do not set a route, but they do set the root path
+    return scope.get('root_path') or '<mount>'
+  else:
+    return '<unmatched>'
+
+
+class MetricsMiddleware:
+
+  def __init__(self, app) -> None:
+    self.app = app
+
+
+  async def __call__(self, scope, receive, send) -> None:
+    if scope['type'] != 'http':
+      await self.app(scope, receive, send)
+      return
+
+    status_code = 500
+
+    async def send_wrapper(message):
+      nonlocal status_code
+      if message['type'] == 'http.response.start':
+        status_code = message['status']
+      await send(message)
+
+    http_requests_in_flight.inc()
+    start = time.perf_counter()
+
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      elapsed = time.perf_counter() - start
+      http_requests_in_flight.dec()
+      route = route_template(scope)
+      http_requests.inc((scope['method'], route, str(status_code)))
+      http_request_duration.observe(elapsed, (scope['method'], route))
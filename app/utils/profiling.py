@@ -0,0 +1,343 @@
+"""
+This module provides on-demand request profiling.
+
+A request carrying a valid profile token in the X-Catty-Profile header
+is wrapped in a sampling profiler, and the result is stored as a speedscope file
+(open it at https://www.speedscope.app).
+A background mode also profiles 1 in N requests into the same rolling store.
+
+The profiler samples the event loop thread, plus any worker thread while it runs work
+that the request handed to to_thread() below, and each thread gets a profile of its own in the file.
+Sync dependencies and endpoints that FastAPI runs in its own threadpool are not sampled.
+
+Mint a token with:
+
+  python -m app.utils.profiling token --ttl 600
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+import jwt
+
+from app import config, data_path, secret_key
+from app.utils.exceptions import NotFoundException, UnauthorizedException
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi import Header
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+profile_header_name = "X-Catty-Profile"
+profile_id_header_name = "X-Catty-Profile-Id"
+profiling_config = config.get("profiling", {})
+
+T = TypeVar("T")
+
+# The profiler of the request being served, which worker threads join while they run its work
+_active_profiler: ContextVar[Optional["SamplingProfiler"]] = ContextVar("catty_active_profiler", default=None)
+
+
+# --------------------------------------------------------------------------------
+# Tokens
+# --------------------------------------------------------------------------------
+
+def serialize_profile_token(ttl_seconds: int = 600) -> str:
+  claims = {"scope": "profile", "exp": int(time.time()) + ttl_seconds}
+  return jwt.encode(claims, secret_key, algorithm="HS256")
+
+
+def is_valid_profile_token(token: Optional[str]) -> bool:
+  if not token:
+    return False
+
+  try:
+    data = jwt.decode(token, secret_key, algorithms=["HS256"])
+    return data.get("scope") == "profile"
+  except:
+    return False
+
+
+def require_profile_token(x_catty_profile: Optional[str] = Header(default=None)) -> None:
+  if not is_valid_profile_token(x_catty_profile):
+    raise UnauthorizedException()
+
+
+# --------------------------------------------------------------------------------
+# SamplingProfiler Class
+# --------------------------------------------------------------------------------
+
+class _ThreadSamples:
+
+  def __init__(self, name: str, offset: float) -> None:
+    self.name = name
+    self.offset = offset
+    self.samples: List[List[int]] = []
+    self.weights: List[float] = []
+
+
+class SamplingProfiler:
+  """Samples the Python stacks of a set of threads on a timer from a background thread."""
+
+  def __init__(self, thread_id: int, interval: float = 0.001, thread_name: str = "event loop") -> None:
+    self.interval = interval
+    self._frames: List[Dict] = []
+    self._frame_indexes: Dict[Tuple[str, str, int], int] = {}
+    self._threads: Dict[int, _ThreadSamples] = {}
+    self._active: Dict[int, int] = {}
+    self._lock = threading.Lock()
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._run, name="catty-profiler", daemon=True)
+    self._start = time.perf_counter()
+    self._end = 0.0
+    self.add_thread(thread_id, thread_name)
+
+
+  def add_thread(self, thread_id: int, name: str) -> None:
+    """Starts sampling a thread, until a matching remove_thread()."""
+
+    with self._lock:
+      if thread_id not in self._threads:
+        self._threads[thread_id] = _ThreadSamples(name, time.perf_counter() - self._start)
+      self._active[thread_id] = self._active.get(thread_id, 0) + 1
+
+
+  def remove_thread(self, thread_id: int) -> None:
+    with self._lock:
+      self._active[thread_id] -= 1
+      if not self._active[thread_id]:
+        del self._active[thread_id]
+
+
+  def _frame_index(self, code) -> int:
+    key = (code.co_name, code.co_filename, code.co_firstlineno)
+    index = self._frame_indexes.get(key)
+    if index is None:
+      index = self._frame_indexes[key] = len(self._frames)
+      self._frames.append({"name": key[0], "file": key[1], "line": key[2]})
+    return index
+
+
+  def _run(self) -> None:
+    last = time.perf_counter()
+    while not self._stop.wait(self.interval):
+      frames = sys._current_frames()
+      now = time.perf_counter()
+      with self._lock:
+        active = [(thread_id, self._threads[thread_id]) for thread_id in self._active]
+
+      for thread_id, thread in active:
+        frame = frames.get(thread_id)
+        if frame is None:
+          continue
+
+        stack = []
+        while frame is not None:
+          stack.append(self._frame_index(frame.f_code))
+          frame = frame.f_back
+        stack.reverse()
+
+        thread.samples.append(stack)
+        thread.weights.append(now - last)
+      last = now
+
+
+  def start(self) -> None:
+    self._thread.start()
+
+
+  def stop(self) -> None:
+    self._stop.set()
+    self._thread.join()
+    self._end = time.perf_counter()
+
+
+  def to_speedscope(self, name: str) -> Dict:
+    with self._lock:
+      threads = list(self._threads.values())
+
+    return {
+      "$schema": "https://www.speedscope.app/file-format-schema.json",
+      "name": name,
+      "exporter": "catty-reminders",
+      "activeProfileIndex": 0,
+      "shared": {"frames": self._frames},
+      "profiles": [{
+        "type": "sampled",
+        "name": f"{name} ({thread.name})",
+        "unit": "seconds",
+        "startValue": thread.offset,
+        "endValue": self._end - self._start,
+        "samples": thread.samples,
+        "weights": thread.weights,
+      } for thread in threads],
+    }
+
+
+# --------------------------------------------------------------------------------
+# Worker Threads
+# --------------------------------------------------------------------------------
+
+@contextmanager
+def sampled_thread() -> Iterator[None]:
+  """Lets the current request's profiler, if any, sample this thread while the block runs."""
+
+  profiler = _active_profiler.get()
+  if profiler is None:
+    yield
+    return
+
+  thread_id = threading.get_ident()
+  profiler.add_thread(thread_id, threading.current_thread().name)
+  try:
+    yield
+  finally:
+    profiler.remove_thread(thread_id)
+
+
+async def to_thread(func: Callable[..., T], *args) -> T:
+  """Runs func in a worker thread like asyncio.to_thread, where the request's profiler can see it."""
+
+  def run() -> T:
+    with sampled_thread():
+      return func(*args)
+
+  # asyncio.to_thread copies the context, so the worker finds the request's profiler
+  return await asyncio.to_thread(run)
+
+
+# --------------------------------------------------------------------------------
+# ProfileStore Class
+# --------------------------------------------------------------------------------
+
+class ProfileStore:
+  """Keeps the newest profiles as files in a directory and deletes the rest."""
+
+  suffix = ".speedscope.json"
+
+
+  def __init__(self, directory: str, keep: int = 50) -> None:
+    self.directory = directory
+    self.keep = keep
+
+
+  def _path(self, profile_id: str) -> str:
+    return os.path.join(self.directory, f"{profile_id}{self.suffix}")
+
+
+  def save(self, profile_id: str, profile: Dict) -> None:
+    os.makedirs(self.directory, exist_ok=True)
+    with open(self._path(profile_id), "w") as profile_file:
+      json.dump(profile, profile_file)
+
+    for stale_id in self.list()[self.keep:]:
+      os.remove(self._path(stale_id))
+
+
+  def list(self) -> List[str]:
+    if not os.path.isdir(self.directory):
+      return []
+
+    names = [name for name in os.listdir(self.directory) if name.endswith(self.suffix)]
+    names.sort(reverse=True)
+    return [name[:-len(self.suffix)] for name in names]
+
+
+  def path(self, profile_id: str) -> str:
+    if profile_id not in self.list():
+      raise NotFoundException()
+    return self._path(profile_id)
+
+
+profile_store = ProfileStore(
+  directory=data_path(profiling_config.get("store_dir", "profiles")),
+  keep=profiling_config.get("keep", 50))
+
+
+# --------------------------------------------------------------------------------
+# Middleware
+# --------------------------------------------------------------------------------
+
+class ProfilingMiddleware:
+  """
+  Profiles requests that carry a valid profile token, plus 1 in sample_rate others.
+  Only one request is profiled at a time,
+  because the sampler sees whatever else the event loop thread runs in the meantime.
+  Worker threads are only sampled while they run this request's to_thread() calls.
+  """
+
+  def __init__(self, app, store: ProfileStore, sample_rate: int = 0, interval: float = 0.001) -> None:
+    self.app = app
+    self.store = store
+    self.sample_rate = sample_rate
+    self.interval = interval
+    self._busy = False
+
+
+  def _wants_profile(self, scope) -> bool:
+    if self._busy:
+      return False
+
+    header_key = profile_header_name.lower().encode()
+    for name, value in scope['headers']:
+      if name == header_key:
+        return is_valid_profile_token(value.decode('latin-1'))
+
+    return self.sample_rate > 0 and random.randrange(self.sample_rate) == 0
+
+
+  async def __call__(self, scope, receive, send) -> None:
+    if scope['type'] != 'http' or not self._wants_profile(scope):
+      await self.app(scope, receive, send)
+      return
+
+    self._busy = True
+    profile_id = time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+    profiler = SamplingProfiler(threading.get_ident(), self.interval)
+
+    async def send_wrapper(message):
+      if message['type'] == 'http.response.start':
+        headers = list(message.get('headers', []))
+        headers.append((profile_id_header_name.lower().encode(), profile_id.encode()))
+        message = {**message, 'headers': headers}
+      await send(message)
+
+    profiler.start()
+    token = _active_profiler.set(profiler)
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      _active_profiler.reset(token)
+      profiler.stop()
+      self._busy = False
+      profile = profiler.to_speedscope(f"{scope['method']} {scope['path']}")
+      await asyncio.to_thread(self.store.save, profile_id, profile)
+
+
+# --------------------------------------------------------------------------------
+# Command Line
+# --------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Catty request profiling tools")
+  subparsers = parser.add_subparsers(dest="command", required=True)
+  token_parser = subparsers.add_parser("token", help="Print a signed profile token")
+  token_parser.add_argument("--ttl", type=int, default=600, help="Token lifetime in seconds")
+  args = parser.parse_args()
+
+  if args.command == "token":
+    print(serialize_profile_token(args.ttl))
@@ -0,0 +1,114 @@
+"""
+This module provides the rank keys that order items within a reminder list.
+
+A rank is a base-62 fraction written as a string, like "V" or "Vk",
+so comparing two ranks as strings compares their positions.
+There is always a rank between any two others, so moving an item only rewrites that item's rank.
+
+Repeated moves into the same gap make ranks a little longer each time.
+Rebalancing respaces a list's ranks evenly, and the compaction pass does that in the background
+for lists whose ranks grew past MAX_RANK_LENGTH or that have items from before ranks existed.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import string
+
+from typing import Dict, List, Optional, Tuple
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+# Digits sort before upper case, and upper case before lower case, so string order is numeric order
+DIGITS = string.digits + string.ascii_uppercase + string.ascii_lowercase
+BASE = len(DIGITS)
+
+MAX_RANK_LENGTH = 12
+
+
+# --------------------------------------------------------------------------------
+# Ranks
+# --------------------------------------------------------------------------------
+
+def rank_between(before: Optional[str], after: Optional[str]) -> str:
+  """Returns a rank that sorts after before and ahead of after, where None means the start or end."""
+
+  before = before or ''
+  if after is not None and after <= before:
+    raise ValueError(f'Cannot rank between {before!r} and {after!r}')
+
+  rank = []
+  bounded = after is not None
+  for position in range(len(before) + (len(after) if bounded else 0) + 1):
+    low = DIGITS.index(before[position]) if position < len(before) else 0
+    high = DIGITS.index(after[position]) if bounded and position < len(after) else BASE
+    if high - low > 1:
+      # Adding at either end steps by one digit, so a list that only grows keeps short ranks
+      if after is None and before:
+        digit = low + 1
+      elif after is not None and not before:
+        digit = high - 1
+      else:
+        digit = (low + high) // 2
+      rank.append(DIGITS[digit])
+      return ''.join(rank)
+
+    # No digit fits here, so keep this one and look for room in the next position
+    rank.append(DIGITS[low])
+    if high > low:
+      bounded = False
+
+  raise ValueError(f'Cannot rank between {before!r} and {after!r}')
+
+
+def spread_ranks(count: int) -> List[str]:
+  """Returns count short ranks, evenly spaced and in order."""
+
+  width = 1
+  while BASE ** width <= count:
+    width += 1
+  step = BASE ** width // (count + 1)
+
+  ranks = []
+  for index in range(1, count + 1):
+    value = index * step
+    digits = []
+    for _ in range(width):
+      value, digit = divmod(value, BASE)
+      digits.append(DIGITS[digit])
+    # Trailing zeros add nothing to a fraction, and leaving them off keeps room below every rank
+    ranks.append(''.join(reversed(digits)).rstrip('0'))
+  return ranks
+
+
+def item_order(item_id: int, rank: Optional[str]) -> Tuple[bool, str, int]:
+  # Items from before ranks existed keep their insertion order, ahead of everything ranked since
+  return (rank is not None, rank or '', item_id)
+
+
+# --------------------------------------------------------------------------------
+# Rebalancing
+# --------------------------------------------------------------------------------
+
+def rebalance_items(items: Dict[str, dict]) -> int:
+  """Respaces the ranks of every list that needs it in the raw items table, and returns how many lists changed."""
+
+  lists: Dict[int, List[Tuple[int, dict]]] = {}
+  for item_id, item in items.items():
+    lists.setdefault(item['list_id'], []).append((int(item_id), item))
+
+  rebalanced = 0
+  for list_items in lists.values():
+    if all(item.get('rank') is not None and len(item['rank']) <= MAX_RANK_LENGTH for _, item in list_items):
+      continue
+
+    list_items.sort(key=lambda pair: item_order(pair[0], pair[1].get('rank')))
+    for (_, item), rank in zip(list_items, spread_ranks(len(list_items))):
+      item['rank'] = rank
+    rebalanced += 1
+
+  return rebalanced
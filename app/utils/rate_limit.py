@@ -0,0 +1,185 @@
+"""
+This module protects storage from being overwhelmed by a few clients or by a burst of traffic.
+
+Each user (or client address, before login) gets a token bucket per route class:
+
+  read    GET requests
+  write   every other method
+  reset   the routes that delete and recreate a whole account
+
+A request that finds its bucket empty gets 429 with Retry-After.
+On top of that, a global limit caps how many requests run at once.
+Requests over the limit wait briefly for a slot, and get 503 with Retry-After if none frees up.
+Both checks happen before routing, so rejected requests never reach ReminderStorage.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import asyncio
+import json
+import math
+import time
+
+from app.utils.auth import auth_cookie_name, deserialize_token
+from app.utils.metrics import registry
+from collections import OrderedDict
+from starlette.datastructures import Headers
+from starlette.requests import cookie_parser
+from typing import Dict, List, Optional, Tuple
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+EXEMPT_PREFIXES = ('/static/', '/healthz', '/readyz', '/metrics')
+
+# Event streams stay open indefinitely, so they would pin concurrency slots
+STREAMING_PATHS = ('/api/notifications',)
+
+RESET_ROUTES = {
+  ('POST', '/api/reminders/create-new-lists'),
+  ('DELETE', '/api/reminders/delete-lists'),
+}
+
+DEFAULT_CLASSES = {
+  'read': {'rate': 20.0, 'burst': 60},
+  'write': {'rate': 5.0, 'burst': 20},
+  'reset': {'rate': 1 / 60, 'burst': 2},
+}
+
+rate_limited = registry.counter(
+  'catty_rate_limited_total',
+  'Requests rejected with 429 because the client\'s token bucket was empty, by route class.',
+  ('route_class',))
+
+load_shed = registry.counter(
+  'catty_load_shed_total',
+  'Requests rejected with 503 because the concurrency limit stayed full.')
+
+requests_admitted = registry.gauge(
+  'catty_requests_admitted',
+  'Requests currently holding a concurrency slot.')
+
+
+# --------------------------------------------------------------------------------
+# Token Buckets
+# --------------------------------------------------------------------------------
+
+class TokenBuckets:
+  """Token buckets keyed by (client, route class), forgetting the least recently used past max_keys."""
+
+  def __init__(self, classes: Dict[str, Dict], max_keys: int = 100_000) -> None:
+    self.classes = classes
+    self.max_keys = max_keys
+    self._buckets: 'OrderedDict[Tuple[str, str], List[float]]' = OrderedDict()
+
+
+  def take(self, client: str, route_class: str, now: Optional[float] = None) -> float:
+    """Takes one token, returning 0 on success or the seconds until a token will be available."""
+
+    settings = self.classes[route_class]
+    rate, burst = settings['rate'], settings['burst']
+    now = time.monotonic() if now is None else now
+    key = (client, route_class)
+
+    bucket = self._buckets.get(key)
+    if bucket is None:
+      bucket = self._buckets[key] = [burst, now]
+      if len(self._buckets) > self.max_keys:
+        # A forgotten bucket comes back full, which only ever errs toward letting a client through
+        self._buckets.popitem(last=False)
+    else:
+      self._buckets.move_to_end(key)
+      bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+      bucket[1] = now
+
+    if bucket[0] >= 1:
+      bucket[0] -= 1
+      return 0.0
+    return (1 - bucket[0]) / rate
+
+
+# --------------------------------------------------------------------------------
+# Middleware
+# --------------------------------------------------------------------------------
+
+def route_class(method: str, path: str) -> str:
+  if (method, path.rstrip('/')) in RESET_ROUTES:
+    return 'reset'
+  elif method in ('GET', 'HEAD', 'OPTIONS'):
+    return 'read'
+  else:
+    return 'write'
+
+
+def client_key(scope) -> str:
+  cookies = cookie_parser(Headers(scope=scope).get('cookie', ''))
+  username = deserialize_token(cookies[auth_cookie_name]) if auth_cookie_name in cookies else None
+  if username:
+    return f'user:{username}'
+
+  client = scope.get('client')
+  return f'addr:{client[0]}' if client else 'addr:unknown'
+
+
+class RateLimitMiddleware:
+
+  def __init__(
+    self,
+    app,
+    classes: Optional[Dict[str, Dict]] = None,
+    max_concurrent: int = 64,
+    queue_timeout: float = 0.5
+  ) -> None:
+    self.app = app
+    self.buckets = TokenBuckets({**DEFAULT_CLASSES, **(classes or {})})
+    self.queue_timeout = queue_timeout
+    self._slots = asyncio.Semaphore(max_concurrent)
+
+
+  async def _reject(self, send, status: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({'detail': detail}).encode('utf-8')
+    await send({
+      'type': 'http.response.start',
+      'status': status,
+      'headers': [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+        (b'retry-after', str(max(1, math.ceil(retry_after))).encode()),
+      ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+  async def __call__(self, scope, receive, send) -> None:
+    if scope['type'] != 'http' or scope['path'].startswith(EXEMPT_PREFIXES):
+      await self.app(scope, receive, send)
+      return
+
+    limited_class = route_class(scope['method'], scope['path'])
+    wait = self.buckets.take(client_key(scope), limited_class)
+    if wait:
+      rate_limited.inc((limited_class,))
+      await self._reject(send, 429, 'Too Many Requests', wait)
+      return
+
+    if scope['path'] in STREAMING_PATHS:
+      await self.app(scope, receive, send)
+      return
+
+    try:
+      await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+    except asyncio.TimeoutError:
+      load_shed.inc()
+      await self._reject(send, 503, 'Service Unavailable', 1)
+      return
+
+    requests_admitted.inc()
+    try:
+      await self.app(scope, receive, send)
+    finally:
+      requests_admitted.dec()
+      self._slots.release()
@@ -0,0 +1,254 @@
+"""
+This module handles recurring reminders.
+
+Recurrence rules use a subset of the iCalendar RRULE syntax:
+
+  FREQ=DAILY|WEEKLY|MONTHLY|YEARLY   how often the item repeats (required)
+  INTERVAL=n                         every n-th day, week, month or year
+  BYDAY=MO,WE,FR                     weekdays, for weekly rules
+  BYMONTHDAY=1,15,-1                 days of the month, for monthly rules (-1 is the last day)
+  UNTIL=2030-12-31T00:00:00          the last possible occurrence
+
+For example, "every Monday" is FREQ=WEEKLY;BYDAY=MO
+and "monthly on the 1st" is FREQ=MONTHLY;BYMONTHDAY=1.
+
+Occurrences are never stored. They are generated lazily,
+and a generator over a date window jumps straight to the window's first period,
+so a daily rule that runs for ten years costs nothing until a window of it is read.
+
+Times with and without a time zone can be mixed, like UNTIL=2030-12-31T00:00:00Z on an item due at a naive time.
+A naive time is the server's local time, as it is for the scheduler,
+and every time is compared in the representation of the item's due time.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import calendar
+import heapq
+import itertools
+
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+# Some rules can never match, like the 30th of every 12th month starting in February
+MAX_EMPTY_PERIODS = 400
+
+
+# --------------------------------------------------------------------------------
+# Time Zones
+# --------------------------------------------------------------------------------
+
+def as_like(value: Optional[datetime], like: datetime) -> Optional[datetime]:
+  """Expresses value the way like is: aware in like's time zone, or naive local time."""
+
+  if value is None or (value.tzinfo is None) == (like.tzinfo is None):
+    return value
+  if like.tzinfo is None:
+    return value.astimezone().replace(tzinfo=None)
+  # astimezone() reads a naive time as local time
+  return value.astimezone(like.tzinfo)
+
+
+# --------------------------------------------------------------------------------
+# RecurrenceRule Class
+# --------------------------------------------------------------------------------
+
+class RecurrenceRule:
+
+  def __init__(
+    self,
+    freq: str,
+    interval: int = 1,
+    by_day: Iterable[int] = (),
+    by_month_day: Iterable[int] = (),
+    until: Optional[datetime] = None
+  ) -> None:
+    self.freq = freq
+    self.interval = interval
+    self.by_day = sorted(set(by_day))
+    self.by_month_day = sorted(set(by_month_day))
+    self.until = until
+
+
+  # Parsing
+
+  @classmethod
+  def parse(cls, text: str) -> 'RecurrenceRule':
+    """Parses an RRULE string, raising ValueError for anything outside the supported subset."""
+
+    parts = {}
+    for part in text.strip().removeprefix('RRULE:').split(';'):
+      name, separator, value = part.partition('=')
+      if not separator or not value:
+        raise ValueError(f'Invalid recurrence rule part: {part!r}')
+      parts[name.strip().upper()] = value.strip().upper()
+
+    freq = parts.pop('FREQ', None)
+    if freq not in FREQUENCIES:
+      raise ValueError(f'FREQ must be one of {", ".join(FREQUENCIES)}')
+
+    interval = int(parts.pop('INTERVAL', '1'))
+    if interval < 1:
+      raise ValueError('INTERVAL must be at least 1')
+
+    by_day = []
+    if 'BYDAY' in parts:
+      if freq != 'WEEKLY':
+        raise ValueError('BYDAY is only supported for weekly rules')
+      for day in parts.pop('BYDAY').split(','):
+        if day not in WEEKDAYS:
+          raise ValueError(f'Invalid weekday: {day!r}')
+        by_day.append(WEEKDAYS.index(day))
+
+    by_month_day = []
+    if 'BYMONTHDAY' in parts:
+      if freq != 'MONTHLY':
+        raise ValueError('BYMONTHDAY is only supported for monthly rules')
+      for day in parts.pop('BYMONTHDAY').split(','):
+        month_day = int(day)
+        if month_day == 0 or not -31 <= month_day <= 31:
+          raise ValueError(f'Invalid day of the month: {day!r}')
+        by_month_day.append(month_day)
+
+    until = None
+    if 'UNTIL' in parts:
+      until = datetime.fromisoformat(parts.pop('UNTIL'))
+
+    if parts:
+      raise ValueError(f'Unsupported recurrence rule parts: {", ".join(sorted(parts))}')
+
+    return cls(freq, interval, by_day, by_month_day, until)
+
+
+  def __str__(self) -> str:
+    parts = [f'FREQ={self.freq}']
+    if self.interval != 1:
+      parts.append(f'INTERVAL={self.interval}')
+    if self.by_day:
+      parts.append('BYDAY=' + ','.join(WEEKDAYS[day] for day in self.by_day))
+    if self.by_month_day:
+      parts.append('BYMONTHDAY=' + ','.join(str(day) for day in self.by_month_day))
+    if self.until:
+      parts.append(f'UNTIL={self.until.isoformat()}')
+    return ';'.join(parts)
+
+
+  # Periods
+
+  def _first_period(self, dtstart: datetime, window_start: datetime) -> int:
+    # The index of the earliest period that can contain window_start
+    if window_start <= dtstart:
+      return 0
+
+    if self.freq == 'DAILY':
+      units = (window_start.date() - dtstart.date()).days
+    elif self.freq == 'WEEKLY':
+      units = (window_start.date() - dtstart.date() + timedelta(days=dtstart.weekday())).days // 7
+    elif self.freq == 'MONTHLY':
+      units = (window_start.year - dtstart.year) * 12 + window_start.month - dtstart.month
+    else:
+      units = window_start.year - dtstart.year
+
+    return max(0, units // self.interval)
+
+
+  def _period(self, dtstart: datetime, index: int) -> List[datetime]:
+    # Every candidate occurrence in one period, in order, before filtering by dtstart and UNTIL
+    step = index * self.interval
+
+    if self.freq == 'DAILY':
+      return [dtstart + timedelta(days=step)]
+
+    if self.freq == 'WEEKLY':
+      if not self.by_day:
+        return [dtstart + timedelta(weeks=step)]
+      monday = dtstart - timedelta(days=dtstart.weekday()) + timedelta(weeks=step)
+      return [monday + timedelta(days=day) for day in self.by_day]
+
+    if self.freq == 'MONTHLY':
+      year, month = divmod(dtstart.month - 1 + step, 12)
+      year, month = dtstart.year + year, month + 1
+      days_in_month = calendar.monthrange(year, month)[1]
+      month_days = self.by_month_day or [dtstart.day]
+      days = sorted({day if day > 0 else days_in_month + day + 1 for day in month_days})
+      return [dtstart.replace(year=year, month=month, day=day) for day in days if 1 <= day <= days_in_month]
+
+    year = dtstart.year + step
+    if dtstart.month == 2 and dtstart.day == 29 and not calendar.isleap(year):
+      return []
+    return [dtstart.replace(year=year)]
+
+
+  # Occurrences
+
+  def occurrences(
+    self,
+    dtstart: datetime,
+    window_start: Optional[datetime] = None,
+    window_end: Optional[datetime] = None
+  ) -> Iterator[datetime]:
+    """Lazily yields occurrences from dtstart on, limited to the window when one is given."""
+
+    window_start = as_like(window_start, dtstart) or dtstart
+    window_end = as_like(window_end, dtstart)
+    until = as_like(self.until, dtstart)
+    empty_periods = 0
+
+    for index in itertools.count(self._first_period(dtstart, window_start)):
+      candidates = self._period(dtstart, index)
+      empty_periods = 0 if candidates else empty_periods + 1
+      if empty_periods > MAX_EMPTY_PERIODS:
+        return
+
+      for occurrence in candidates:
+        if (window_end and occurrence > window_end) or (until and occurrence > until):
+          return
+        if occurrence >= dtstart and occurrence >= window_start:
+          yield occurrence
+
+
+  def next_after(self, dtstart: datetime, after: datetime) -> Optional[datetime]:
+    after = as_like(after, dtstart)
+    for occurrence in self.occurrences(dtstart, window_start=after):
+      if occurrence > after:
+        return occurrence
+    return None
+
+
+# --------------------------------------------------------------------------------
+# Windows Over Many Items
+# --------------------------------------------------------------------------------
+
+def occurrences_in_window(
+  items: Iterable,
+  window_start: datetime,
+  window_end: datetime
+) -> Iterator[Tuple[datetime, object]]:
+  """
+  Yields (time, item) pairs for every occurrence of every item inside the window, in time order.
+  Items without a recurrence contribute their due time once, if it falls in the window.
+  Times are expressed the way window_start is, so items with and without time zones merge.
+  """
+
+  window_end = as_like(window_end, window_start)
+
+  def one_item(item) -> Iterator[Tuple[datetime, object]]:
+    if item.due_at is None:
+      return
+    if item.recurrence:
+      for occurrence in RecurrenceRule.parse(item.recurrence).occurrences(item.due_at, window_start, window_end):
+        yield as_like(occurrence, window_start), item
+    elif window_start <= as_like(item.due_at, window_start) <= window_end:
+      yield as_like(item.due_at, window_start), item
+
+  return heapq.merge(*(one_item(item) for item in items), key=lambda pair: pair[0])
@@ -0,0 +1,36 @@
+"""
+This module provides a fast JSON response for models that storage has already validated.
+
+When a handler returns models, FastAPI validates them again against response_model,
+dumps them to plain Python objects, and only then encodes those with json.dumps.
+model_response() skips all of that and encodes the models in one pass
+with pydantic-core's Rust serializer, producing the same JSON.
+Routes keep their response_model, so the OpenAPI schema does not change.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import functools
+
+from fastapi import Response
+from pydantic import TypeAdapter
+from typing import Any
+
+
+# --------------------------------------------------------------------------------
+# Responses
+# --------------------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=None)
+def _adapter(model_type: Any) -> TypeAdapter:
+  # Building an adapter compiles a serializer, so each type only pays for that once
+  return TypeAdapter(model_type)
+
+
+def model_response(content: Any, model_type: Any, status_code: int = 200) -> Response:
+  """Encodes already-validated content of the given type straight to a JSON response."""
+
+  body = _adapter(model_type).dump_json(content)
+  return Response(body, status_code=status_code, media_type='application/json')
@@ -0,0 +1,345 @@
+"""
+This module schedules reminders and delivers them when they come due.
+
+Pending reminders live in a binary heap ordered by remind_at,
+so scheduling costs O(log n) and the next reminder is always at the top.
+Cancelling only marks the heap entry dead (O(1));
+dead entries are skipped when popped and swept out once they make up half the heap.
+At startup the heap is rebuilt from storage with one pass over the tables and a heapify.
+
+When a reminder fires, the item is read back from storage,
+so reminders for deleted, completed or rescheduled items are dropped instead of delivered.
+Delivery goes to every configured notifier: the log, a webhook URL, or server-sent events.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import time
+import urllib.request
+
+from app import config, db_path
+from app.utils.metrics import registry
+from app.utils.storage import BulkResult, PendingReminder, ReminderItem, ReminderStorage
+from datetime import datetime
+from fastapi import HTTPException
+from typing import Dict, Iterable, List, Optional, Set
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+logger = logging.getLogger('catty.scheduler')
+scheduler_config = config.get('scheduler', {})
+
+# Sleep in bounded steps, so a wall clock change is noticed within this many seconds
+MAX_SLEEP_SECONDS = 60.0
+
+# Sweeping dead entries is O(n), so it is not worth doing for small heaps
+COMPACT_MIN_DEAD = 1024
+
+reminders_fired = registry.counter(
+  'catty_reminders_fired_total',
+  'Due reminders by outcome (delivered, or skipped because the item changed).',
+  ('outcome',))
+
+notifier_errors = registry.counter(
+  'catty_reminder_notifier_errors_total',
+  'Reminder deliveries that raised, by notifier.',
+  ('notifier',))
+
+
+# --------------------------------------------------------------------------------
+# Notifiers
+# --------------------------------------------------------------------------------
+
+class LogNotifier:
+  name = 'log'
+
+  async def notify(self, event: Dict) -> None:
+    logger.info(f"Reminder for {event['owner']}: {event['description']}")
+
+
+class WebhookNotifier:
+  name = 'webhook'
+
+  def __init__(self, url: str, timeout: float = 5.0) -> None:
+    self.url = url
+    self.timeout = timeout
+
+
+  def _post(self, event: Dict) -> None:
+    request = urllib.request.Request(
+      self.url,
+      data=json.dumps(event).encode('utf-8'),
+      headers={'Content-Type': 'application/json'},
+      method='POST')
+    with urllib.request.urlopen(request, timeout=self.timeout):
+      pass
+
+
+  async def notify(self, event: Dict) -> None:
+    await asyncio.to_thread(self._post, event)
+
+
+class SSENotifier:
+  """Fans reminder events out to each owner's open server-sent event streams."""
+
+  name = 'sse'
+
+  def __init__(self, queue_size: int = 100) -> None:
+    self.queue_size = queue_size
+    self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+
+  def subscribe(self, owner: str) -> asyncio.Queue:
+    queue = asyncio.Queue(maxsize=self.queue_size)
+    self._subscribers.setdefault(owner, set()).add(queue)
+    return queue
+
+
+  def unsubscribe(self, owner: str, queue: asyncio.Queue) -> None:
+    queues = self._subscribers.get(owner)
+    if queues is not None:
+      queues.discard(queue)
+      if not queues:
+        del self._subscribers[owner]
+
+
+  async def notify(self, event: Dict) -> None:
+    for queue in list(self._subscribers.get(event['owner'], ())):
+      if not queue.full():
+        # A client that stopped reading loses events rather than holding memory
+        queue.put_nowait(event)
+
+
+sse_notifier = SSENotifier()
+
+
+def build_notifiers(notifier_config: Dict) -> List:
+  notifiers = []
+  for name in notifier_config.get('notifiers', ['log', 'sse']):
+    if name == 'log':
+      notifiers.append(LogNotifier())
+    elif name == 'webhook' and notifier_config.get('webhook_url'):
+      notifiers.append(WebhookNotifier(notifier_config['webhook_url']))
+    elif name == 'sse':
+      notifiers.append(sse_notifier)
+  return notifiers
+
+
+# --------------------------------------------------------------------------------
+# ReminderScheduler Class
+# --------------------------------------------------------------------------------
+
+class _Entry:
+  __slots__ = ('when', 'seq', 'item_id', 'owner', 'active')
+
+  def __init__(self, when: float, seq: int, item_id: int, owner: str) -> None:
+    self.when = when
+    self.seq = seq
+    self.item_id = item_id
+    self.owner = owner
+    self.active = True
+
+
+  def __lt__(self, other: '_Entry') -> bool:
+    return (self.when, self.seq) < (other.when, other.seq)
+
+
+class ReminderScheduler:
+
+  def __init__(self, notifiers: List, db_path: str, batch_size: int = 100) -> None:
+    self.notifiers = notifiers
+    self.db_path = db_path
+    self.batch_size = batch_size
+    self._heap: List[_Entry] = []
+    self._entries: Dict[int, _Entry] = {}
+    self._dead = 0
+    self._sequence = itertools.count()
+    self._wakeup = asyncio.Event()
+    self._task: Optional[asyncio.Task] = None
+
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+
+  # Heap Operations
+
+  def schedule(self, item_id: int, owner: str, remind_at: Optional[datetime]) -> None:
+    """Schedules, moves or (when remind_at is None) cancels the reminder for an item."""
+
+    self.cancel(item_id)
+    if remind_at is None:
+      return
+
+    entry = _Entry(remind_at.timestamp(), next(self._sequence), item_id, owner)
+    self._entries[item_id] = entry
+    heapq.heappush(self._heap, entry)
+
+    if self._heap[0] is entry:
+      self._wakeup.set()
+
+
+  def sync_item(self, owner: str, item: ReminderItem) -> None:
+    self.schedule(item.id, owner, None if item.completed else item.remind_at)
+
+
+  def sync_bulk(self, owner: str, result: BulkResult) -> None:
+    for item_id in result.deleted:
+      self.cancel(item_id)
+    for item_id, remind_at in result.reminders.items():
+      self.schedule(item_id, owner, remind_at)
+
+
+  def cancel(self, item_id: int) -> None:
+    entry = self._entries.pop(item_id, None)
+    if entry is None:
+      return
+
+    entry.active = False
+    self._dead += 1
+    if self._dead > COMPACT_MIN_DEAD and self._dead * 2 > len(self._heap):
+      self._compact()
+
+
+  def _compact(self) -> None:
+    self._heap = [entry for entry in self._heap if entry.active]
+    heapq.heapify(self._heap)
+    self._dead = 0
+
+
+  def _pop_due(self, now: float) -> List[_Entry]:
+    due = []
+    while self._heap and len(due) < self.batch_size and self._heap[0].when <= now:
+      entry = heapq.heappop(self._heap)
+      if entry.active:
+        del self._entries[entry.item_id]
+        due.append(entry)
+      else:
+        self._dead -= 1
+    return due
+
+
+  def _next_delay(self) -> float:
+    while self._heap and not self._heap[0].active:
+      heapq.heappop(self._heap)
+      self._dead -= 1
+
+    if not self._heap:
+      return MAX_SLEEP_SECONDS
+    return min(self._heap[0].when - time.time(), MAX_SLEEP_SECONDS)
+
+
+  # Rebuilding
+
+  def load(self, reminders: Iterable[PendingReminder]) -> None:
+    entries = {
+      reminder.item_id: _Entry(reminder.remind_at.timestamp(), next(self._sequence), reminder.item_id, reminder.owner)
+      for reminder in reminders}
+
+    # Anything scheduled while storage was being read is newer than what was read
+    entries.update(self._entries)
+
+    self._entries = entries
+    self._heap = list(entries.values())
+    heapq.heapify(self._heap)
+    self._dead = 0
+    self._wakeup.set()
+
+
+  async def rebuild(self) -> None:
+    start = time.perf_counter()
+    storage = ReminderStorage(owner='', db_path=self.db_path)
+    reminders = await asyncio.to_thread(storage.get_pending_reminders)
+    self.load(reminders)
+    logger.info(f'Loaded {len(self)} pending reminders in {time.perf_counter() - start:.3f} s')
+
+
+  # Delivery
+
+  def _read_item(self, entry: _Entry) -> Optional[ReminderItem]:
+    try:
+      return ReminderStorage(owner=entry.owner, db_path=self.db_path).get_item(entry.item_id)
+    except HTTPException:
+      return None
+
+
+  async def _fire(self, entry: _Entry) -> None:
+    item = await asyncio.to_thread(self._read_item, entry)
+    if item is None or item.completed or item.remind_at is None or item.remind_at.timestamp() != entry.when:
+      reminders_fired.inc(('skipped',))
+      return
+
+    event = {
+      'item_id': item.id,
+      'list_id': item.list_id,
+      'owner': entry.owner,
+      'description': item.description,
+      'due_at': item.due_at.isoformat() if item.due_at else None,
+      'remind_at': item.remind_at.isoformat(),
+    }
+
+    for notifier in self.notifiers:
+      try:
+        await notifier.notify(event)
+      except Exception:
+        notifier_errors.inc((notifier.name,))
+        logger.exception(f'The {notifier.name} notifier failed for item {item.id}')
+
+    reminders_fired.inc(('delivered',))
+
+
+  async def _run(self) -> None:
+    try:
+      await self.rebuild()
+    except Exception:
+      logger.exception('Could not load pending reminders from storage')
+
+    while True:
+      self._wakeup.clear()
+      delay = self._next_delay()
+      if delay > 0:
+        try:
+          await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+          pass
+        continue
+
+      due = self._pop_due(time.time())
+      await asyncio.gather(*(self._fire(entry) for entry in due))
+
+
+  # Lifecycle
+
+  def start(self) -> None:
+    self._task = asyncio.get_running_loop().create_task(self._run())
+
+
+  async def stop(self) -> None:
+    if self._task:
+      self._task.cancel()
+      try:
+        await self._task
+      except asyncio.CancelledError:
+        pass
+
+
+# --------------------------------------------------------------------------------
+# Shared Scheduler
+# --------------------------------------------------------------------------------
+
+reminder_scheduler = ReminderScheduler(build_notifiers(scheduler_config), db_path)
+
+registry.gauge(
+  'catty_reminders_pending',
+  'Reminders waiting in the scheduler.',
+  callback=lambda: {(): len(reminder_scheduler)})
@@ -0,0 +1,273 @@
+"""
+This module takes consistent point-in-time snapshots of the reminder database and restores them.
+
+Storage never modifies the database file in place: each write renames a new file over it.
+So whichever file is at the database path at a given moment is a complete, frozen version,
+and a snapshot only needs to grab that file. A hard link does that in O(1),
+and when hard links are not available, the open file is copied while writers carry on.
+
+A full snapshot stores that version as-is.
+An incremental snapshot stores only the documents added, changed or deleted
+since the previous snapshot, and restoring one replays the chain back to its full snapshot.
+
+Snapshots are taken in a separate, low-priority process when requested over HTTP,
+so diffing a large database does not compete with requests for the server's interpreter.
+
+Under the group and relaxed durability modes, a running server holds acknowledged commits
+that are not in the file yet, and only that server can flush them.
+So the server flushes before it starts a snapshot process, restores happen inside the server,
+and the command line asks the server at snapshots.server_url to do both whenever one is running.
+
+  python -m app.utils.snapshots create [--incremental]
+  python -m app.utils.snapshots list
+  python -m app.utils.snapshots restore SNAPSHOT_ID [--target PATH]
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from app import config, data_path, db_path
+from app.utils.admin import admin_header_name, serialize_admin_token
+from app.utils.durability import committer_for, flush, write_json_atomically
+from app.utils.exceptions import NotFoundException
+from app.utils.storage import working_set, write_lock
+from typing import Dict, List, Optional
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+snapshot_config = config.get('snapshots', {})
+
+FULL_SUFFIX = '.full.json'
+INCREMENTAL_SUFFIX = '.incr.json'
+
+
+# --------------------------------------------------------------------------------
+# Diffs
+# --------------------------------------------------------------------------------
+
+def diff_tables(old: Dict[str, Dict[str, dict]], new: Dict[str, Dict[str, dict]]) -> Dict[str, Dict]:
+  changes = {}
+  for name in set(old) | set(new):
+    old_table, new_table = old.get(name, {}), new.get(name, {})
+    upsert = {doc_id: doc for doc_id, doc in new_table.items() if old_table.get(doc_id) != doc}
+    delete = [doc_id for doc_id in old_table if doc_id not in new_table]
+    if upsert or delete:
+      changes[name] = {'upsert': upsert, 'delete': delete}
+  return changes
+
+
+def apply_changes(tables: Dict[str, Dict[str, dict]], changes: Dict[str, Dict]) -> None:
+  for name, change in changes.items():
+    table = tables.setdefault(name, {})
+    for doc_id in change['delete']:
+      table.pop(doc_id, None)
+    table.update(change['upsert'])
+
+
+# --------------------------------------------------------------------------------
+# SnapshotStore Class
+# --------------------------------------------------------------------------------
+
+class SnapshotStore:
+
+  def __init__(self, directory: str) -> None:
+    self.directory = directory
+
+
+  # Paths
+
+  def _path(self, snapshot_id: str) -> Optional[str]:
+    for suffix in (FULL_SUFFIX, INCREMENTAL_SUFFIX):
+      path = os.path.join(self.directory, snapshot_id + suffix)
+      if os.path.exists(path):
+        return path
+    return None
+
+
+  def list(self) -> List[Dict]:
+    """Lists snapshots, oldest first."""
+
+    if not os.path.isdir(self.directory):
+      return []
+
+    snapshots = []
+    for name in sorted(os.listdir(self.directory)):
+      for suffix, kind in ((FULL_SUFFIX, 'full'), (INCREMENTAL_SUFFIX, 'incremental')):
+        if name.endswith(suffix):
+          path = os.path.join(self.directory, name)
+          snapshots.append({'id': name[:-len(suffix)], 'kind': kind, 'size_bytes': os.path.getsize(path)})
+    return snapshots
+
+
+  # Capturing
+
+  def _capture(self, source_path: str, capture_path: str) -> None:
+    try:
+      os.link(source_path, capture_path)
+    except OSError:
+      # Copying from the open file still yields one version, even if a write replaces the path meanwhile
+      with open(source_path, 'rb') as source, open(capture_path, 'wb') as capture:
+        shutil.copyfileobj(source, capture, 1024 * 1024)
+
+
+  def create(self, source_path: str, incremental: bool = False, snapshot_id: Optional[str] = None) -> Dict:
+    os.makedirs(self.directory, exist_ok=True)
+    snapshot_id = snapshot_id or time.strftime('%Y%m%dT%H%M%S') + '-' + uuid.uuid4().hex[:6]
+    full_path = os.path.join(self.directory, snapshot_id + FULL_SUFFIX)
+
+    flush(source_path)
+    self._capture(source_path, full_path)
+    previous = [snapshot for snapshot in self.list() if snapshot['id'] != snapshot_id]
+    if not incremental or not previous:
+      return {'id': snapshot_id, 'kind': 'full', 'size_bytes': os.path.getsize(full_path)}
+
+    # Everything from here on reads the captured file, so the live database is not touched again
+    base_id = previous[-1]['id']
+    changes = diff_tables(self.materialize(base_id), _read_tables(full_path))
+    incremental_path = os.path.join(self.directory, snapshot_id + INCREMENTAL_SUFFIX)
+    write_json_atomically(incremental_path, {'base': base_id, 'changes': changes})
+    os.remove(full_path)
+
+    return {'id': snapshot_id, 'kind': 'incremental', 'base': base_id, 'size_bytes': os.path.getsize(incremental_path)}
+
+
+  # Restoring
+
+  def materialize(self, snapshot_id: str) -> Dict[str, Dict[str, dict]]:
+    """Rebuilds the database as of a snapshot by replaying its chain of incremental snapshots."""
+
+    chain = []
+    while True:
+      path = self._path(snapshot_id)
+      if path is None:
+        raise NotFoundException()
+      if path.endswith(FULL_SUFFIX):
+        tables = _read_tables(path)
+        break
+      with open(path) as snapshot_file:
+        incremental = json.load(snapshot_file)
+      chain.append(incremental['changes'])
+      snapshot_id = incremental['base']
+
+    for changes in reversed(chain):
+      apply_changes(tables, changes)
+    return tables
+
+
+  def restore(self, snapshot_id: str, target_path: str) -> None:
+    """Replaces the database with a snapshot as one commit, so staged commits cannot overwrite it later."""
+
+    tables = self.materialize(snapshot_id)
+    committer = committer_for(target_path)
+    with write_lock, committer.writing():
+      committer.commit(tables)
+      committer.flush()
+      working_set.invalidate(target_path)
+
+
+def _read_tables(path: str) -> Dict[str, Dict[str, dict]]:
+  with open(path) as db_file:
+    content = db_file.read()
+  return json.loads(content) if content.strip() else {}
+
+
+snapshot_store = SnapshotStore(data_path(snapshot_config.get('directory', 'snapshots')))
+
+
+# --------------------------------------------------------------------------------
+# Background Process
+# --------------------------------------------------------------------------------
+
+async def create_snapshot_in_subprocess(incremental: bool = False) -> Dict:
+  """Takes a snapshot in a niced child process, so a large diff does not slow down requests."""
+
+  # The child cannot see commits staged in this process, so they go to the file first
+  await asyncio.to_thread(flush, db_path)
+
+  command = [sys.executable, '-m', 'app.utils.snapshots', 'create', '--nice', '--local']
+  if incremental:
+    command.append('--incremental')
+
+  process = await asyncio.create_subprocess_exec(
+    *command,
+    stdout=asyncio.subprocess.PIPE,
+    stderr=asyncio.subprocess.PIPE)
+  stdout, stderr = await process.communicate()
+
+  if process.returncode != 0:
+    raise RuntimeError(f'Snapshot failed: {stderr.decode(errors="replace").strip()}')
+  return json.loads(stdout)
+
+
+# --------------------------------------------------------------------------------
+# Running Server
+# --------------------------------------------------------------------------------
+
+def _ask_server(url: str, path: str) -> Optional[Dict]:
+  """POSTs to the running server with a fresh admin token, or returns None if no server answers."""
+
+  request = urllib.request.Request(
+    url.rstrip('/') + path,
+    method='POST',
+    headers={admin_header_name: serialize_admin_token(60)})
+  try:
+    with urllib.request.urlopen(request, timeout=600) as response:
+      return json.load(response)
+  except urllib.error.HTTPError as e:
+    raise SystemExit(f'The server refused: {e.code} {e.read().decode(errors="replace")}')
+  except urllib.error.URLError:
+    return None
+
+
+# --------------------------------------------------------------------------------
+# Command Line
+# --------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Catty database snapshots')
+  subparsers = parser.add_subparsers(dest='command', required=True)
+
+  create_parser = subparsers.add_parser('create', help='Take a point-in-time snapshot')
+  create_parser.add_argument('--incremental', action='store_true', help='Store only changes since the previous snapshot')
+  create_parser.add_argument('--nice', action='store_true', help='Run at a lower CPU priority')
+  create_parser.add_argument('--local', action='store_true', help='Snapshot the file here, even if a server is running')
+
+  subparsers.add_parser('list', help='List snapshots, oldest first')
+
+  restore_parser = subparsers.add_parser('restore', help='Replace a database with a snapshot')
+  restore_parser.add_argument('snapshot_id', help='ID of the snapshot to restore')
+  restore_parser.add_argument('--target', default=db_path, help='Database file to overwrite')
+
+  parser.add_argument('--url', default=snapshot_config.get('server_url', 'http://127.0.0.1:8181'), help='Running server to ask first')
+  args = parser.parse_args()
+
+  if args.command == 'create':
+    result = None if args.local else _ask_server(args.url, '/snapshots' + ('?incremental=true' if args.incremental else ''))
+    if result is None:
+      if args.nice and hasattr(os, 'nice'):
+        os.nice(10)
+      result = snapshot_store.create(db_path, args.incremental)
+    print(json.dumps(result))
+  elif args.command == 'list':
+    for snapshot in snapshot_store.list():
+      print(f"{snapshot['id']}  {snapshot['kind']:<11}  {snapshot['size_bytes']} bytes")
+  elif args.command == 'restore':
+    # Only the live database needs the server, and no server means nothing is staged
+    if os.path.abspath(args.target) != os.path.abspath(db_path) or _ask_server(args.url, f'/snapshots/{args.snapshot_id}/restore') is None:
+      snapshot_store.restore(args.snapshot_id, args.target)
+    print(f'Restored {args.snapshot_id} to {args.target}')
@@ -6,12 +6,27 @@ This module handles the persistence layer (the "database") for the app.
 # Imports
 # --------------------------------------------------------------------------------
 
+from app import config
+from app.utils.durability import committer_for, flush_listeners, wait_for
 from app.utils.exceptions import NotFoundException, ForbiddenException
-
+from app.utils.metrics import registry, storage_operation
+from app.utils.ranks import item_order, rank_between, spread_ranks
+from app.utils.recurrence import RecurrenceRule
+from app.utils.timing import phase, record_rows_scanned
+
+import functools
+import json
+import os
+import threading
+
+from collections import OrderedDict
+from datetime import datetime, timezone
 from pydantic import BaseModel
 from tinydb import TinyDB, Query
-from tinydb.table import Document
-from typing import List, Optional
+from tinydb.queries import QueryLike
+from tinydb.storages import Storage
+from tinydb.table import Document, Table
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
 
 
 # --------------------------------------------------------------------------------
@@ -23,12 +38,18 @@ class ReminderItem(BaseModel):
   list_id: int
   description: str
   completed: bool
+  due_at: Optional[datetime] = None
+  remind_at: Optional[datetime] = None
+  recurrence: Optional[str] = None
+  rank: Optional[str] = None
 
 
 class ReminderList(BaseModel):
   id: int
   owner: str
   name: str
+  item_count: int = 0
+  completed_count: int = 0
 
 
 class SelectedList(BaseModel):
@@ -38,6 +59,417 @@ class SelectedList(BaseModel):
   items: List[ReminderItem]
 
 
+class BulkResult(NamedTuple):
+  changed: List[int]
+  deleted: List[int]
+  created: List[int]
+  # The reminder time each changed or created item should now have (None means no reminder)
+  reminders: Dict[int, Optional[datetime]]
+
+
+class PendingReminder(NamedTuple):
+  item_id: int
+  owner: str
+  remind_at: datetime
+
+
+def _to_json_time(value: Optional[datetime]) -> Optional[str]:
+  return value.isoformat() if value else None
+
+
+def _from_json_time(value: Optional[str]) -> Optional[datetime]:
+  return datetime.fromisoformat(value) if value else None
+
+
+# --------------------------------------------------------------------------------
+# Storage Backend
+# --------------------------------------------------------------------------------
+
+LISTS_TABLE = 'reminder_lists'
+ITEMS_TABLE = 'reminder_items'
+SELECTED_TABLE = 'selected_lists'
+
+# Serializes read-modify-write cycles on the database file within this process
+write_lock = threading.RLock()
+
+
+def file_version(path: str) -> Optional[Tuple[int, int, int]]:
+  """Identifies one version of the database file, which every atomic write replaces."""
+
+  try:
+    stat_result = os.stat(path)
+  except FileNotFoundError:
+    return None
+  return (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def data_version(path: str) -> Tuple[Optional[Tuple[int, int, int]], int]:
+  """Identifies one version of the data, including versions committed but not yet flushed to the file."""
+
+  return file_version(path), committer_for(path).generation
+
+
+class AtomicJSONStorage(Storage):
+  """
+  TinyDB storage that writes a complete new file and renames it over the old one.
+  Readers therefore always see a whole version of the database, never a half-written one,
+  and maintenance jobs can build a new version on the side and swap it in.
+  When the file is written depends on the durability mode (see app/utils/durability.py),
+  so writers call sync() once they release write_lock, to wait until their commit is durable.
+  """
+
+  def __init__(self, path: str, on_write: Optional[Callable[[], None]] = None) -> None:
+    self.path = path
+    self.on_write = on_write
+    self.committer = committer_for(path)
+    self._unsynced = 0
+
+
+  def read(self) -> Optional[Dict[str, Dict[str, Any]]]:
+    content = self.committer.read()
+    if content is None:
+      try:
+        with open(self.path) as db_file:
+          content = db_file.read()
+      except FileNotFoundError:
+        return None
+
+    # A missing or empty file is an empty database
+    return json.loads(content) if content.strip() else None
+
+
+  def write(self, data: Dict[str, Dict[str, Any]]) -> None:
+    self._unsynced = self.committer.commit(data)
+    if self.on_write:
+      self.on_write()
+
+
+  def sync(self) -> None:
+    generation, self._unsynced = self._unsynced, 0
+    if generation:
+      wait_for(self.committer, generation)
+
+
+class _LockedTable(Table):
+  """Table whose read-modify-write cycles cannot interleave with another thread's."""
+
+  def _update_table(self, updater: Callable[[Dict[int, Any]], None]) -> None:
+    with write_lock, self._storage.committer.writing():
+      super()._update_table(updater)
+    self._storage.sync()
+
+
+  def insert(self, document) -> int:
+    with write_lock, self._storage.committer.writing():
+      # Another instance may have inserted since this one cached its next document ID
+      self._next_id = None
+      doc_id = super().insert(document)
+    self._storage.sync()
+    return doc_id
+
+
+  def insert_multiple(self, documents) -> List[int]:
+    with write_lock, self._storage.committer.writing():
+      self._next_id = None
+      doc_ids = super().insert_multiple(documents)
+    self._storage.sync()
+    return doc_ids
+
+
+class _ReminderDB(TinyDB):
+  table_class = _LockedTable
+
+  def transact(self, updater: Callable[[Dict[str, Dict[str, dict]]], None]) -> None:
+    """
+    Applies changes to any number of tables in one read-modify-write, so they land in one file write.
+    The updater gets the raw tables, keyed by table name and then by document ID as a string.
+    """
+
+    with write_lock, self.storage.committer.writing():
+      tables = self.storage.read() or {}
+      updater(tables)
+      self.storage.write(tables)
+
+      for table in self._tables.values():
+        table.clear_cache()
+        table._next_id = None
+
+    self.storage.sync()
+
+
+def _next_doc_id(table: Dict[str, dict]) -> int:
+  return max((int(doc_id) for doc_id in table), default=0) + 1
+
+
+def _adjust_counts(lists: Dict[str, dict], list_id: int, items: int = 0, completed: int = 0) -> None:
+  # Lists from before the counters existed are left alone until the counters are rebuilt
+  reminder_list = lists.get(str(list_id))
+  if reminder_list is not None and 'item_count' in reminder_list:
+    reminder_list['item_count'] += items
+    reminder_list['completed_count'] += completed
+
+
+def _last_rank(items: Dict[str, dict], list_id: int) -> Optional[str]:
+  return max((item['rank'] for item in items.values() if item['list_id'] == list_id and item.get('rank')), default=None)
+
+
+def _rank_after(items: Dict[str, dict], list_id: int, rank: Optional[str]) -> str:
+  # Just after the given rank and ahead of the rest of the list, or at the end for an unranked item
+  if rank is None:
+    return rank_between(_last_rank(items, list_id), None)
+
+  following = min(
+    (item['rank'] for item in items.values() if item['list_id'] == list_id and (item.get('rank') or '') > rank),
+    default=None)
+  return rank_between(rank, following)
+
+
+# --------------------------------------------------------------------------------
+# Single-Flight Reads
+# --------------------------------------------------------------------------------
+
+class _Flight:
+  __slots__ = ('done', 'result', 'error')
+
+  def __init__(self) -> None:
+    self.done = threading.Event()
+    self.result = None
+    self.error: Optional[BaseException] = None
+
+
+_flights: Dict[tuple, _Flight] = {}
+_flights_lock = threading.Lock()
+single_flight_stats = registry.cache('storage_single_flight')
+
+
+def single_flight(func):
+  """
+  Lets concurrent identical reads share one computation.
+  Calls are identical when they have the same method, database, owner, arguments and data version,
+  so a read that starts after a write never receives a result computed before it.
+
+  Calls on the event loop thread run one at a time, so they never overlap to share anything.
+  Route handlers stay async, and hand the reads worth sharing to app.utils.profiling.to_thread.
+  Writes stay on the loop: write_lock serializes them against each other,
+  and the version in the key keeps a worker's read from outliving a write.
+  """
+
+  @functools.wraps(func)
+  def wrapper(self, *args):
+    key = (func.__name__, self._db_path, self.owner, args, data_version(self._db_path))
+
+    with _flights_lock:
+      flight = _flights.get(key)
+      leader = flight is None
+      if leader:
+        flight = _flights[key] = _Flight()
+
+    if not leader:
+      single_flight_stats.hit()
+      flight.done.wait()
+      if flight.error is not None:
+        raise flight.error
+      return flight.result
+
+    single_flight_stats.miss()
+    try:
+      flight.result = func(self, *args)
+      return flight.result
+    except BaseException as e:
+      flight.error = e
+      raise
+    finally:
+      with _flights_lock:
+        del _flights[key]
+      flight.done.set()
+
+  return wrapper
+
+
+# --------------------------------------------------------------------------------
+# Working Set
+# --------------------------------------------------------------------------------
+
+class _UserData(NamedTuple):
+  lists: Dict[int, ReminderList]
+  items: Dict[int, ReminderItem]
+  items_by_list: Dict[int, List[ReminderItem]]
+  selected_list_id: Optional[int]
+
+
+class _Resident(NamedTuple):
+  data: Any
+  size: int
+
+
+class WorkingSet:
+  """
+  Keeps recently active users' data in memory, evicting the least recently used past max_bytes.
+
+  Each user's data is paged in whole on first access and dropped when that user writes,
+  so the next read pages it in again. A write by anyone else leaves it alone,
+  because users never share documents. A database file changed by another process drops
+  every user of that file, and so does a write in this process that bypasses ReminderStorage
+  (compaction, a restore, a counter repair), which calls invalidate().
+  """
+
+  def __init__(self, max_bytes: int) -> None:
+    self.max_bytes = max_bytes
+    self.resident_bytes = 0
+    self._entries: 'OrderedDict[Tuple[str, str], _Resident]' = OrderedDict()
+    self._last_write: Dict[Tuple[str, str], int] = {}
+    self._loading = 0
+    self._versions: Dict[str, Any] = {}
+    self._epochs: Dict[str, int] = {}
+    self._sequence = 0
+    self._lock = threading.Lock()
+
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+
+  @property
+  def enabled(self) -> bool:
+    return self.max_bytes > 0
+
+
+  def _drop(self, key: Tuple[str, str]) -> None:
+    entry = self._entries.pop(key, None)
+    if entry is not None:
+      self.resident_bytes -= entry.size
+
+
+  def _drop_path(self, path: str) -> None:
+    for key in [key for key in self._entries if key[0] == path]:
+      self._drop(key)
+    # Loads already running may have read the old file, so they are not kept
+    self._epochs[path] = self._epochs.get(path, 0) + 1
+
+
+  def _check_version(self, path: str) -> None:
+    version = file_version(path)
+    if self._versions.get(path, version) != version:
+      self._drop_path(path)
+    self._versions[path] = version
+
+
+  def get(self, path: str, owner: str, load: Callable[[], Tuple[Any, int]]) -> Any:
+    """Returns the owner's resident data, paging it in with load() (which returns data and size) on a miss."""
+
+    key = (path, owner)
+    with self._lock:
+      self._check_version(path)
+      entry = self._entries.get(key)
+      if entry is not None:
+        self._entries.move_to_end(key)
+        working_set_stats.hit()
+        return entry.data
+      sequence, epoch = self._sequence, self._epochs.get(path, 0)
+      self._loading += 1
+
+    working_set_stats.miss()
+    try:
+      data, size = load()
+    except BaseException:
+      with self._lock:
+        self._finish_load()
+      raise
+
+    with self._lock:
+      # Data loaded across a write by this owner, or across an outside change, may already be stale
+      fresh = self._last_write.get(key, 0) <= sequence and self._epochs.get(path, 0) == epoch
+      self._finish_load()
+      if fresh and size <= self.max_bytes:
+        self._drop(key)
+        self._entries[key] = _Resident(data, size)
+        self.resident_bytes += size
+        while self.resident_bytes > self.max_bytes:
+          self._drop(next(iter(self._entries)))
+          working_set_evictions.inc()
+    return data
+
+
+  def _finish_load(self) -> None:
+    # Writes only need remembering while a load could have missed them
+    self._loading -= 1
+    if not self._loading:
+      self._last_write.clear()
+
+
+  def record_write(self, path: str, owner: str) -> None:
+    # Called under write_lock right after the file is replaced
+    with self._lock:
+      self._sequence += 1
+      if self._loading:
+        self._last_write[(path, owner)] = self._sequence
+      self._versions[path] = file_version(path)
+      self._drop((path, owner))
+
+
+  def record_flush(self, path: str) -> None:
+    # Flushes only write what record_write() has already accounted for
+    with self._lock:
+      self._versions[path] = file_version(path)
+
+
+  def invalidate(self, path: str) -> None:
+    """Drops every user of a database file, for writes that bypass ReminderStorage (restores, repairs, compaction)."""
+
+    with self._lock:
+      self._drop_path(path)
+      self._versions[path] = file_version(path)
+
+
+working_set_config = config.get('working_set', {})
+working_set = WorkingSet(int(working_set_config.get('max_megabytes', 64) * 1024 * 1024))
+working_set_stats = registry.cache('storage_working_set')
+flush_listeners.append(working_set.record_flush)
+
+working_set_evictions = registry.counter(
+  'catty_working_set_evictions_total',
+  'Users evicted from the in-memory working set to stay within its memory budget.')
+
+registry.gauge(
+  'catty_working_set_resident_bytes',
+  'Size of the users\' data held in the in-memory working set, measured as JSON.',
+  callback=lambda: {(): working_set.resident_bytes})
+
+registry.gauge(
+  'catty_working_set_users',
+  'Users whose data is held in the in-memory working set.',
+  callback=lambda: {(): len(working_set)})
+
+
+# --------------------------------------------------------------------------------
+# Scan Counting
+# --------------------------------------------------------------------------------
+
+class _ScanCounter:
+  """Wraps a TinyDB query to count the documents it is evaluated against."""
+
+  def __init__(self, cond: QueryLike) -> None:
+    self.cond = cond
+    self.rows = 0
+
+
+  def __call__(self, doc) -> bool:
+    self.rows += 1
+    return self.cond(doc)
+
+
+  def __hash__(self) -> int:
+    return hash(self.cond)
+
+
+  def __eq__(self, other) -> bool:
+    return isinstance(other, _ScanCounter) and self.cond == other.cond
+
+
+  def is_cacheable(self) -> bool:
+    return getattr(self.cond, 'is_cacheable', lambda: True)()
+
+
 # --------------------------------------------------------------------------------
 # ReminderStorage Class
 # --------------------------------------------------------------------------------
@@ -48,15 +480,54 @@ class ReminderStorage:
   def __init__(self, owner: str, db_path: str = 'reminder_db.json') -> None:
     self.owner = owner
     self._db_path = db_path
-    self._db = TinyDB(db_path)
-    self._lists_table = self._db.table('reminder_lists')
-    self._items_table = self._db.table('reminder_items')
-    self._selected_table = self._db.table('selected_lists')
+    self._db = _ReminderDB(
+      db_path,
+      storage=AtomicJSONStorage,
+      on_write=functools.partial(working_set.record_write, db_path, owner))
+    self._lists_table = self._db.table(LISTS_TABLE)
+    self._items_table = self._db.table(ITEMS_TABLE)
+    self._selected_table = self._db.table(SELECTED_TABLE)
 
 
   # Private Methods
 
+  def _search(self, table: Table, cond: QueryLike) -> List[Document]:
+    # Query cache hits in TinyDB skip evaluation, so they count zero rows
+    counter = _ScanCounter(cond)
+    documents = table.search(counter)
+    record_rows_scanned(counter.rows)
+    return documents
+
+
+  def _user_data(self) -> Optional[_UserData]:
+    if not working_set.enabled:
+      return None
+    return working_set.get(self._db_path, self.owner, self._load_user_data)
+
+
+  @single_flight
+  def _load_user_data(self) -> Tuple[_UserData, int]:
+    # Pages in everything the owner can see with one pass over the tables
+    tables = self._db.storage.read() or {}
+    raw_lists = {int(list_id): doc for list_id, doc in tables.get(LISTS_TABLE, {}).items() if doc['owner'] == self.owner}
+    raw_items = {int(item_id): doc for item_id, doc in tables.get(ITEMS_TABLE, {}).items() if doc['list_id'] in raw_lists}
+    selected_rows = [row for row in tables.get(SELECTED_TABLE, {}).values() if row['owner'] == self.owner]
+    record_rows_scanned(sum(len(table) for table in tables.values()))
+
+    with phase('validate'):
+      lists = {list_id: ReminderList(id=list_id, **doc) for list_id, doc in raw_lists.items()}
+      items = {item_id: ReminderItem(id=item_id, **doc) for item_id, doc in raw_items.items()}
+
+    items_by_list = {list_id: [] for list_id in lists}
+    for item in sorted(items.values(), key=lambda item: item_order(item.id, item.rank)):
+      items_by_list[item.list_id].append(item)
+
+    data = _UserData(lists, items, items_by_list, selected_rows[0]['list_id'] if selected_rows else None)
+    return data, len(json.dumps([raw_lists, raw_items, selected_rows]))
+
+
   def _get_raw_list(self, list_id: int) -> Document:
+    record_rows_scanned(1)
     reminder_list = self._lists_table.get(doc_id=list_id)
 
     if not reminder_list:
@@ -68,6 +539,7 @@ class ReminderStorage:
   
 
   def _get_raw_item(self, item_id: int) -> Document:
+    record_rows_scanned(1)
     item = self._items_table.get(doc_id=item_id)
     if not item:
       raise NotFoundException()
@@ -78,101 +550,354 @@ class ReminderStorage:
 
   def _verify_list_exists(self, list_id: int) -> None:
     # Just get the list and make sure no exceptions happen
-    self._get_raw_list(list_id)
+    user_data = self._user_data()
+    if not (user_data and list_id in user_data.lists):
+      self._get_raw_list(list_id)
   
 
   def _verify_item_exists(self, item_id: int) -> None:
     # Just get the item and make sure no exceptions happen
-    self._get_raw_item(item_id)
+    user_data = self._user_data()
+    if not (user_data and item_id in user_data.items):
+      self._get_raw_item(item_id)
+
+
+  # Health
+
+  @storage_operation('read')
+  def ping(self) -> int:
+    # Reads the lists table from the backend, which is enough to prove it is reachable
+    return len(self._lists_table)
 
 
   # Reminder Lists
 
+  @storage_operation('write')
   def create_list(self, name: str) -> int:
-    reminder_list = {'name': name, 'owner': self.owner}
+    reminder_list = {'name': name, 'owner': self.owner, 'item_count': 0, 'completed_count': 0}
     list_id = self._lists_table.insert(reminder_list)
     return list_id
   
 
+  @storage_operation('write')
   def delete_list(self, list_id: int) -> None:
     self._verify_list_exists(list_id)
-    self._lists_table.remove(doc_ids=[list_id])
-    self._items_table.remove(Query().list_id == list_id)
+
+    def updater(tables: Dict[str, Dict[str, dict]]) -> None:
+      tables.get(LISTS_TABLE, {}).pop(str(list_id), None)
+      items = tables.get(ITEMS_TABLE, {})
+      for item_id in [item_id for item_id, item in items.items() if item['list_id'] == list_id]:
+        del items[item_id]
+
+    self._db.transact(updater)
 
 
+  @storage_operation('write')
   def delete_lists(self) -> None:
     for rem_list in self.get_lists():
       self.delete_list(rem_list.id)
 
 
+  @storage_operation('read')
+  @single_flight
   def get_list(self, list_id: int) -> ReminderList:
+    user_data = self._user_data()
+    if user_data and list_id in user_data.lists:
+      return user_data.lists[list_id]
+
     reminder_list = self._get_raw_list(list_id)
     reminder_list['id'] = list_id
-    model = ReminderList(**reminder_list)
+    with phase('validate'):
+      model = ReminderList(**reminder_list)
     return model
 
 
+  @storage_operation('read')
+  @single_flight
   def get_lists(self) -> List[ReminderList]:
-    reminder_lists = self._lists_table.search(Query().owner == self.owner)
-    models = [ReminderList(id=rems.doc_id, **rems) for rems in reminder_lists]
+    user_data = self._user_data()
+    if user_data:
+      return list(user_data.lists.values())
+
+    reminder_lists = self._search(self._lists_table, Query().owner == self.owner)
+    with phase('validate'):
+      models = [ReminderList(id=rems.doc_id, **rems) for rems in reminder_lists]
     return models
   
 
+  @storage_operation('write')
   def update_list_name(self, list_id: int, new_name: str) -> None:
-    reminder_list = self._get_raw_list(list_id)
-    reminder_list['name'] = new_name
-    self._lists_table.update(reminder_list, doc_ids=[list_id])
+    self._verify_list_exists(list_id)
+    self._lists_table.update({'name': new_name}, doc_ids=[list_id])
   
 
   # Reminder Items
 
-  def add_item(self, list_id: int, description: str) -> int:
+  @storage_operation('write')
+  def add_item(
+    self,
+    list_id: int,
+    description: str,
+    due_at: Optional[datetime] = None,
+    remind_at: Optional[datetime] = None,
+    recurrence: Optional[str] = None
+  ) -> int:
     reminder_item = {
       'list_id': list_id,
       'description': description,
       'completed': False,
+      'due_at': _to_json_time(due_at),
+      'remind_at': _to_json_time(remind_at),
+      'recurrence': recurrence,
     }
 
     self._verify_list_exists(list_id)
-    item_id = self._items_table.insert(reminder_item)
+    item_id = None
+
+    def updater(tables: Dict[str, Dict[str, dict]]) -> None:
+      nonlocal item_id
+      items = tables.setdefault(ITEMS_TABLE, {})
+      item_id = _next_doc_id(items)
+      reminder_item['rank'] = rank_between(_last_rank(items, list_id), None)
+      items[str(item_id)] = reminder_item
+      _adjust_counts(tables.get(LISTS_TABLE, {}), list_id, items=1)
+
+    self._db.transact(updater)
     return item_id
   
 
+  @storage_operation('write')
   def delete_item(self, item_id: int) -> None:
     self._verify_item_exists(item_id)
-    self._items_table.remove(doc_ids=[item_id])
 
+    def updater(tables: Dict[str, Dict[str, dict]]) -> None:
+      item = tables.get(ITEMS_TABLE, {}).pop(str(item_id), None)
+      if item is not None:
+        _adjust_counts(tables.get(LISTS_TABLE, {}), item['list_id'], items=-1, completed=-int(item['completed']))
 
+    self._db.transact(updater)
+
+
+  @storage_operation('read')
+  @single_flight
   def get_item(self, item_id: int) -> ReminderItem:
+    user_data = self._user_data()
+    if user_data and item_id in user_data.items:
+      return user_data.items[item_id]
+
     item = self._get_raw_item(item_id)
     item['id'] = item_id
-    model = ReminderItem(**item)
+    with phase('validate'):
+      model = ReminderItem(**item)
     return model
 
 
+  @storage_operation('read')
+  @single_flight
   def get_items(self, list_id: int) -> List[ReminderItem]:
+    user_data = self._user_data()
+    if user_data and list_id in user_data.lists:
+      return list(user_data.items_by_list[list_id])
+
     self._verify_list_exists(list_id)
-    items = self._items_table.search(Query().list_id == list_id)
-    models = [ReminderItem(id=item.doc_id, ** item) for item in items]
-    return models
+    items = self._search(self._items_table, Query().list_id == list_id)
+    with phase('validate'):
+      models = [ReminderItem(id=item.doc_id, ** item) for item in items]
+    return sorted(models, key=lambda item: item_order(item.id, item.rank))
   
 
-  def strike_item(self, item_id: int) -> None:
-    item = self._get_raw_item(item_id)
-    item['completed'] = not item['completed']
-    self._items_table.update(item, doc_ids=[item_id])
-  
+  def _next_occurrence(self, item: Document) -> Optional[dict]:
+    # Due time anchors the series, and the reminder keeps its offset from it
+    anchor = item.get('due_at') or item.get('remind_at')
+    if not item.get('recurrence') or not anchor:
+      return None
+
+    anchor = datetime.fromisoformat(anchor)
+    now = datetime.now(timezone.utc) if anchor.tzinfo else datetime.now()
+    next_at = RecurrenceRule.parse(item['recurrence']).next_after(anchor, max(anchor, now))
+    if next_at is None:
+      return None
+
+    shift = next_at - anchor
+    return {
+      'list_id': item['list_id'],
+      'description': item['description'],
+      'completed': False,
+      'due_at': _to_json_time(datetime.fromisoformat(item['due_at']) + shift) if item.get('due_at') else None,
+      'remind_at': _to_json_time(datetime.fromisoformat(item['remind_at']) + shift) if item.get('remind_at') else None,
+      'recurrence': item['recurrence'],
+    }
+
+
+  @storage_operation('write')
+  def strike_item(self, item_id: int) -> Optional[int]:
+    """Toggles an item, and returns the ID of the next occurrence if completing it created one."""
+
+    self._verify_item_exists(item_id)
+    result = self._bulk_items('toggle', lambda items, owned_lists: [item_id])
+    return result.created[0] if result.created else None
+
 
+  @storage_operation('write')
   def update_item_description(self, item_id: int, new_description: str) -> None:
-    item = self._get_raw_item(item_id)
-    item['description'] = new_description
-    self._items_table.update(item, doc_ids=[item_id])
+    self._verify_item_exists(item_id)
+    self._items_table.update({'description': new_description}, doc_ids=[item_id])
+
+
+  @storage_operation('write')
+  def update_item_schedule(
+    self,
+    item_id: int,
+    due_at: Optional[datetime],
+    remind_at: Optional[datetime],
+    recurrence: Optional[str] = None
+  ) -> None:
+    self._verify_item_exists(item_id)
+    self._items_table.update({
+      'due_at': _to_json_time(due_at),
+      'remind_at': _to_json_time(remind_at),
+      'recurrence': recurrence,
+    }, doc_ids=[item_id])
+
+
+  @storage_operation('write')
+  def move_item(self, item_id: int, after_id: Optional[int] = None) -> None:
+    """Moves an item to just after another item in its list, or to the top when after_id is None."""
+
+    self._verify_item_exists(item_id)
+
+    def updater(tables: Dict[str, Dict[str, dict]]) -> None:
+      items = tables.get(ITEMS_TABLE, {})
+      item = items[str(item_id)]
+
+      # Only this list is read, already in order, and transact's locks keep it the version in tables
+      siblings = [other for other in self.get_items(item['list_id']) if other.id != item_id]
+      sibling_ids = [other.id for other in siblings]
+      if after_id is not None and after_id not in sibling_ids:
+        raise NotFoundException()
+
+      # Lists from before ranks existed are ranked once, in their current order, on their first move
+      ranks = [other.rank for other in siblings]
+      if None in ranks:
+        ranks = spread_ranks(len(siblings))
+        for other_id, rank in zip(sibling_ids, ranks):
+          items[str(other_id)]['rank'] = rank
+
+      position = 0 if after_id is None else sibling_ids.index(after_id) + 1
+      before = ranks[position - 1] if position > 0 else None
+      after = ranks[position] if position < len(ranks) else None
+      item['rank'] = rank_between(before, after)
+
+    self._db.transact(updater)
+
+
+  # Scheduling
+
+  @storage_operation('read')
+  def get_pending_reminders(self) -> List[PendingReminder]:
+    # Spans every owner, so the scheduler can rebuild itself with one pass over each table
+    owners = {reminder_list.doc_id: reminder_list['owner'] for reminder_list in self._lists_table.all()}
+    items = self._items_table.all()
+    record_rows_scanned(len(owners) + len(items))
+
+    pending = []
+    for item in items:
+      owner = owners.get(item['list_id'])
+      if owner is not None and item.get('remind_at') and not item['completed']:
+        pending.append(PendingReminder(item.doc_id, owner, datetime.fromisoformat(item['remind_at'])))
+    return pending
+
+
+  # Bulk Item Operations
+
+  def _bulk_items(self, action: str, choose: Callable[[Dict[str, dict], set], List[int]]) -> BulkResult:
+    # Applies "complete", "incomplete", "toggle" or "delete" to the items choose() picks, in one write
+    owned_lists = {doc.doc_id for doc in self._search(self._lists_table, Query().owner == self.owner)}
+    result = BulkResult([], [], [], {})
+
+    def updater(tables: Dict[str, Dict[str, dict]]) -> None:
+      items = tables.setdefault(ITEMS_TABLE, {})
+      lists = tables.get(LISTS_TABLE, {})
+      record_rows_scanned(len(items))
+      next_id = _next_doc_id(items)
+
+      for item_id in choose(items, owned_lists):
+        item = items[str(item_id)]
+        if action == 'delete':
+          del items[str(item_id)]
+          _adjust_counts(lists, item['list_id'], items=-1, completed=-int(item['completed']))
+          result.deleted.append(item_id)
+          continue
+
+        completed = not item['completed'] if action == 'toggle' else action == 'complete'
+        if item['completed'] == completed:
+          continue
+
+        item['completed'] = completed
+        _adjust_counts(lists, item['list_id'], completed=1 if completed else -1)
+        result.changed.append(item_id)
+        result.reminders[item_id] = _from_json_time(item.get('remind_at')) if not completed else None
+
+        if completed and str(item.get('next_occurrence_id')) not in items:
+          next_item = self._next_occurrence(item)
+          if next_item is not None:
+            next_item['rank'] = _rank_after(items, item['list_id'], item.get('rank'))
+            items[str(next_id)] = next_item
+            item['next_occurrence_id'] = next_id
+            _adjust_counts(lists, item['list_id'], items=1)
+            result.created.append(next_id)
+            result.reminders[next_id] = _from_json_time(next_item['remind_at'])
+            next_id += 1
+
+    self._db.transact(updater)
+    return result
+
+
+  @storage_operation('write')
+  def set_list_completed(self, list_id: int, completed: bool) -> BulkResult:
+    self._verify_list_exists(list_id)
+
+    def choose(items: Dict[str, dict], owned_lists: set) -> List[int]:
+      return [int(item_id) for item_id, item in items.items() if item['list_id'] == list_id]
+
+    return self._bulk_items('complete' if completed else 'incomplete', choose)
+
+
+  @storage_operation('write')
+  def delete_completed_items(self, list_id: int) -> BulkResult:
+    self._verify_list_exists(list_id)
+
+    def choose(items: Dict[str, dict], owned_lists: set) -> List[int]:
+      return [int(item_id) for item_id, item in items.items() if item['list_id'] == list_id and item['completed']]
+
+    return self._bulk_items('delete', choose)
+
+
+  @storage_operation('write')
+  def update_items(self, item_ids: List[int], action: str) -> BulkResult:
+    """Completes, uncompletes or deletes the given items together, or none of them if any is missing."""
+
+    def choose(items: Dict[str, dict], owned_lists: set) -> List[int]:
+      for item_id in item_ids:
+        if str(item_id) not in items:
+          raise NotFoundException()
+        elif items[str(item_id)]['list_id'] not in owned_lists:
+          raise ForbiddenException()
+      return list(dict.fromkeys(item_ids))
+
+    return self._bulk_items(action, choose)
 
 
   # Selected Lists
 
+  @storage_operation('read')
+  @single_flight
   def get_selected_list_id(self) -> Optional[int]:
-    selected_list = self._selected_table.search(Query().owner == self.owner)
+    user_data = self._user_data()
+    if user_data:
+      return user_data.selected_list_id
+
+    selected_list = self._search(self._selected_table, Query().owner == self.owner)
     if not selected_list:
       return None
     
@@ -180,6 +905,7 @@ class ReminderStorage:
     return list_id
 
 
+  @storage_operation('read')
   def get_selected_list(self) -> Optional[SelectedList]:
     list_id = self.get_selected_list_id()
     if list_id is None:
@@ -199,8 +925,9 @@ class ReminderStorage:
       items=reminder_items)
 
 
+  @storage_operation('write')
   def set_selected_list(self, list_id: Optional[int]) -> None:
-    selected_list = self._selected_table.search(Query().owner == self.owner)
+    selected_list = self._search(self._selected_table, Query().owner == self.owner)
 
     if selected_list:
       self._selected_table.update({'list_id': list_id}, Query().owner == self.owner)
@@ -208,8 +935,9 @@ class ReminderStorage:
       self._selected_table.insert({'owner': self.owner, 'list_id': list_id})
 
 
+  @storage_operation('write')
   def reset_selected_after_delete(self, deleted_id: int) -> None:
-    selected_list = self._selected_table.search(Query().owner == self.owner)
+    selected_list = self._search(self._selected_table, Query().owner == self.owner)
 
     if selected_list and selected_list[0]['list_id'] == deleted_id:
       reminder_lists = self._lists_table.all()
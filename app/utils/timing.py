@@ -0,0 +1,188 @@
+"""
+This module provides per-request timing and storage I/O accounting.
+
+Each request gets a RequestTiming object in a context variable.
+Auth, storage, model validation and template rendering add their time and counts to it,
+and the middleware reports the totals in a Server-Timing response header.
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import json
+import logging
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi.templating import Jinja2Templates
+from typing import Dict, Optional
+
+
+# --------------------------------------------------------------------------------
+# Globals
+# --------------------------------------------------------------------------------
+
+logger = logging.getLogger('catty.timing')
+
+_current_timing: ContextVar[Optional['RequestTiming']] = ContextVar('catty_request_timing', default=None)
+
+
+# --------------------------------------------------------------------------------
+# RequestTiming Class
+# --------------------------------------------------------------------------------
+
+class RequestTiming:
+
+  def __init__(self) -> None:
+    self.start = time.perf_counter()
+    self.phases: Dict[str, float] = {}
+    self.storage_calls: Dict[str, int] = {}
+    self.reads = 0
+    self.writes = 0
+    self.rows_scanned = 0
+    self._storage_depth = 0
+
+
+  def add(self, phase: str, seconds: float) -> None:
+    self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+  def elapsed(self) -> float:
+    return time.perf_counter() - self.start
+
+
+  def header_value(self) -> str:
+    entries = []
+    for name, seconds in self.phases.items():
+      entry = f'{name};dur={seconds * 1000:.2f}'
+      if name == 'storage':
+        calls = sum(self.storage_calls.values())
+        entry += f';desc="calls={calls} reads={self.reads} writes={self.writes} rows={self.rows_scanned}"'
+      entries.append(entry)
+    entries.append(f'total;dur={self.elapsed() * 1000:.2f}')
+    return ', '.join(entries)
+
+
+  def as_log_record(self, method: str, path: str, status_code: int) -> dict:
+    return {
+      'method': method,
+      'path': path,
+      'status': status_code,
+      'total_ms': round(self.elapsed() * 1000, 3),
+      'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()},
+      'storage_calls': self.storage_calls,
+      'reads': self.reads,
+      'writes': self.writes,
+      'rows_scanned': self.rows_scanned,
+    }
+
+
+# --------------------------------------------------------------------------------
+# Recording Functions
+# --------------------------------------------------------------------------------
+
+def current_timing() -> Optional[RequestTiming]:
+  return _current_timing.get()
+
+
+@contextmanager
+def phase(name: str):
+  """Adds the time spent inside the block to the current request's phase."""
+
+  timing = _current_timing.get()
+  if timing is None:
+    yield
+    return
+
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    timing.add(name, time.perf_counter() - start)
+
+
+@contextmanager
+def storage_call(method: str, kind: str):
+  """Records one ReminderStorage call, timing only the outermost call of a nested chain."""
+
+  timing = _current_timing.get()
+  if timing is None:
+    yield
+    return
+
+  timing.storage_calls[method] = timing.storage_calls.get(method, 0) + 1
+  if kind == 'write':
+    timing.writes += 1
+  else:
+    timing.reads += 1
+
+  timing._storage_depth += 1
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    timing._storage_depth -= 1
+    if timing._storage_depth == 0:
+      timing.add('storage', time.perf_counter() - start)
+
+
+def record_rows_scanned(rows: int) -> None:
+  timing = _current_timing.get()
+  if timing is not None:
+    timing.rows_scanned += rows
+
+
+# --------------------------------------------------------------------------------
+# Templates
+# --------------------------------------------------------------------------------
+
+class TimedJinja2Templates(Jinja2Templates):
+  """Jinja2Templates that adds rendering time to the current request's "render" phase."""
+
+  def TemplateResponse(self, *args, **kwargs):
+    with phase('render'):
+      return super().TemplateResponse(*args, **kwargs)
+
+
+# --------------------------------------------------------------------------------
+# Middleware
+# --------------------------------------------------------------------------------
+
+class ServerTimingMiddleware:
+
+  def __init__(self, app, log_requests: bool = False) -> None:
+    self.app = app
+    self.log_requests = log_requests
+
+    if log_requests and not logger.handlers:
+      logger.addHandler(logging.StreamHandler())
+      logger.setLevel(logging.INFO)
+
+
+  async def __call__(self, scope, receive, send) -> None:
+    if scope['type'] != 'http':
+      await self.app(scope, receive, send)
+      return
+
+    timing = RequestTiming()
+    token = _current_timing.set(timing)
+    status_code = 500
+
+    async def send_wrapper(message):
+      nonlocal status_code
+      if message['type'] == 'http.response.start':
+        status_code = message['status']
+        headers = list(message.get('headers', []))
+        headers.append((b'server-timing', timing.header_value().encode('latin-1')))
+        message = {**message, 'headers': headers}
+      await send(message)
+
+    try:
+      await self.app(scope, receive, send_wrapper)
+    finally:
+      _current_timing.reset(token)
+      if self.log_requests:
+        record = timing.as_log_record(scope['method'], scope['path'], status_code)
+        logger.info(json.dumps(record))
@@ -0,0 +1,97 @@
+"""
+This module benchmarks dynamic response compression on typical payloads.
+
+It renders reminders grids and item JSON arrays of several sizes,
+then reports the bytes saved and the CPU time per response for each codec and level.
+
+Run it from the repository root:
+
+  python -m benchmarks.bench_compression
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import json
+import time
+
+from app import templates
+from app.main import app  # Registers template globals like static_url
+from app.utils.compression import available_encodings, make_compressor
+from app.utils.storage import ReminderItem, ReminderList, SelectedList
+
+
+# --------------------------------------------------------------------------------
+# Payloads
+# --------------------------------------------------------------------------------
+
+def build_grid(item_count: int) -> bytes:
+  reminder_lists = [ReminderList(id=i, owner='heisenberg', name=f'List {i}') for i in range(1, 11)]
+  items = [
+    ReminderItem(id=i, list_id=1, description=f'Reminder number {i}', completed=i % 3 == 0)
+    for i in range(1, item_count + 1)]
+  selected_list = SelectedList(id=1, owner='heisenberg', name='List 1', items=items)
+
+  template = templates.get_template('partials/reminders/content.html')
+  html = template.render(reminder_lists=reminder_lists, selected_list=selected_list)
+  return html.encode('utf-8')
+
+
+def build_items_json(item_count: int) -> bytes:
+  items = [
+    ReminderItem(id=i, list_id=1, description=f'Reminder number {i}', completed=i % 3 == 0).model_dump()
+    for i in range(1, item_count + 1)]
+  return json.dumps(items).encode('utf-8')
+
+
+# --------------------------------------------------------------------------------
+# Benchmark
+# --------------------------------------------------------------------------------
+
+LEVELS = {
+  'gzip': [1, 5, 9],
+  'br': [1, 4, 11],
+  'zstd': [1, 3, 9],
+}
+
+
+def measure(payload: bytes, encoding: str, level: int, budget: float = 0.5):
+  levels = {'gzip': 5, 'br': 4, 'zstd': 3}
+  levels[encoding] = level
+
+  rounds = 0
+  start = time.perf_counter()
+  while rounds < 3 or time.perf_counter() - start < budget:
+    compressor = make_compressor(encoding, levels)
+    compressed = compressor.compress(payload) + compressor.finish()
+    rounds += 1
+  elapsed = (time.perf_counter() - start) / rounds
+
+  return len(compressed), elapsed
+
+
+def main() -> None:
+  payloads = [
+    ('grid, 10 items', build_grid(10)),
+    ('grid, 100 items', build_grid(100)),
+    ('grid, 1000 items', build_grid(1000)),
+    ('items JSON, 100', build_items_json(100)),
+    ('items JSON, 1000', build_items_json(1000)),
+    ('items JSON, 10000', build_items_json(10000)),
+  ]
+
+  print(f'{"payload":<20} {"codec":<8} {"bytes":>10} {"saved":>7} {"ms/resp":>9} {"MB/s":>8}')
+  for name, payload in payloads:
+    print(f'{name:<20} {"identity":<8} {len(payload):>10} {"-":>7} {"-":>9} {"-":>8}')
+    for encoding in available_encodings():
+      for level in LEVELS[encoding]:
+        size, elapsed = measure(payload, encoding, level)
+        saved = 1 - size / len(payload)
+        throughput = len(payload) / elapsed / 1_000_000
+        codec = f'{encoding}-{level}'
+        print(f'{"":<20} {codec:<8} {size:>10} {saved:>7.1%} {elapsed * 1000:>9.3f} {throughput:>8.1f}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,79 @@
+"""
+This module benchmarks write throughput under each durability mode.
+
+For every mode and several numbers of concurrent writers,
+it adds reminder items to a fresh database for a fixed time,
+then reports acknowledged commits per second, flushes (fsyncs) per second,
+and how many commits each flush carried on average.
+
+Run it from the repository root:
+
+  python -m benchmarks.bench_durability
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import os
+import tempfile
+import threading
+import time
+
+from app.utils.durability import Committer, committers, storage_flushes
+from app.utils.storage import ReminderStorage
+
+
+# --------------------------------------------------------------------------------
+# Benchmark
+# --------------------------------------------------------------------------------
+
+MODES = ['strict', 'group', 'relaxed']
+WRITERS = [1, 4, 16]
+
+
+def measure(mode: str, writers: int, directory: str, duration: float = 2.0):
+  path = os.path.join(directory, f'{mode}-{writers}.json')
+  committer = committers[path] = Committer(path, mode, group_window=0.005, flush_interval=1.0)
+
+  # Ten lists with a few hundred items each, so every commit rewrites a realistic file
+  storage = ReminderStorage(owner='bench', db_path=path)
+  list_ids = [storage.create_list(f'List {i}') for i in range(10)]
+  for i in range(300):
+    storage.add_item(list_ids[i % 10], f'Seed item {i}')
+  committer.flush()
+
+  start_generation = committer.generation
+  start_flushes = storage_flushes._values.get((mode,), 0)
+  deadline = time.perf_counter() + duration
+
+  def writer(index: int) -> None:
+    writer_storage = ReminderStorage(owner='bench', db_path=path)
+    while time.perf_counter() < deadline:
+      writer_storage.add_item(list_ids[index % 10], 'Benchmark item')
+
+  start = time.perf_counter()
+  threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.perf_counter() - start
+
+  committer.flush()
+  commits = committer.generation - start_generation
+  flushes = storage_flushes._values.get((mode,), 0) - start_flushes
+  return commits / elapsed, flushes / elapsed, commits / max(1, flushes)
+
+
+def main() -> None:
+  print(f'{"mode":<8} {"writers":>7} {"commits/s":>10} {"fsyncs/s":>9} {"commits/fsync":>14}')
+  with tempfile.TemporaryDirectory() as directory:
+    for mode in MODES:
+      for writers in WRITERS:
+        commit_rate, flush_rate, per_flush = measure(mode, writers, directory)
+        print(f'{mode:<8} {writers:>7} {commit_rate:>10.0f} {flush_rate:>9.1f} {per_flush:>14.1f}')
+
+
+if __name__ == '__main__':
+  main()
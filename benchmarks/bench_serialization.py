@@ -0,0 +1,106 @@
+"""
+This module benchmarks how API responses are serialized for large lists of items.
+
+It encodes lists of 100 to 10,000 reminder items the way FastAPI does for a response_model,
+then with model_response(), and with orjson when it is installed,
+and reports the time per response and whether the bytes match.
+
+Run it from the repository root:
+
+  python -m benchmarks.bench_serialization
+"""
+
+# --------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------
+
+import asyncio
+import json
+import time
+
+from app.utils.responses import model_response
+from app.utils.storage import ReminderItem
+from datetime import datetime, timedelta, timezone
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from typing import Callable, List
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+
+# --------------------------------------------------------------------------------
+# Payloads
+# --------------------------------------------------------------------------------
+
+def build_items(item_count: int) -> List[ReminderItem]:
+  start = datetime(2030, 1, 1, 9, 0, tzinfo=timezone.utc)
+  return [
+    ReminderItem(
+      id=i,
+      list_id=1,
+      description=f'Reminder number {i}',
+      completed=i % 3 == 0,
+      due_at=start + timedelta(hours=i) if i % 2 else None,
+      recurrence='FREQ=WEEKLY' if i % 5 == 0 else None)
+    for i in range(1, item_count + 1)]
+
+
+# --------------------------------------------------------------------------------
+# Encoders
+# --------------------------------------------------------------------------------
+
+response_field = create_response_field('Response_items', List[ReminderItem], mode='serialization')
+loop = asyncio.new_event_loop()
+
+
+def encode_fastapi(items: List[ReminderItem]) -> bytes:
+  # What a route does when a handler returns models and declares response_model
+  content = loop.run_until_complete(serialize_response(field=response_field, response_content=items))
+  return JSONResponse(content).body
+
+
+def encode_model_response(items: List[ReminderItem]) -> bytes:
+  return model_response(items, List[ReminderItem]).body
+
+
+def encode_orjson(items: List[ReminderItem]) -> bytes:
+  return orjson.dumps([item.model_dump(mode='json') for item in items])
+
+
+# --------------------------------------------------------------------------------
+# Benchmark
+# --------------------------------------------------------------------------------
+
+def measure(encode: Callable, items: List[ReminderItem], budget: float = 1.0):
+  rounds = 0
+  start = time.perf_counter()
+  while rounds < 3 or time.perf_counter() - start < budget:
+    body = encode(items)
+    rounds += 1
+  return body, (time.perf_counter() - start) / rounds
+
+
+def main() -> None:
+  encoders = [('fastapi', encode_fastapi), ('model_response', encode_model_response)]
+  if orjson:
+    encoders.append(('orjson', encode_orjson))
+
+  print(f'{"items":>6} {"encoder":<15} {"bytes":>10} {"ms/resp":>9} {"speedup":>8} {"same JSON":>10}')
+  for item_count in (100, 1000, 10000):
+    items = build_items(item_count)
+    baseline_body = baseline = None
+
+    for name, encode in encoders:
+      body, elapsed = measure(encode, items)
+      if baseline is None:
+        baseline_body, baseline = body, elapsed
+      same = json.loads(body) == json.loads(baseline_body)
+      print(f'{item_count:>6} {name:<15} {len(body):>10} {elapsed * 1000:>9.3f} {baseline / elapsed:>7.1f}x {str(same):>10}')
+
+
+if __name__ == '__main__':
+  main()
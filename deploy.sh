@@ -5,6 +5,21 @@ APP_DIR="/home/vboxuser/Desktop/DevOps/catty-reminders-app"
 VENV="$APP_DIR/.venv"
 LOG="$APP_DIR/deploy.log"
 
+# DEPLOY_MODE=restart restarts the single catty-reminders unit (brief downtime).
+# DEPLOY_MODE=rolling starts the new version on the spare port next to the old one,
+# waits until it is ready, switches nginx to it, then drains and stops the old one.
+# Each version runs from its own release directory, so the old one never sees the new files.
+DEPLOY_MODE="${DEPLOY_MODE:-restart}"
+ROLLING_PORTS=(8281 8282)
+ACTIVE_PORT_FILE="$APP_DIR/.active_port"
+RELEASES_DIR="$APP_DIR/releases"
+KEEP_RELEASES="${KEEP_RELEASES:-3}"
+UPSTREAM_CONF="${UPSTREAM_CONF:-/etc/nginx/conf.d/catty-upstream.conf}"
+READY_PATH="${READY_PATH:-/readyz}"
+READY_TIMEOUT="${READY_TIMEOUT:-60}"
+DRAIN_SECONDS="${DRAIN_SECONDS:-15}"
+REQUIREMENTS_HASH_FILE="$VENV/.requirements.sha256"
+
 exec > >(/usr/bin/tee -a "$LOG") 2>&1
 
 echo "===== $(date '+%F %T') | START DEPLOY ====="
@@ -14,25 +29,141 @@ cd "$APP_DIR"
 BRANCH="$(git rev-parse --abbrev-ref HEAD 2>/dev/null || echo main)"
 echo "[GIT] current branch: $BRANCH"
 
+# The webhook server passes the commit it tested, so a newer push it has not tested yet is not deployed
 git fetch origin "$BRANCH" --tags --prune
-git reset --hard "origin/$BRANCH"
+git reset --hard "${DEPLOY_COMMIT:-origin/$BRANCH}"
+
+requirements_hash() {
+  cat requirements.txt requirements-test.txt 2>/dev/null | sha256sum | cut -d' ' -f1
+}
 
 if [ -x "$VENV/bin/pip" ]; then
-  echo "[PIP] Using venv pip: $VENV/bin/pip"
-  "$VENV/bin/pip" install --upgrade pip
-  [ -f requirements.txt ] && "$VENV/bin/pip" install -r requirements.txt
-  [ -f requirements-test.txt ] && "$VENV/bin/pip" install -r requirements-test.txt || true
+  NEW_REQUIREMENTS_HASH="$(requirements_hash)"
+  OLD_REQUIREMENTS_HASH="$(cat "$REQUIREMENTS_HASH_FILE" 2>/dev/null || true)"
+
+  if [ "$NEW_REQUIREMENTS_HASH" = "$OLD_REQUIREMENTS_HASH" ]; then
+    echo "[PIP] Requirements unchanged ($NEW_REQUIREMENTS_HASH). Skipping pip install."
+  else
+    echo "[PIP] Using venv pip: $VENV/bin/pip"
+    "$VENV/bin/pip" install --upgrade pip
+    [ -f requirements.txt ] && "$VENV/bin/pip" install -r requirements.txt
+    [ -f requirements-test.txt ] && "$VENV/bin/pip" install -r requirements-test.txt || true
+    echo "$NEW_REQUIREMENTS_HASH" > "$REQUIREMENTS_HASH_FILE"
+  fi
 else
   echo "[WARNING] Virtualenv pip not found at $VENV/bin/pip. Skipping pip install."
 fi
 
-echo "[SYSTEMD] restart catty-reminders"
+build_assets() {
+  if [ -x "$VENV/bin/python" ]; then
+    echo "[ASSETS] Building fingerprinted, precompressed static assets in $1"
+    (cd "$1" && "$VENV/bin/python" -m app.utils.assets build)
+  else
+    echo "[WARNING] Virtualenv python not found at $VENV/bin/python. Serving unfingerprinted static assets."
+  fi
+}
+
+wait_until_ready() {
+  local url="http://127.0.0.1:$1$READY_PATH"
+  local deadline=$((SECONDS + READY_TIMEOUT))
+
+  while [ "$SECONDS" -lt "$deadline" ]; do
+    if curl -fsS -o /dev/null --max-time 2 "$url"; then
+      return 0
+    fi
+    sleep 1
+  done
+  return 1
+}
+
+# Checks the pulled commit out into its own release directory and sets RELEASE to it
+prepare_release() {
+  local commit
+  commit="$(git rev-parse HEAD)"
+  RELEASE="$RELEASES_DIR/$commit"
+
+  mkdir -p "$RELEASES_DIR"
+  git worktree prune
+  if [ ! -d "$RELEASE" ]; then
+    git worktree add --detach "$RELEASE" "$commit"
+  fi
+  build_assets "$RELEASE"
+}
+
+remove_old_releases() {
+  local in_use release
+  in_use="$(readlink -f "$RELEASES_DIR"/port-* 2>/dev/null || true)"
+
+  # Newest first, keeping the ones the port links point at
+  ls -1dt "$RELEASES_DIR"/*/ 2>/dev/null | sed 's:/$::' | grep -v '/port-[0-9]*$' \
+    | tail -n "+$((KEEP_RELEASES + 1))" | while read -r release; do
+    if ! grep -qxF "$release" <<< "$in_use"; then
+      echo "[ROLLING] removing old release $release"
+      git worktree remove --force "$release"
+    fi
+  done
+}
+
+rolling_deploy() {
+  local old_port new_port
+  old_port="$(cat "$ACTIVE_PORT_FILE" 2>/dev/null || echo "${ROLLING_PORTS[1]}")"
+  if [ "$old_port" = "${ROLLING_PORTS[0]}" ]; then
+    new_port="${ROLLING_PORTS[1]}"
+  else
+    new_port="${ROLLING_PORTS[0]}"
+  fi
 
-if sudo -n /usr/bin/systemctl restart catty-reminders; then
-  echo "[SYSTEMD] restart command completed"
+  echo "[ROLLING] old port: $old_port, new port: $new_port"
+
+  # The unit for each port runs from releases/port-<port>, so repointing this link leaves the old version alone
+  prepare_release
+  ln -sfn "$RELEASE" "$RELEASES_DIR/port-$new_port"
+  echo "[ROLLING] port $new_port runs release $RELEASE"
+
+  # Start the new version next to the old one.
+  # Both share the database: writes take turns through its lock file,
+  # and the new version only starts the scheduler and compactor once the old one has exited.
+  sudo -n /usr/bin/systemctl restart "catty-reminders@$new_port"
+
+  # Warm it up and gate on readiness before it gets any traffic
+  if ! wait_until_ready "$new_port"; then
+    echo "[ERROR] New version on port $new_port not ready after ${READY_TIMEOUT}s. Keeping port $old_port."
+    sudo -n /usr/bin/systemctl stop "catty-reminders@$new_port" || true
+    exit 4
+  fi
+  echo "[ROLLING] port $new_port is ready"
+
+  # Switch traffic: nginx reload lets old workers finish their in-flight requests
+  echo "upstream catty_reminders { server 127.0.0.1:$new_port; }" | sudo -n /usr/bin/tee "$UPSTREAM_CONF" > /dev/null
+  sudo -n /usr/sbin/nginx -t
+  sudo -n /usr/bin/systemctl reload nginx
+  echo "$new_port" > "$ACTIVE_PORT_FILE"
+  echo "[ROLLING] traffic switched to port $new_port"
+
+  # Drain the old version, then stop it (uvicorn finishes open requests on SIGTERM)
+  if systemctl is-active --quiet "catty-reminders@$old_port"; then
+    echo "[ROLLING] draining port $old_port for ${DRAIN_SECONDS}s"
+    sleep "$DRAIN_SECONDS"
+    sudo -n /usr/bin/systemctl stop "catty-reminders@$old_port"
+  fi
+  echo "[ROLLING] old version on port $old_port stopped"
+
+  remove_old_releases
+}
+
+if [ "$DEPLOY_MODE" = "rolling" ]; then
+  rolling_deploy
 else
-  echo "[ERROR] Failed to restart catty-reminders via sudo. Check sudoers (NOPASSWD) or run manually."
-  exit 3
+  build_assets "$APP_DIR"
+
+  echo "[SYSTEMD] restart catty-reminders"
+
+  if sudo -n /usr/bin/systemctl restart catty-reminders; then
+    echo "[SYSTEMD] restart command completed"
+  else
+    echo "[ERROR] Failed to restart catty-reminders via sudo. Check sudoers (NOPASSWD) or run manually."
+    exit 3
+  fi
 fi
 
 echo "===== $(date '+%F %T') | DEPLOYMENT COMPLETED ====="
@@ -0,0 +1,62 @@
+// Drag-and-drop reordering for reminder items.
+// The row moves in the page right away, and the new position is saved with one PATCH
+// naming the item it now follows (none when it is first).
+
+(function () {
+  var dragged = null;
+  var startAfter = null;
+
+  function itemRow(element) {
+    var row = element && element.closest ? element.closest('.reminder-row[draggable="true"]') : null;
+    return row && row.parentElement.classList.contains('reminders-item-list') ? row : null;
+  }
+
+  function itemId(row) {
+    return row.getAttribute('data-id').replace('reminder-item-row-', '');
+  }
+
+  function previousItemRow(row) {
+    var previous = row.previousElementSibling;
+    while (previous && !itemRow(previous)) previous = previous.previousElementSibling;
+    return previous;
+  }
+
+  document.addEventListener('dragstart', function (event) {
+    dragged = itemRow(event.target);
+    if (!dragged) return;
+    startAfter = previousItemRow(dragged);
+    dragged.classList.add('dragging');
+    event.dataTransfer.effectAllowed = 'move';
+    event.dataTransfer.setData('text/plain', itemId(dragged));
+  });
+
+  document.addEventListener('dragover', function (event) {
+    var row = itemRow(event.target);
+    if (!dragged || !row || row === dragged || row.parentElement !== dragged.parentElement) return;
+    event.preventDefault();
+
+    var box = row.getBoundingClientRect();
+    var below = event.clientY > box.top + box.height / 2;
+    row.parentElement.insertBefore(dragged, below ? row.nextSibling : row);
+  });
+
+  document.addEventListener('drop', function (event) {
+    if (dragged) event.preventDefault();
+  });
+
+  document.addEventListener('dragend', function () {
+    if (!dragged) return;
+    var row = dragged;
+    dragged = null;
+    row.classList.remove('dragging');
+
+    var previous = previousItemRow(row);
+    if (previous === startAfter) return;
+
+    htmx.ajax('PATCH', '/reminders/item-row-position/' + itemId(row), {
+      source: row,
+      swap: 'none',
+      values: previous ? {after_id: itemId(previous)} : {}
+    });
+  });
+})();
@@ -2,10 +2,17 @@
 This module provides fixtures for testing.
 
 WARNING:
-Why don't we just use command line arguments for base URL and passwords?
+Why don't we just use command line arguments for usernames and passwords?
 Because it's annoying to type them out every time we want to run tests!
 
-TODO: storage state for UI and API
+API tests run the app in-process through Starlette's ASGI test client,
+with a fresh database file in each test's temporary directory.
+UI tests drive a server that each test session (or pytest-xdist worker) starts in a thread,
+backed by the same per-test databases, and log in once per user by reusing saved storage state.
+Tests are therefore isolated enough to run in parallel:
+
+  python -m pytest -n auto tests/test_api.py
+  python -m pytest -n auto --browser chromium tests/test_ui.py
 """
 
 # --------------------------------------------------------------------------------
@@ -14,8 +21,18 @@ TODO: storage state for UI and API
 
 import json
 import pytest
-
-from playwright.sync_api import Playwright
+import socket
+import threading
+import time
+import uvicorn
+
+from app.main import app
+from app.utils.auth import get_storage_for_api, get_storage_for_page, get_username_for_api, get_username_for_page
+from app.utils.health import Readiness, readiness
+from app.utils.storage import ReminderStorage
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from playwright.sync_api import Browser, Playwright
 from testlib.inputs import User
 
 
@@ -23,6 +40,17 @@ from testlib.inputs import User
 # Private Functions
 # --------------------------------------------------------------------------------
 
+def _save_storage_state(playwright, base_url, user, directory):
+  # Logging in through the API sets the same session cookie the login form does
+  path = str(directory / f'{user.username}.json')
+  request_context = playwright.request.new_context(base_url=base_url)
+  response = request_context.post('/login', form={'username': user.username, 'password': user.password})
+  assert response.ok
+  request_context.storage_state(path=path)
+  request_context.dispose()
+  return path
+
+
 def _build_user(inputs, index):
   assert 'users' in inputs, "inputs are missing 'users' key"
   users = inputs['users']
@@ -46,12 +74,6 @@ def test_inputs():
   return data
 
 
-@pytest.fixture(scope='session')
-def base_url(test_inputs):
-  assert 'base_url' in test_inputs, "inputs are missing 'base_url' key"
-  return test_inputs['base_url']
-
-
 @pytest.fixture(scope='session')
 def user(test_inputs):
   return _build_user(test_inputs, 0)
@@ -62,11 +84,131 @@ def alt_user(test_inputs):
   return _build_user(test_inputs, 1)
 
 
+# --------------------------------------------------------------------------------
+# In-Process App Fixtures
+# --------------------------------------------------------------------------------
+
+@pytest.fixture
+def catty_db_path(tmp_path):
+  return str(tmp_path / 'reminder_db.json')
+
+
+@pytest.fixture
+def catty_app(catty_db_path):
+  def storage_for_api(username: str = Depends(get_username_for_api)) -> ReminderStorage:
+    return ReminderStorage(owner=username, db_path=catty_db_path)
+
+  def storage_for_page(username: str = Depends(get_username_for_page)) -> ReminderStorage:
+    return ReminderStorage(owner=username, db_path=catty_db_path)
+
+  app.dependency_overrides[get_storage_for_api] = storage_for_api
+  app.dependency_overrides[get_storage_for_page] = storage_for_page
+
+  # A fresh middleware stack means fresh rate limit buckets for every test
+  app.middleware_stack = None
+
+  yield app
+  app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def utc_local_time(monkeypatch):
+  # Naive times are the server's local time, so tests that mix them with aware times pin it
+  monkeypatch.setenv('TZ', 'UTC')
+  time.tzset()
+  yield
+  monkeypatch.undo()
+  time.tzset()
+
+
+@pytest.fixture
+def cold_readiness(catty_db_path: str, monkeypatch) -> Readiness:
+  # The app's readiness check, before warmup, probing the test's database on every request
+  monkeypatch.setattr(readiness, 'db_path', catty_db_path)
+  monkeypatch.setattr(readiness, 'warm', False)
+  monkeypatch.setattr(readiness, 'cache_seconds', 0)
+  monkeypatch.setattr(readiness, '_storage_result', None)
+  return readiness
+
+
+@pytest.fixture
+def catty_client(catty_app):
+  # Not entering the client as a context manager skips the lifespan,
+  # so background jobs never touch the shared database
+  return TestClient(catty_app)
+
+
+@pytest.fixture
+def user_client(catty_client: TestClient, user: User):
+  response = catty_client.post('/login', data={'username': user.username, 'password': user.password})
+  assert response.status_code == 200
+  return catty_client
+
+
+@pytest.fixture
+def alt_user_client(catty_app, alt_user: User):
+  client = TestClient(catty_app)
+  response = client.post('/login', data={'username': alt_user.username, 'password': alt_user.password})
+  assert response.status_code == 200
+  return client
+
+
+@pytest.fixture
+def seeded_reminders(catty_db_path, user: User):
+  storage = ReminderStorage(owner=user.username, db_path=catty_db_path)
+  chores_id = storage.create_list('Chores')
+  storage.add_item(chores_id, 'Dishes')
+  storage.add_item(chores_id, 'Laundry')
+  groceries_id = storage.create_list('Groceries')
+  storage.add_item(groceries_id, 'Milk')
+  storage.set_selected_list(chores_id)
+  return storage
+
+
+# --------------------------------------------------------------------------------
+# Live Server Fixtures
+# --------------------------------------------------------------------------------
+
+@pytest.fixture(scope='session')
+def base_url():
+  """Serves the in-process app on a free port, so each pytest-xdist worker has a server of its own."""
+
+  sock = socket.socket()
+  sock.bind(('127.0.0.1', 0))
+  server = uvicorn.Server(uvicorn.Config(app, lifespan='off', log_level='warning'))
+  thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True)
+  thread.start()
+  while not server.started:
+    time.sleep(0.01)
+
+  yield f'http://127.0.0.1:{sock.getsockname()[1]}'
+  server.should_exit = True
+  thread.join()
+
+
 # --------------------------------------------------------------------------------
 # Playwright Fixtures
 # --------------------------------------------------------------------------------
 
+@pytest.fixture(scope='session')
+def user_storage_state(playwright: Playwright, base_url: str, user: User, tmp_path_factory):
+  return _save_storage_state(playwright, base_url, user, tmp_path_factory.mktemp('storage_state'))
+
+
+@pytest.fixture(scope='session')
+def alt_user_storage_state(playwright: Playwright, base_url: str, alt_user: User, tmp_path_factory):
+  return _save_storage_state(playwright, base_url, alt_user, tmp_path_factory.mktemp('storage_state'))
+
+
 @pytest.fixture
-def catty_api(playwright: Playwright, base_url: str):
-  return playwright.request.new_context(base_url=base_url)
+def user_page(browser: Browser, browser_context_args, user_storage_state, catty_app):
+  context = browser.new_context(**browser_context_args, storage_state=user_storage_state)
+  yield context.new_page()
+  context.close()
+
 
+@pytest.fixture
+def alt_user_page(browser: Browser, browser_context_args, alt_user_storage_state, catty_app):
+  context = browser.new_context(**browser_context_args, storage_state=alt_user_storage_state)
+  yield context.new_page()
+  context.close()
@@ -6,19 +6,346 @@ This module contains API tests for the Catty app.
 # Imports
 # --------------------------------------------------------------------------------
 
-from playwright.sync_api import APIRequestContext
+import asyncio
+import httpx
+import json
+import pytest
+import time
+
+from app.utils.admin import admin_header_name, serialize_admin_token
+from app.utils.auth import serialize_token
+from app.utils.durability import Committer, committers, storage_flushes
+from app.utils.profiling import profile_header_name, profile_id_header_name, profile_store, serialize_profile_token
+from app.utils.snapshots import snapshot_store
+from app.utils.storage import ReminderStorage
+from fastapi.testclient import TestClient
 from testlib.inputs import User
 
 
 # --------------------------------------------------------------------------------
-# Tests
+# Login
+# --------------------------------------------------------------------------------
+
+def test_successful_api_login(catty_client: TestClient, user: User):
+  response = catty_client.post('/login', data={'username': user.username, 'password': user.password})
+  assert response.status_code == 200
+  assert response.url.path == '/reminders'
+  assert catty_client.cookies.get('reminders_session')
+
+
+def test_failed_api_login(catty_client: TestClient, user: User):
+  response = catty_client.post('/login', data={'username': user.username, 'password': 'wrong'})
+  assert response.url.path == '/login'
+  assert 'reminders_session' not in catty_client.cookies
+
+
+def test_api_requires_login(catty_client: TestClient):
+  response = catty_client.get('/api/reminders')
+  assert response.status_code == 401
+
+
+# --------------------------------------------------------------------------------
+# Reminder Lists
 # --------------------------------------------------------------------------------
 
-def test_successful_api_login(catty_api: APIRequestContext, user: User, base_url: str):
-  response = catty_api.post('/login', form={'username': user.username, 'password': user.password})
-  assert response.ok
-  assert response.url == f'{base_url}/reminders'
+def test_create_rename_and_delete_list(user_client: TestClient, user: User):
+  created = user_client.post('/api/reminders', json={'name': 'Chores'}).json()
+  assert created == {'id': created['id'], 'owner': user.username, 'name': 'Chores', 'item_count': 0, 'completed_count': 0}
+
+  renamed = user_client.patch(f"/api/reminders/{created['id']}", json={'name': 'Errands'}).json()
+  assert renamed['name'] == 'Errands'
+
+  assert user_client.delete(f"/api/reminders/{created['id']}").status_code == 200
+  assert user_client.get(f"/api/reminders/{created['id']}").status_code == 404
+  assert user_client.get('/api/reminders').json() == []
+
+
+def test_lists_are_private(user_client: TestClient, alt_user_client: TestClient):
+  list_id = user_client.post('/api/reminders', json={'name': 'Secret'}).json()['id']
+
+  assert alt_user_client.get('/api/reminders').json() == []
+  assert alt_user_client.get(f'/api/reminders/{list_id}').status_code == 403
+
+
+# --------------------------------------------------------------------------------
+# Reminder Items
+# --------------------------------------------------------------------------------
+
+def test_items_update_list_counts(user_client: TestClient):
+  list_id = user_client.post('/api/reminders', json={'name': 'Chores'}).json()['id']
+  item_ids = [
+    user_client.post(f'/api/reminders/{list_id}/items', json={'description': name}).json()['id']
+    for name in ('Dishes', 'Laundry', 'Vacuum')]
+
+  struck = user_client.patch(f'/api/reminders/items/strike/{item_ids[0]}').json()
+  assert struck['completed']
+  user_client.delete(f'/api/reminders/items/{item_ids[1]}')
+
+  items = user_client.get(f'/api/reminders/{list_id}/items').json()
+  assert [(item['id'], item['completed']) for item in items] == [(item_ids[0], True), (item_ids[2], False)]
+
+  reminder_list = user_client.get(f'/api/reminders/{list_id}').json()
+  assert (reminder_list['item_count'], reminder_list['completed_count']) == (2, 1)
+
+
+def test_completing_recurring_item_adds_next_occurrence(user_client: TestClient):
+  list_id = user_client.post('/api/reminders', json={'name': 'Plants'}).json()['id']
+  item = user_client.post(f'/api/reminders/{list_id}/items', json={
+    'description': 'Water the ferns',
+    'due_at': '2030-01-06T09:00:00+00:00',
+    'recurrence': 'freq=weekly',
+  }).json()
+  assert item['recurrence'] == 'FREQ=WEEKLY'
+
+  user_client.patch(f"/api/reminders/items/strike/{item['id']}")
+  items = user_client.get(f'/api/reminders/{list_id}/items').json()
+  assert [(i['completed'], i['due_at']) for i in items] == [
+    (True, '2030-01-06T09:00:00Z'),
+    (False, '2030-01-13T09:00:00Z'),
+  ]
+
+
+def test_occurrences_mix_times_with_and_without_time_zones(user_client: TestClient, utc_local_time):
+  list_id = user_client.post('/api/reminders', json={'name': 'Plants'}).json()['id']
+  user_client.post(f'/api/reminders/{list_id}/items', json={
+    'description': 'Ferns',
+    'due_at': '2030-01-06T09:00:00+00:00',
+    'recurrence': 'FREQ=DAILY',
+  })
+  user_client.post(f'/api/reminders/{list_id}/items', json={
+    'description': 'Cactus',
+    'due_at': '2030-01-06T10:00:00',
+    'recurrence': 'FREQ=DAILY;UNTIL=2030-01-07T12:00:00Z',
+  })
+
+  response = user_client.get(
+    f'/api/reminders/{list_id}/occurrences',
+    params={'start': '2030-01-06T00:00:00Z', 'end': '2030-01-08T12:00:00'})
+  assert response.status_code == 200
+  assert [(o['description'], o['at']) for o in response.json()] == [
+    ('Ferns', '2030-01-06T09:00:00Z'),
+    ('Cactus', '2030-01-06T10:00:00Z'),
+    ('Ferns', '2030-01-07T09:00:00Z'),
+    ('Cactus', '2030-01-07T10:00:00Z'),
+    ('Ferns', '2030-01-08T09:00:00Z'),
+  ]
+
+
+def test_renaming_an_item_accepts_only_its_description(user_client: TestClient):
+  list_id = user_client.post('/api/reminders', json={'name': 'Chores'}).json()['id']
+  item_id = user_client.post(f'/api/reminders/{list_id}/items', json={'description': 'Dishes'}).json()['id']
+
+  response = user_client.patch(f'/api/reminders/items/{item_id}', json={'description': 'Laundry'})
+  assert response.status_code == 200
+  assert response.json()['description'] == 'Laundry'
+
+  response = user_client.patch(f'/api/reminders/items/{item_id}', json={
+    'description': 'Laundry',
+    'due_at': '2030-01-06T09:00:00+00:00',
+  })
+  assert response.status_code == 422
+  assert user_client.get(f'/api/reminders/items/{item_id}').json()['due_at'] is None
+
+
+def test_bulk_actions(user_client: TestClient):
+  list_id = user_client.post('/api/reminders', json={'name': 'Chores'}).json()['id']
+  item_ids = [
+    user_client.post(f'/api/reminders/{list_id}/items', json={'description': str(i)}).json()['id']
+    for i in range(4)]
+
+  items = user_client.post(f'/api/reminders/{list_id}/items/complete').json()
+  assert all(item['completed'] for item in items)
+
+  result = user_client.post('/api/reminders/items/bulk', json={'item_ids': item_ids[:2], 'action': 'incomplete'}).json()
+  assert result == {'changed': item_ids[:2], 'deleted': [], 'created': []}
+
+  remaining = user_client.delete(f'/api/reminders/{list_id}/items/completed').json()
+  assert [item['id'] for item in remaining] == item_ids[:2]
+
+
+def test_bulk_action_is_all_or_nothing(user_client: TestClient):
+  list_id = user_client.post('/api/reminders', json={'name': 'Chores'}).json()['id']
+  item_id = user_client.post(f'/api/reminders/{list_id}/items', json={'description': 'Dishes'}).json()['id']
+
+  response = user_client.post('/api/reminders/items/bulk', json={'item_ids': [item_id, item_id + 100], 'action': 'delete'})
+  assert response.status_code == 404
+  assert len(user_client.get(f'/api/reminders/{list_id}/items').json()) == 1
+
+
+def test_bulk_partials_leave_items_alone_without_a_selected_list(user_client: TestClient):
+  list_id = user_client.post('/api/reminders', json={'name': 'Chores'}).json()['id']
+  user_client.post(f'/api/reminders/{list_id}/items', json={'description': 'Dishes'})
+  user_client.post('/api/reminders/unselect')
+
+  for method, path in [
+    ('POST', '/reminders/items-complete-all'),
+    ('POST', '/reminders/items-incomplete-all'),
+    ('DELETE', '/reminders/items-completed'),
+  ]:
+    assert user_client.request(method, path).status_code == 200
+
+  items = user_client.get(f'/api/reminders/{list_id}/items').json()
+  assert [(item['description'], item['completed']) for item in items] == [('Dishes', False)]
+
+
+def test_item_row_updates_render_the_list_row_from_its_counts(user_client: TestClient, monkeypatch):
+  list_id = user_client.post('/api/reminders', json={'name': 'Chores'}).json()['id']
+  item_ids = [
+    user_client.post(f'/api/reminders/{list_id}/items', json={'description': name}).json()['id']
+    for name in ('Dishes', 'Laundry')]
+  user_client.post(f'/reminders/select/{list_id}')
+
+  # The out-of-band list row needs the stored counts, not the selected list's items
+  monkeypatch.setattr(ReminderStorage, 'get_selected_list', lambda self: pytest.fail('read the selected list'))
+  response = user_client.patch(f'/reminders/item-row-strike/{item_ids[0]}')
+  assert response.status_code == 200
+  assert 'selected-list' in response.text and '1/2' in response.text
+
+
+def test_move_item(user_client: TestClient):
+  list_id = user_client.post('/api/reminders', json={'name': 'Chores'}).json()['id']
+  item_ids = [
+    user_client.post(f'/api/reminders/{list_id}/items', json={'description': str(i)}).json()['id']
+    for i in range(3)]
+
+  moved = user_client.patch(f'/api/reminders/items/position/{item_ids[2]}', json={'after_id': None})
+  assert moved.status_code == 200
+  items = user_client.get(f'/api/reminders/{list_id}/items').json()
+  assert [item['id'] for item in items] == [item_ids[2], item_ids[0], item_ids[1]]
+
+  other_list_id = user_client.post('/api/reminders', json={'name': 'Errands'}).json()['id']
+  other_item_id = user_client.post(f'/api/reminders/{other_list_id}/items', json={'description': 'Bank'}).json()['id']
+  response = user_client.patch(f'/api/reminders/items/position/{item_ids[0]}', json={'after_id': other_item_id})
+  assert response.status_code == 404
+
+
+def test_idempotency_key_replays_the_first_response(user_client: TestClient, alt_user_client: TestClient):
+  list_id = user_client.post('/api/reminders', json={'name': 'Chores'}).json()['id']
+  headers = {'Idempotency-Key': 'add-dishes'}
+
+  first = user_client.post(f'/api/reminders/{list_id}/items', json={'description': 'Dishes'}, headers=headers)
+  retry = user_client.post(f'/api/reminders/{list_id}/items', json={'description': 'Dishes'}, headers=headers)
+  assert retry.json() == first.json()
+  assert retry.headers['idempotent-replayed'] == 'true'
+  assert 'idempotent-replayed' not in first.headers
+  assert len(user_client.get(f'/api/reminders/{list_id}/items').json()) == 1
+
+  reused = user_client.post(f'/api/reminders/{list_id}/items', json={'description': 'Laundry'}, headers=headers)
+  assert reused.status_code == 422
+
+  # Keys are per user, so another user's request with the same key runs normally
+  other = alt_user_client.post('/api/reminders', json={'name': 'Chores'}, headers=headers)
+  assert other.status_code == 200 and 'idempotent-replayed' not in other.headers
+
+
+def test_idempotency_never_replays_sessions(catty_client: TestClient, user: User):
+  credentials = {'username': user.username, 'password': user.password}
+  headers = {'Idempotency-Key': 'log-in'}
+
+  # Anonymous clients behind the proxy share one address, so they get no idempotency at all
+  for _ in range(2):
+    response = catty_client.post('/login', data=credentials, headers=headers, follow_redirects=False)
+    assert 'set-cookie' in response.headers and 'idempotent-replayed' not in response.headers
+
+  # Logged in now, but a response that sets a cookie is still not recorded
+  for _ in range(2):
+    response = catty_client.post('/login', data=credentials, headers=headers, follow_redirects=False)
+    assert 'set-cookie' in response.headers and 'idempotent-replayed' not in response.headers
+
+
+# --------------------------------------------------------------------------------
+# Durability
+# --------------------------------------------------------------------------------
+
+def test_concurrent_requests_share_a_group_flush(catty_app, catty_db_path: str, user: User):
+  committers[catty_db_path] = Committer(catty_db_path, 'group', group_window=0.05)
+  flushes = storage_flushes.get(('group',))
+
+  async def create_lists():
+    transport = httpx.ASGITransport(app=catty_app)
+    cookies = {'reminders_session': serialize_token(user.username)}
+    async with httpx.AsyncClient(transport=transport, base_url='http://catty', cookies=cookies) as client:
+      return await asyncio.gather(*[client.post('/api/reminders', json={'name': f'List {i}'}) for i in range(8)])
+
+  try:
+    responses = asyncio.run(create_lists())
+  finally:
+    del committers[catty_db_path]
+
+  assert all(response.status_code == 200 for response in responses)
+  assert storage_flushes.get(('group',)) - flushes < 8
+
+  # Every acknowledged list is already in the file
+  with open(catty_db_path) as db_file:
+    assert len(json.load(db_file)['reminder_lists']) == 8
+
+
+def test_profiled_request_stores_a_profile_per_thread(user_client: TestClient, tmp_path, monkeypatch):
+  monkeypatch.setattr(profile_store, 'directory', str(tmp_path / 'profiles'))
+  headers = {profile_header_name: serialize_profile_token(60)}
+
+  assert user_client.get('/profiles').status_code == 401
+  assert user_client.get('/profiles', headers={profile_header_name: 'forged'}).status_code == 401
+
+  response = user_client.get('/api/reminders', headers=headers)
+  profile_id = response.headers[profile_id_header_name]
+  assert user_client.get('/profiles', headers=headers).json() == [profile_id]
+
+  # The lists are read in a worker thread, which gets a profile next to the event loop's
+  profile = user_client.get(f'/profiles/{profile_id}', headers=headers).json()
+  assert [p['name'] for p in profile['profiles']][0] == 'GET /api/reminders (event loop)'
+  assert len(profile['profiles']) == 2
+
+  assert user_client.get(f'/profiles/{profile_id}').status_code == 401
+  missing = user_client.get('/profiles/missing', headers=headers, follow_redirects=False)
+  assert missing.headers['location'] == '/not-found'
+
+
+def test_snapshots_need_an_admin_token_not_a_profile_token(user_client: TestClient, tmp_path, monkeypatch):
+  monkeypatch.setattr(snapshot_store, 'directory', str(tmp_path / 'snapshots'))
+
+  assert user_client.get('/snapshots').status_code == 401
+  assert user_client.get('/snapshots', headers={profile_header_name: serialize_profile_token(60)}).status_code == 401
+  assert user_client.get('/snapshots', headers={admin_header_name: serialize_profile_token(60)}).status_code == 401
+  restore = user_client.post('/snapshots/missing/restore', headers={profile_header_name: serialize_profile_token(60)})
+  assert restore.status_code == 401
+
+  assert user_client.get('/snapshots', headers={admin_header_name: serialize_admin_token(60)}).json() == []
+
+
+def test_ready_only_after_warmup(catty_client: TestClient, cold_readiness):
+  response = catty_client.get('/readyz')
+  assert response.status_code == 503
+  assert response.json()['warm'] is False
+  assert response.json()['storage']['ok'] is True
+
+  cold_readiness.warmup()
+  response = catty_client.get('/readyz')
+  assert response.status_code == 200
+  assert response.json()['status'] == 'ready'
+
+
+def test_not_ready_while_storage_is_slow(catty_client: TestClient, cold_readiness, monkeypatch):
+  cold_readiness.warm = True
+  monkeypatch.setattr(cold_readiness, 'max_storage_latency', 0.01)
+  monkeypatch.setattr(ReminderStorage, 'ping', lambda storage: time.sleep(0.05))
+
+  response = catty_client.get('/readyz')
+  assert response.status_code == 503
+  assert response.json()['storage']['latency_ms'] >= 50
+
+
+def test_readiness_probes_are_cached(catty_client: TestClient, cold_readiness, monkeypatch):
+  cold_readiness.warm = True
+  cold_readiness.cache_seconds = 60
+  pings = []
+  monkeypatch.setattr(ReminderStorage, 'ping', lambda storage: pings.append(1))
+
+  assert catty_client.get('/readyz').json()['cached'] is False
+  assert catty_client.get('/readyz').json()['cached'] is True
+  assert len(pings) == 1
 
-  cookie = catty_api.storage_state()['cookies'][0]
-  assert cookie['name'] == 'reminders_session'
-  assert cookie['value']
+  # Once the cached result is older than the TTL, the next probe reads storage again
+  cold_readiness._checked_at -= 60
+  assert catty_client.get('/readyz').json()['cached'] is False
+  assert len(pings) == 2
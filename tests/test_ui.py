@@ -6,12 +6,35 @@ This module contains Web UI tests for the Catty app.
 # Imports
 # --------------------------------------------------------------------------------
 
+import pytest
 import re
 
 from playwright.sync_api import Page, expect
 from testlib.inputs import User
 
 
+# Every test gets an empty database of its own, even tests that only use the logged-out page
+pytestmark = pytest.mark.usefixtures('catty_app')
+
+
+# --------------------------------------------------------------------------------
+# Helpers
+# --------------------------------------------------------------------------------
+
+def _list_row(page: Page, name: str):
+  return page.locator('.reminders-list-list .reminder-row', has_text=name)
+
+
+def _item_row(page: Page, description: str):
+  return page.locator('.reminders-item-list .reminder-row', has_text=description)
+
+
+def _add_row(page: Page, new_row: str, field: str, text: str) -> None:
+  page.locator(f"[data-id='{new_row}']").click()
+  page.locator(f"[name='{field}']").fill(text)
+  page.locator(f"[name='{field}']").press('Enter')
+
+
 # --------------------------------------------------------------------------------
 # Login Behaviors
 #
@@ -59,6 +82,19 @@ def test_successful_login(page: Page, user: User):
   expect(page.locator('id=reminders-message')).to_have_text(f'Reminders for {user.username}')
 
 
+def test_log_out(user_page: Page):
+
+  # Given the user is logged in
+  user_page.goto('/reminders')
+
+  # When the user logs out
+  with user_page.expect_navigation():
+    user_page.get_by_role('button', name='Logout').click()
+
+  # Then the login page is displayed
+  expect(user_page).to_have_url(re.compile(r'/login'))
+
+
 # --------------------------------------------------------------------------------
 # Navigation Behaviors
 #
@@ -109,6 +145,77 @@ def test_successful_login(page: Page, user: User):
 #   data persists after logout and log back in
 # --------------------------------------------------------------------------------
 
+def test_initial_reminders_page_is_empty(user_page: Page):
+  user_page.goto('/reminders')
+  expect(user_page.locator('.reminders-list-list .reminder-row')).to_have_count(1)
+  expect(user_page.locator("[data-id='new-reminder-row']")).to_be_visible()
+  expect(user_page.locator('.reminders-item-list')).to_have_count(0)
+
+
+def test_create_first_list(user_page: Page):
+  user_page.goto('/reminders')
+  _add_row(user_page, 'new-reminder-row', 'reminder_list_name', 'Chores')
+
+  expect(_list_row(user_page, 'Chores')).to_have_class(re.compile('selected-list'))
+  expect(user_page.locator('.reminders-card-title', has_text='Chores')).to_be_visible()
+
+
+def test_create_first_item_in_a_list(user_page: Page):
+  user_page.goto('/reminders')
+  _add_row(user_page, 'new-reminder-row', 'reminder_list_name', 'Chores')
+  _add_row(user_page, 'new-reminder-item-row', 'reminder_item_name', 'Dishes')
+
+  expect(_item_row(user_page, 'Dishes')).to_be_visible()
+  expect(_list_row(user_page, 'Chores').locator('.reminder-count')).to_have_text('0/1')
+
+
+def test_strike_and_unstrike_an_item(user_page: Page, seeded_reminders):
+  user_page.goto('/reminders')
+
+  _item_row(user_page, 'Dishes').locator('p').click()
+  expect(_item_row(user_page, 'Dishes')).to_have_class(re.compile('completed'))
+  expect(_list_row(user_page, 'Chores').locator('.reminder-count')).to_have_text('1/2')
+
+  _item_row(user_page, 'Dishes').locator('p').click()
+  expect(_item_row(user_page, 'Dishes')).not_to_have_class(re.compile('completed'))
+  expect(_list_row(user_page, 'Chores').locator('.reminder-count')).to_have_text('0/2')
+
+
+def test_delete_an_item(user_page: Page, seeded_reminders):
+  user_page.goto('/reminders')
+  _item_row(user_page, 'Laundry').locator('img[hx-delete]').click()
+
+  expect(_item_row(user_page, 'Laundry')).to_have_count(0)
+  expect(_item_row(user_page, 'Dishes')).to_be_visible()
+
+
+def test_select_a_different_list(user_page: Page, seeded_reminders):
+  user_page.goto('/reminders')
+  _list_row(user_page, 'Groceries').locator('p').click()
+
+  expect(_list_row(user_page, 'Groceries')).to_have_class(re.compile('selected-list'))
+  expect(_item_row(user_page, 'Milk')).to_be_visible()
+  expect(_item_row(user_page, 'Dishes')).to_have_count(0)
+
+
+def test_delete_a_selected_list(user_page: Page, seeded_reminders):
+  user_page.goto('/reminders')
+  _list_row(user_page, 'Chores').locator('img[hx-delete]').click()
+
+  expect(_list_row(user_page, 'Chores')).to_have_count(0)
+  expect(_list_row(user_page, 'Groceries')).to_be_visible()
+
+
+def test_data_persists_after_page_refresh(user_page: Page):
+  user_page.goto('/reminders')
+  _add_row(user_page, 'new-reminder-row', 'reminder_list_name', 'Chores')
+  _add_row(user_page, 'new-reminder-item-row', 'reminder_item_name', 'Dishes')
+  expect(_item_row(user_page, 'Dishes')).to_be_visible()
+
+  user_page.reload()
+  expect(_list_row(user_page, 'Chores')).to_be_visible()
+  expect(_item_row(user_page, 'Dishes')).to_be_visible()
+
 
 # --------------------------------------------------------------------------------
 # User Behaviors
@@ -116,3 +223,16 @@ def test_successful_login(page: Page, user: User):
 #   log in as separate users in separate sessions
 #   one user cannot see another user's reminders
 # --------------------------------------------------------------------------------
+
+def test_users_have_separate_sessions(user_page: Page, alt_user_page: Page, user: User, alt_user: User):
+  user_page.goto('/reminders')
+  alt_user_page.goto('/reminders')
+
+  expect(user_page.locator('id=reminders-message')).to_have_text(f'Reminders for {user.username}')
+  expect(alt_user_page.locator('id=reminders-message')).to_have_text(f'Reminders for {alt_user.username}')
+
+
+def test_one_user_cannot_see_another_users_reminders(alt_user_page: Page, seeded_reminders):
+  alt_user_page.goto('/reminders')
+  expect(_list_row(alt_user_page, 'Chores')).to_have_count(0)
+  expect(_item_row(alt_user_page, 'Dishes')).to_have_count(0)
@@ -6,7 +6,39 @@ This module contains unit tests for the Catty app.
 # Imports
 # --------------------------------------------------------------------------------
 
+import asyncio
+import json
+import os
+import pytest
+import stat
+import subprocess
+import threading
+import time
+import webhook_server
+
+from app.utils.assets import PrecompressedStaticFiles
 from app.utils.auth import serialize_token, deserialize_token
+from app.utils import compaction
+from app.utils.compaction import compact_tables
+from app.utils.counters import repair as repair_counters, verify as verify_counters
+from app.utils.durability import Committer, FileLock, committers, flush, storage_flushes, write_json_atomically
+from app.utils.compression import choose_encoding
+from app.utils.idempotency import IdempotencyStore
+from app.utils.exceptions import NotFoundException
+from app.utils.metrics import CacheStats, Counter, Gauge, Histogram
+from app.utils.profiling import ProfileStore, SamplingProfiler, _active_profiler, to_thread
+from app.utils.ranks import MAX_RANK_LENGTH, rank_between, rebalance_items
+from app.utils.rate_limit import TokenBuckets, route_class
+from app.utils.recurrence import RecurrenceRule
+from app.utils.responses import model_response
+from app.utils.scheduler import ReminderScheduler
+from app.utils.snapshots import SnapshotStore, apply_changes, diff_tables
+from app.utils.storage import ReminderItem, ReminderStorage, WorkingSet, single_flight
+from app.utils.timing import RequestTiming, _current_timing
+
+from datetime import datetime, timedelta, timezone
+from fastapi.encoders import jsonable_encoder
+from typing import List
 from testlib.inputs import User
 
 
@@ -22,3 +54,531 @@ def test_token_serialization(user: User):
 
   username = deserialize_token(token)
   assert username == user.username
+
+
+def test_histogram_buckets_are_cumulative():
+  histogram = Histogram('test_seconds', 'Test histogram.', ('route',), buckets=(0.1, 1.0))
+  histogram.observe(0.05, ('/a',))
+  histogram.observe(0.5, ('/a',))
+  histogram.observe(5.0, ('/a',))
+
+  lines = histogram.collect()
+  assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+  assert 'test_seconds_bucket{route="/a",le="1.0"} 2' in lines
+  assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+  assert 'test_seconds_count{route="/a"} 3' in lines
+
+
+def test_metrics_count_every_update_from_many_threads():
+  counter = Counter('test_total', 'Test counter.')
+  histogram = Histogram('test_seconds', 'Test histogram.')
+  gauge = Gauge('test_in_flight', 'Test gauge.')
+  stats = CacheStats('test')
+
+  def update():
+    for _ in range(10_000):
+      counter.inc()
+      histogram.observe(0.01)
+      gauge.inc()
+      stats.hit()
+
+  threads = [threading.Thread(target=update) for _ in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert counter.get() == 80_000
+  assert histogram.count() == 80_000
+  assert stats.hits == 80_000
+  gauge.set(5)
+  gauge.dec()
+  assert gauge.get() == 4
+
+  # Threads that come and go, like the relaxed flush timers, reuse finished threads' cells
+  for _ in range(20):
+    thread = threading.Thread(target=counter.inc)
+    thread.start()
+    thread.join()
+  assert counter.get() == 80_020
+  assert len(counter._cells.all()) <= 9
+
+
+def test_profiler_samples_workers_while_they_run_request_work():
+  def spin():
+    end = time.perf_counter() + 0.05
+    while time.perf_counter() < end:
+      pass
+
+  async def profiled_request():
+    profiler = SamplingProfiler(threading.get_ident(), interval=0.001)
+    profiler.start()
+    token = _active_profiler.set(profiler)
+    try:
+      await to_thread(spin)
+    finally:
+      _active_profiler.reset(token)
+      profiler.stop()
+    return profiler.to_speedscope('GET /test')
+
+  profile = asyncio.run(profiled_request())
+  loop_thread, worker = profile['profiles']
+  frames = profile['shared']['frames']
+  assert loop_thread['name'] == 'GET /test (event loop)'
+  assert any(frames[stack[-1]]['name'] == 'spin' for stack in worker['samples'])
+
+
+def test_profile_store_keeps_the_newest_profiles(tmp_path):
+  store = ProfileStore(str(tmp_path), keep=2)
+  for profile_id in ('20300101T000000-a', '20300101T000001-b', '20300101T000002-c'):
+    store.save(profile_id, {'name': profile_id})
+
+  assert store.list() == ['20300101T000002-c', '20300101T000001-b']
+  with open(store.path('20300101T000002-c')) as profile_file:
+    assert json.load(profile_file) == {'name': '20300101T000002-c'}
+  with pytest.raises(NotFoundException):
+    store.path('20300101T000000-a')
+
+
+def test_server_timing_header_reports_storage_io():
+  timing = RequestTiming()
+  timing.add('storage', 0.002)
+  timing.storage_calls['get_items'] = 2
+  timing.reads = 2
+  timing.rows_scanned = 10
+
+  header = timing.header_value()
+  assert 'storage;dur=2.00;desc="calls=2 reads=2 writes=0 rows=10"' in header
+  assert header.split(', ')[-1].startswith('total;dur=')
+
+
+def test_compression_negotiation():
+  supported = ['zstd', 'br', 'gzip']
+  assert choose_encoding('gzip, deflate, br', supported) == 'br'
+  assert choose_encoding('gzip;q=1.0, br;q=0.5', supported) == 'gzip'
+  assert choose_encoding('br;q=0, gzip;q=0', supported) is None
+  assert choose_encoding('*', supported) == 'zstd'
+  assert choose_encoding('identity', supported) is None
+
+
+def test_precompressed_static_files_honour_q_values(tmp_path):
+  (tmp_path / 'app.js').write_text('console.log(1)')
+  (tmp_path / 'app.js.gz').write_bytes(b'gzipped')
+  (tmp_path / 'app.js.br').write_bytes(b'brotlied')
+  static_files = PrecompressedStaticFiles(directory=str(tmp_path))
+
+  def served(accept_encoding):
+    scope = {'type': 'http', 'method': 'GET', 'headers': [(b'accept-encoding', accept_encoding.encode())]}
+    response = asyncio.run(static_files.get_response('app.js', scope))
+    return response.headers.get('content-encoding')
+
+  assert served('gzip, br') == 'br'
+  assert served('br;q=0, gzip') == 'gzip'
+  assert served('br;q=0.5, gzip') == 'gzip'
+  assert served('br;q=0, gzip;q=0') is None
+  assert served('identity') is None
+
+
+def test_scheduler_pops_due_reminders_in_order():
+  scheduler = ReminderScheduler([], 'unused.json')
+  now = datetime.now(timezone.utc)
+  scheduler.schedule(1, 'tester', now - timedelta(seconds=1))
+  scheduler.schedule(2, 'tester', now - timedelta(seconds=3))
+  scheduler.schedule(3, 'tester', now - timedelta(seconds=2))
+  scheduler.schedule(4, 'tester', now + timedelta(hours=1))
+  scheduler.cancel(3)
+  scheduler.schedule(1, 'tester', now - timedelta(seconds=5))
+
+  due = scheduler._pop_due(now.timestamp())
+  assert [entry.item_id for entry in due] == [1, 2]
+  assert len(scheduler) == 1
+
+
+def test_recurrence_window_skips_ahead_lazily():
+  rule = RecurrenceRule.parse('freq=monthly;bymonthday=-1')
+  assert str(rule) == 'FREQ=MONTHLY;BYMONTHDAY=-1'
+
+  start = datetime(2024, 1, 31, 9)
+  window = rule.occurrences(start, datetime(2034, 2, 1), datetime(2034, 4, 1))
+  assert list(window) == [datetime(2034, 2, 28, 9), datetime(2034, 3, 31, 9)]
+
+  weekly = RecurrenceRule.parse('FREQ=WEEKLY;BYDAY=MO,TH')
+  assert weekly.next_after(datetime(2026, 10, 19, 9), datetime(2026, 10, 19, 12)) == datetime(2026, 10, 22, 9)
+
+
+def test_compaction_purges_orphans_and_stale_selections():
+  tables = {
+    'reminder_lists': {'1': {'owner': 'tester', 'name': 'Chores'}},
+    'reminder_items': {
+      '1': {'list_id': 1, 'description': 'Kept', 'completed': False, 'next_occurrence_id': 3},
+      '2': {'list_id': 9, 'description': 'Orphan', 'completed': False},
+    },
+    'selected_lists': {
+      '1': {'owner': 'tester', 'list_id': 1},
+      '2': {'owner': 'tester', 'list_id': 1},
+      '3': {'owner': 'heisenberg', 'list_id': None},
+    },
+  }
+
+  purged = compact_tables(tables)
+  assert purged == {'reminder_items': 1, 'selected_lists': 2}
+  assert list(tables['reminder_items']) == ['1']
+  assert 'next_occurrence_id' not in tables['reminder_items']['1']
+  assert list(tables['selected_lists']) == ['1']
+
+
+def test_compaction_finishes_while_writes_keep_coming(tmp_path, monkeypatch):
+  path = str(tmp_path / 'db.json')
+  storage = ReminderStorage(owner='tester', db_path=path)
+  list_id = storage.create_list('Chores')
+  orphan_list_id = storage.create_list('Gone')
+  orphan_id = storage.add_item(orphan_list_id, 'Orphan')
+  storage._lists_table.remove(doc_ids=[orphan_list_id])
+
+  # Each copy takes long enough for the writer below to replace the file meanwhile
+  def slow_compact_tables(tables, on_progress=None):
+    time.sleep(0.05)
+    return compact_tables(tables, on_progress)
+  monkeypatch.setattr(compaction, 'compact_tables', slow_compact_tables)
+
+  done = threading.Event()
+  written = []
+
+  def write():
+    while not done.is_set():
+      written.append(storage.add_item(list_id, f'Item {len(written)}'))
+      time.sleep(0.005)
+
+  writer = threading.Thread(target=write)
+  writer.start()
+  try:
+    result = compaction.Compactor(path, max_attempts=2).compact()
+  finally:
+    done.set()
+    writer.join()
+
+  assert result['outcome'] == 'compacted_locked'
+  assert result['purged']['reminder_items'] == 1
+  flush(path)
+  with open(path) as db_file:
+    items = json.load(db_file)['reminder_items']
+  assert str(orphan_id) not in items
+  assert all(str(item_id) in items for item_id in written)
+
+
+def test_incremental_snapshot_changes_replay_to_the_new_version():
+  old = {'reminder_items': {'1': {'description': 'A'}, '2': {'description': 'B'}}}
+  new = {'reminder_items': {'1': {'description': 'A2'}, '3': {'description': 'C'}}, 'reminder_lists': {'1': {'name': 'L'}}}
+
+  changes = diff_tables(old, new)
+  assert changes['reminder_items']['delete'] == ['2']
+  assert set(changes['reminder_items']['upsert']) == {'1', '3'}
+
+  apply_changes(old, changes)
+  assert old == new
+
+
+def test_restore_replaces_commits_staged_before_it(tmp_path):
+  path = str(tmp_path / 'db.json')
+  committer = committers[path] = Committer(path, 'relaxed', flush_interval=60)
+  try:
+    storage = ReminderStorage(owner='tester', db_path=path)
+    storage.create_list('Before')
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    snapshot_id = store.create(path)['id']
+
+    storage.create_list('After')
+    # A user held in the working set sees the restored data, not what it had cached
+    assert [reminder_list.name for reminder_list in storage.get_lists()] == ['Before', 'After']
+    store.restore(snapshot_id, path)
+    assert [reminder_list.name for reminder_list in storage.get_lists()] == ['Before']
+    committer.flush()
+    assert committer.read() is None
+    assert [reminder_list.name for reminder_list in storage.get_lists()] == ['Before']
+  finally:
+    del committers[path]
+
+
+def test_token_bucket_refills_at_its_rate():
+  buckets = TokenBuckets({'write': {'rate': 2.0, 'burst': 2}})
+  assert buckets.take('user:tester', 'write', now=0.0) == 0
+  assert buckets.take('user:tester', 'write', now=0.0) == 0
+  assert buckets.take('user:tester', 'write', now=0.0) == 0.5
+  assert buckets.take('user:heisenberg', 'write', now=0.0) == 0
+  assert buckets.take('user:tester', 'write', now=0.5) == 0
+
+  assert route_class('POST', '/api/reminders/create-new-lists') == 'reset'
+  assert route_class('PATCH', '/api/reminders/1') == 'write'
+
+
+def test_idempotency_store_expires_and_evicts():
+  store = IdempotencyStore(ttl=10, max_keys=2, max_bytes=100)
+  first = store.begin(('user:tester', 'a'), 'fingerprint')
+  store.complete(('user:tester', 'a'), first, 200, [], b'{}', now=0.0)
+  assert store.get(('user:tester', 'a'), now=5.0) is first
+  assert store.get(('user:tester', 'a'), now=10.0) is None
+
+  for key in ('a', 'b', 'c'):
+    store.begin(('user:tester', key), 'fingerprint')
+  assert len(store) == 2 and store.get(('user:tester', 'a')) is None
+
+  large = store.begin(('user:tester', 'd'), 'fingerprint')
+  store.complete(('user:tester', 'd'), large, 200, [], b'x' * 101)
+  assert store.get(('user:tester', 'd')) is None and store.size == 0
+
+
+def test_single_flight_shares_concurrent_identical_reads():
+  class SlowReader:
+    def __init__(self) -> None:
+      self.owner = 'tester'
+      self._db_path = 'missing.json'
+      self.calls = 0
+
+    @single_flight
+    def read(self, list_id: int) -> list:
+      self.calls += 1
+      time.sleep(0.2)
+      return [list_id]
+
+  reader = SlowReader()
+  results = []
+  threads = [threading.Thread(target=lambda: results.append(reader.read(1))) for _ in range(5)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert results == [[1]] * 5
+  assert reader.calls == 1
+  assert reader.read(2) == [2]
+  assert reader.calls == 2
+
+
+def test_bulk_item_operations_write_once(tmp_path):
+  storage = ReminderStorage(owner='tester', db_path=str(tmp_path / 'db.json'))
+  list_id = storage.create_list('Chores')
+  item_ids = [storage.add_item(list_id, name) for name in ('Dishes', 'Laundry', 'Vacuum')]
+
+  result = storage.update_items(item_ids[:2], 'complete')
+  assert result.changed == item_ids[:2]
+
+  result = storage.delete_completed_items(list_id)
+  assert result.deleted == item_ids[:2]
+  assert [item.id for item in storage.get_items(list_id)] == item_ids[2:]
+
+
+def test_list_counters_follow_items_and_repair(tmp_path):
+  path = str(tmp_path / 'db.json')
+  storage = ReminderStorage(owner='tester', db_path=path)
+  list_id = storage.create_list('Chores')
+  item_ids = [storage.add_item(list_id, name) for name in ('Dishes', 'Laundry', 'Vacuum')]
+  storage.strike_item(item_ids[0])
+  storage.delete_item(item_ids[1])
+
+  reminder_list = storage.get_list(list_id)
+  assert (reminder_list.item_count, reminder_list.completed_count) == (2, 1)
+  assert verify_counters(path) == []
+
+  storage._lists_table.update({'item_count': 7}, doc_ids=[list_id])
+  assert storage.get_list(list_id).item_count == 7
+  assert repair_counters(path) == [{'list_id': list_id, 'stored': [7, 1], 'actual': [2, 1]}]
+  assert verify_counters(path) == []
+  assert storage.get_list(list_id).item_count == 2
+
+
+def test_model_response_matches_default_encoding():
+  items = [
+    ReminderItem(id=1, list_id=1, description='Café', completed=False),
+    ReminderItem(id=2, list_id=1, description='Dentist', completed=True, due_at=datetime(2030, 1, 1, 9, tzinfo=timezone.utc)),
+  ]
+
+  response = model_response(items, List[ReminderItem])
+  assert response.media_type == 'application/json'
+  assert json.loads(response.body) == jsonable_encoder(items)
+
+
+def test_working_set_pages_in_evicts_and_notices_outside_changes(tmp_path):
+  path = str(tmp_path / 'db.json')
+  write_json_atomically(path, {})
+  working_set = WorkingSet(max_bytes=10)
+  loads = []
+
+  def loader(owner, size=4):
+    return lambda: loads.append(owner) or (f'data for {owner}', size)
+
+  assert working_set.get(path, 'a', loader('a')) == 'data for a'
+  assert working_set.get(path, 'a', loader('a')) == 'data for a'
+  working_set.get(path, 'b', loader('b'))
+  working_set.get(path, 'c', loader('c'))
+  assert loads == ['a', 'b', 'c']
+  assert len(working_set) == 2 and working_set.resident_bytes == 8
+
+  # A write drops only the writer, and an outside change drops everyone
+  working_set.record_write(path, 'b')
+  working_set.get(path, 'c', loader('c'))
+  assert loads == ['a', 'b', 'c']
+  time.sleep(0.01)
+  write_json_atomically(path, {'changed': {}})
+  working_set.get(path, 'c', loader('c'))
+  assert loads == ['a', 'b', 'c', 'c']
+
+
+def test_atomic_writes_sync_the_file_and_its_directory(tmp_path, monkeypatch):
+  synced = []
+  real_fsync = os.fsync
+  monkeypatch.setattr(os, 'fsync', lambda handle: synced.append(os.fstat(handle).st_mode) or real_fsync(handle))
+
+  write_json_atomically(str(tmp_path / 'db.json'), {})
+  assert [stat.S_ISDIR(mode) for mode in synced] == [False, True]
+
+
+def test_committer_modes(tmp_path):
+  path = str(tmp_path / 'db.json')
+
+  relaxed = Committer(path, 'relaxed', flush_interval=60)
+  relaxed.wait(relaxed.commit({'version': 1}))
+  assert relaxed.read() == '{"version": 1}'
+  assert not os.path.exists(path)
+  relaxed.flush()
+  assert relaxed.read() is None
+  with open(path) as db_file:
+    assert json.load(db_file) == {'version': 1}
+
+  group = Committer(path, 'group', group_window=0.05)
+  flushes = storage_flushes.get(('group',))
+
+  def commit(version):
+    group.wait(group.commit({'version': version}))
+
+  threads = [threading.Thread(target=commit, args=(version,)) for version in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  assert group.durable_generation == 8
+  assert storage_flushes.get(('group',)) - flushes < 8
+  assert group.read() is None
+  with open(path) as db_file:
+    assert json.load(db_file)['version'] in range(8)
+
+
+def test_another_process_cannot_write_until_staged_commits_are_on_disk(tmp_path):
+  path = str(tmp_path / 'db.json')
+  # Each Committer opens its own lock file, the same as a committer in another process would
+  ours = Committer(path, 'relaxed', flush_interval=60)
+  theirs = FileLock(path + '.lock')
+
+  with ours.writing():
+    ours.commit({'version': 1})
+    assert not theirs.acquire(blocking=False)
+
+  # Still staged, so the file is not theirs to read for a write yet
+  assert not theirs.acquire(blocking=False)
+  ours.flush()
+  assert theirs.acquire(blocking=False)
+  theirs.release()
+
+
+def test_ranks_always_fit_between_neighbours():
+  ranks = [rank_between(None, None)]
+  for _ in range(100):
+    ranks.insert(0, rank_between(None, ranks[0]))
+    ranks.append(rank_between(ranks[-1], None))
+  for _ in range(100):
+    # Always into the same gap, which is what makes ranks grow
+    ranks.insert(1, rank_between(ranks[0], ranks[1]))
+  assert ranks == sorted(ranks) and len(set(ranks)) == len(ranks)
+
+  items = {str(i): {'list_id': 1, 'rank': rank} for i, rank in enumerate(ranks)}
+  items['999'] = {'list_id': 2}
+  assert rebalance_items(items) == 2
+  assert rebalance_items(items) == 0
+  rebalanced = [items[str(i)]['rank'] for i in range(len(ranks))]
+  assert rebalanced == sorted(rebalanced) and max(map(len, rebalanced)) <= MAX_RANK_LENGTH
+
+
+def test_moving_an_item_rewrites_only_its_rank(tmp_path):
+  storage = ReminderStorage(owner='tester', db_path=str(tmp_path / 'db.json'))
+  list_id = storage.create_list('Chores')
+  first, second, third = [storage.add_item(list_id, name) for name in ('Dishes', 'Laundry', 'Vacuum')]
+  ranks = {item.id: item.rank for item in storage.get_items(list_id)}
+
+  storage.move_item(third, after_id=first)
+  assert [item.id for item in storage.get_items(list_id)] == [first, third, second]
+  storage.move_item(second, after_id=None)
+  assert [item.id for item in storage.get_items(list_id)] == [second, first, third]
+  assert storage.get_item(first).rank == ranks[first]
+
+  # A move reads only the moved item's own list, however many items other lists hold
+  other_list_id = storage.create_list('Errands')
+  for number in range(50):
+    storage.add_item(other_list_id, f'Errand {number}')
+  storage.get_items(list_id)
+  timing = RequestTiming()
+  token = _current_timing.set(timing)
+  try:
+    storage.move_item(first, after_id=third)
+  finally:
+    _current_timing.reset(token)
+  assert [item.id for item in storage.get_items(list_id)] == [second, third, first]
+  assert timing.rows_scanned < 50
+
+
+def test_webhook_queue_deploys_only_the_latest_push_per_branch(tmp_path):
+  jobs_path = str(tmp_path / 'jobs.json')
+  queue = webhook_server.JobQueue(jobs_path)
+  first = queue.enqueue('main', 'a' * 40)
+  second = queue.enqueue('main', 'b' * 40)
+  feature = queue.enqueue('feature', 'c' * 40)
+
+  assert queue.get(first['id'])['status'] == 'superseded'
+  assert queue.get(first['id'])['superseded_by'] == second['id']
+  assert queue._take()['id'] == second['id']
+
+  # After a restart the job that was running is interrupted, and the queued one still runs
+  reloaded = webhook_server.JobQueue(jobs_path)
+  assert reloaded.get(second['id'])['status'] == 'interrupted'
+  assert reloaded._take()['id'] == feature['id']
+
+
+def test_webhook_tests_the_pushed_commit_and_caches_it(tmp_path, monkeypatch):
+  def git(*args, cwd):
+    result = subprocess.run(
+      ['git', '-c', 'user.name=Catty', '-c', 'user.email=catty@example.com', *args],
+      cwd=cwd, check=True, capture_output=True, text=True)
+    return result.stdout.strip()
+
+  origin, app_dir = tmp_path / 'origin', tmp_path / 'app'
+  (origin / 'tests').mkdir(parents=True)
+  git('init', '-q', '-b', 'main', cwd=origin)
+  (origin / 'tests' / 'test_gate.py').write_text('def test_gate():\n  assert False\n')
+  git('add', '.', cwd=origin)
+  git('commit', '-q', '-m', 'Failing', cwd=origin)
+  git('clone', '-q', str(origin), str(app_dir), cwd=tmp_path)
+
+  # The push arrives before the app checkout has pulled it
+  (origin / 'tests' / 'test_gate.py').write_text('def test_gate():\n  assert True\n')
+  git('commit', '-q', '-am', 'Passing', cwd=origin)
+  pushed = git('rev-parse', 'HEAD', cwd=origin)
+
+  monkeypatch.setattr(webhook_server, 'APP_DIR', str(app_dir))
+  monkeypatch.setattr(webhook_server, 'TEST_CACHE_FILE', str(tmp_path / 'cache.json'))
+  monkeypatch.setattr(webhook_server, 'TEST_SHARDS', [('Gate', 'test_gate.py')])
+
+  passed, report = webhook_server.run_tests(pushed, 'main')
+  assert passed and not report['cached'] and report['commit'] == pushed
+
+  passed, report = webhook_server.run_tests(pushed, 'main')
+  assert passed and report['cached']
+
+  # A configured shard whose file is gone fails the run, and the run is not cached
+  monkeypatch.setattr(webhook_server, 'TEST_SHARDS', [('Gate', 'test_gate.py'), ('Renamed', 'test_renamed.py')])
+  passed, report = webhook_server.run_tests(pushed, 'main')
+  assert not passed and report['shards'][1]['status'] == 'missing'
+  passed, report = webhook_server.run_tests(pushed, 'main')
+  assert not passed and not report['cached']
+
+  # The test checkout is gone, and the app checkout never moved
+  assert len(git('worktree', 'list', cwd=app_dir).splitlines()) == 1
+  assert git('rev-parse', 'HEAD', cwd=app_dir) != pushed
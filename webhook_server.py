@@ -1,239 +1,546 @@
-#!/usr/bin/env python3
-"""
-Webhook сервер для автоматического деплоя Catty Reminders.
-"""
-
-import sys
-import json
-import subprocess
-import os
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from datetime import datetime
-from pathlib import Path
-
-PORT = 8080
-APP_DIR = "/home/vboxuser/Desktop/DevOps/catty-reminders-app"
-DEPLOY_SCRIPT = "/home/vboxuser/Desktop/DevOps/catty-reminders-app/deploy.sh"
-VENV_PYTHON = os.path.join(APP_DIR, ".venv", "bin", "python")
-
-class WebhookHandler(BaseHTTPRequestHandler):
-    def log_message(self, format, *args):
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"🔔 [{ts}] {format % args}")
-
-    def _safe_write(self, b: bytes):
-        try:
-            self.wfile.write(b)
-        except BrokenPipeError:
-            return False
-        return True
-
-    def do_HEAD(self):
-        self.send_response(200)
-        self.send_header("Content-type", "text/html; charset=utf-8")
-        self.send_header("Connection", "close")
-        self.end_headers()
-
-    def do_GET(self):
-        html = f"""
-        <!doctype html>
-        <html lang="ru">
-        <head>
-          <meta charset="utf-8">
-          <meta name="viewport" content="width=device-width,initial-scale=1">
-          <title>Catty Reminders — Webhook</title>
-          <style>
-            body {{ font-family: Inter, Tahoma, Arial, sans-serif; max-width: 720px; margin: 40px auto; color: #222; }}
-            header {{ display:flex; align-items:center; gap:12px; }}
-            h1 {{ margin:0; font-size:1.4rem; }}
-            .meta {{ color:#555; margin-top:8px; }}
-            .box {{ background:#f7fafc; border:1px solid #e2e8f0; padding:16px; border-radius:8px; margin-top:16px; }}
-            a.small {{ color:#2563eb; text-decoration:none; font-size:0.9rem; }}
-          </style>
-        </head>
-        <body>
-          <header>
-            <div style="font-size:28px;">🚀</div>
-            <div>
-              <h1>Catty Reminders — Webhook</h1>
-              <div class="meta">Сервер готов принимать GitHub webhook'ы для автоматического деплоя.</div>
-            </div>
-          </header>
-
-          <div class="box">
-            <p><strong>Статус:</strong> активен</p>
-            <p><strong>Порт:</strong> {PORT}</p>
-            <p><strong>Время сервера:</strong> {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</p>
-            <p>Отправьте POST-запрос с заголовком <code>X-GitHub-Event: push</code>, чтобы инициировать деплой.</p>
-            <p style="margin-top:12px;"><a class="small" href="https://github.com/prafdin/catty-reminders-app">Исходный репозиторий</a></p>
-          </div>
-        </body>
-        </html>
-        """
-        body = html.encode("utf-8")
-        self.send_response(200)
-        self.send_header("Content-type", "text/html; charset=utf-8")
-        self.send_header("Content-Length", str(len(body)))
-        self.send_header("Connection", "close")
-        self.end_headers()
-        self._safe_write(body)
-
-    def do_POST(self):
-        try:
-            length = int(self.headers.get("Content-Length", 0))
-            body = self.rfile.read(length) if length else b""
-            print("→ Получен POST-запрос")
-            print(f"   Размер тела: {length} байт")
-
-            try:
-                payload = json.loads(body.decode("utf-8")) if body else {}
-            except json.JSONDecodeError as e:
-                payload = {}
-                print(f"⚠️ Ошибка разбора JSON: {e}")
-
-            event = self.headers.get("X-GitHub-Event", "unknown")
-
-            print(f"Событие от GitHub: {event}")
-            print(f"Репозиторий: {payload.get('repository', {}).get('full_name', 'неизвестен')}")
-
-            if event == "push":
-                self.handle_push(payload)
-            else:
-                print(f"Пропускаем событие типа: {event}")
-
-            self._ok()
-        except Exception as e:
-            print(f"‼️ Ошибка при обработке POST: {e}")
-            self._err(500, str(e))
-
-    def handle_push(self, payload):
-        print("→ Обработка push-события начата")
-        branch = payload.get("ref", "").replace("refs/heads/", "")
-        commits = len(payload.get("commits", []))
-        clone = payload.get("repository", {}).get("clone_url", "")
-        print(f"   Ветка: {branch or '<не указана>'}")
-        print(f"   Количество коммитов: {commits}")
-        print(f"   URL для клона: {clone or '<не указана>'}")
-
-        if self.run_tests():
-            self.run_deploy()
-        else:
-            print("✖ Тесты не пройдены — деплой отменён")
-
-    def run_tests(self):
-        print("→ Запуск набора тестов")
-        test_files = [
-            ("Unit тесты", "test_unit.py"),
-            ("API тесты", "test_api.py"),
-        ]
-
-        python_exec = VENV_PYTHON if Path(VENV_PYTHON).exists() else sys.executable
-        print(f"Используем интерпретатор Python: {python_exec}")
-
-        env = os.environ.copy()
-        env["PYTHONPATH"] = f"{APP_DIR}:{os.path.join(APP_DIR,'tests')}"
-        env.setdefault("BASE_URL", "http://127.0.0.1:8181")
-
-        all_ok = True
-        for name, fname in test_files:
-            path = os.path.join(APP_DIR, "tests", fname)
-            if not os.path.exists(path):
-                print(f"   ⚠ Файл для {name} не найден: {path}")
-                continue
-
-            print(f"   → Выполняем: {name}")
-            try:
-                cmd = [python_exec, "-m", "pytest", path, "-q", "-rA"]
-                res = subprocess.run(
-                    cmd,
-                    cwd=APP_DIR,
-                    capture_output=True,
-                    text=True,
-                    timeout=300,
-                    env=env,
-                )
-                if res.returncode == 0:
-                    print(f"   ✓ {name}: Успешно")
-                else:
-                    print(f"   ✖ {name}: Завершились с кодом {res.returncode}")
-                    snippet = (res.stderr or res.stdout or "")[-4000:]
-                    print(snippet)
-                    all_ok = False
-            except subprocess.TimeoutExpired:
-                print(f"   ⏰ {name}: Превышено время выполнения")
-                all_ok = False
-            except Exception as e:
-                print(f"   💥 {name}: Исключение - {e}")
-                all_ok = False
-
-        return all_ok
-
-    def run_deploy(self):
-        print("→ Запускаем процедуру деплоя")
-        if not os.path.exists(DEPLOY_SCRIPT):
-            print(f"   ✖ Не найден скрипт деплоя: {DEPLOY_SCRIPT}")
-            return False
-
-        try:
-            res = subprocess.run(
-                ["/bin/bash", DEPLOY_SCRIPT],
-                capture_output=True,
-                text=True,
-                timeout=600,
-            )
-            if res.returncode == 0:
-                print("✓ Деплой выполнен успешно")
-                print("---- stdout деплоя ----")
-                print(res.stdout)
-                print("---- stderr деплоя ----")
-                print(res.stderr)
-                return True
-            else:
-                print("✖ Ошибка во время деплоя")
-                print(f"   Код выхода: {res.returncode}")
-                print("---- stdout деплоя ----")
-                print(res.stdout)
-                print("---- stderr деплоя ----")
-                print(res.stderr)
-                return False
-        except subprocess.TimeoutExpired:
-            print("⏰ Таймаут при выполнении деплоя")
-            return False
-        except Exception as e:
-            print(f"💥 Исключение при деплое:{e}")
-            return False
-
-    def _ok(self):
-        body = b'{"status":"success","message":"Webhook processed"}'
-        self.send_response(200)
-        self.send_header("Content-type", "application/json")
-        self.send_header("Content-Length", str(len(body)))
-        self.send_header("Connection", "close")
-        self.end_headers()
-        self._safe_write(body)
-
-    def _err(self, code, msg):
-        payload = json.dumps({"status": "error", "message": msg}).encode("utf-8")
-        self.send_response(code)
-        self.send_header("Content-type", "application/json")
-        self.send_header("Content-Length", str(len(payload)))
-        self.send_header("Connection", "close")
-        self.end_headers()
-        self._safe_write(payload)
-
-def main():
-    print("Запуск сервера: Catty Reminders Webhook")
-    print(f"Слушаем порт: {PORT}")
-    print(f"Рабочая папка приложения: {APP_DIR}")
-    print(f"Скрипт деплоя: {DEPLOY_SCRIPT}")
-    print("Ожидаем входящие webhook-запросы...")
-    server = HTTPServer(("0.0.0.0", PORT), WebhookHandler)
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        print("Сервер остановлен вручную")
-    finally:
-        server.server_close()
-
-if __name__ == "__main__":
+#!/usr/bin/env python3
+"""
+Webhook сервер для автоматического деплоя Catty Reminders.
+"""
+
+import sys
+import json
+import subprocess
+import os
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from datetime import datetime
+from pathlib import Path
+
+PORT = 8080
+APP_DIR = "/home/vboxuser/Desktop/DevOps/catty-reminders-app"
+DEPLOY_SCRIPT = "/home/vboxuser/Desktop/DevOps/catty-reminders-app/deploy.sh"
+VENV_PYTHON = os.path.join(APP_DIR, ".venv", "bin", "python")
+JOBS_FILE = os.path.join(APP_DIR, "webhook_jobs.json")
+JOB_HISTORY_LIMIT = 200
+TEST_CACHE_FILE = os.path.join(APP_DIR, "webhook_test_cache.json")
+TEST_CACHE_LIMIT = 100
+REQUIREMENTS_FILES = ["requirements.txt"]
+TEST_SHARDS = [
+    ("Unit тесты", "test_unit.py"),
+    ("API тесты", "test_api.py"),
+]
+
+
+def _git(args, cwd=None, timeout=120):
+    return subprocess.run(
+        ["git", *args],
+        cwd=cwd or APP_DIR,
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+
+
+def _resolve_commit(commit, branch):
+    """
+    Забирает из origin запушенный коммит (или голову ветки, если SHA не пришёл)
+    и возвращает его полный SHA.
+    """
+    branch = branch or "main"
+    _git(["fetch", "origin", branch])
+    if commit and _git(["cat-file", "-e", f"{commit}^{{commit}}"]).returncode != 0:
+        _git(["fetch", "origin", commit])
+
+    ref = commit or f"origin/{branch}"
+    res = _git(["rev-parse", "--verify", f"{ref}^{{commit}}"])
+    if res.returncode != 0:
+        raise RuntimeError(f"Коммит {ref} не найден: {res.stderr.strip()}")
+    return res.stdout.strip()
+
+
+def _requirements_hash(commit):
+    digest = hashlib.sha256()
+    for name in REQUIREMENTS_FILES:
+        res = _git(["show", f"{commit}:{name}"])
+        if res.returncode == 0:
+            digest.update(res.stdout.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _add_checkout(commit):
+    # Отдельный worktree: тесты идут на проверяемом коммите, а рабочая копия не меняется
+    path = tempfile.mkdtemp(prefix="catty-test-")
+    res = _git(["worktree", "add", "--detach", path, commit])
+    if res.returncode != 0:
+        shutil.rmtree(path, ignore_errors=True)
+        raise RuntimeError(f"Не удалось выгрузить коммит {commit[:12]}: {res.stderr.strip()}")
+    return path
+
+
+def _remove_checkout(path):
+    _git(["worktree", "remove", "--force", path])
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _load_test_cache():
+    try:
+        with open(TEST_CACHE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _save_test_cache(cache):
+    # Keep only the newest entries
+    entries = sorted(cache.items(), key=lambda item: item[1].get("passed_at", ""))
+    cache = dict(entries[-TEST_CACHE_LIMIT:])
+    tmp_path = TEST_CACHE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, TEST_CACHE_FILE)
+
+
+def _run_shard(name, fname, python_exec, env, checkout):
+    path = os.path.join(checkout, "tests", fname)
+    if not os.path.exists(path):
+        # Переименованный или удалённый модуль тестов не должен молча давать зелёный прогон
+        print(f"   ✖ {name}: Файл не найден: {path} — прогон считается неуспешным")
+        return {"name": name, "file": fname, "status": "missing", "seconds": 0.0}
+
+    print(f"   → Выполняем: {name}")
+    started = time.perf_counter()
+    status = "failed"
+    try:
+        cmd = [python_exec, "-m", "pytest", path, "-q", "-rA", "-p", "no:cacheprovider"]
+        res = subprocess.run(
+            cmd,
+            cwd=checkout,
+            capture_output=True,
+            text=True,
+            timeout=300,
+            env=env,
+        )
+        seconds = time.perf_counter() - started
+        if res.returncode == 0:
+            status = "passed"
+            print(f"   ✓ {name}: Успешно за {seconds:.1f} с")
+        else:
+            print(f"   ✖ {name}: Завершились с кодом {res.returncode} за {seconds:.1f} с")
+            snippet = (res.stderr or res.stdout or "")[-4000:]
+            print(snippet)
+    except subprocess.TimeoutExpired:
+        status = "timeout"
+        print(f"   ⏰ {name}: Превышено время выполнения")
+    except Exception as e:
+        print(f"   💥 {name}: Исключение - {e}")
+
+    return {"name": name, "file": fname, "status": status, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def run_tests(commit=None, branch=None):
+    """
+    Запускает тесты параллельно (по одному процессу pytest на файл)
+    на запушенном коммите, выгруженном в отдельный worktree.
+    Успешный результат кэшируется по SHA этого коммита, хэшу его requirements и набору шардов,
+    поэтому повторная доставка webhook-а или повторный деплой не гоняют тесты заново.
+    Возвращает (успех, отчёт по шардам); SHA проверенного коммита — в отчёте.
+    """
+    print("→ Запуск набора тестов")
+
+    commit = _resolve_commit(commit, branch)
+    # Успех при другом наборе шардов ничего не говорит о текущем, поэтому набор тоже входит в ключ
+    shards_hash = hashlib.sha256(json.dumps(TEST_SHARDS).encode("utf-8")).hexdigest()[:16]
+    cache_key = f"{commit}:{_requirements_hash(commit)}:{shards_hash}"
+
+    cache = _load_test_cache()
+    if cache_key in cache:
+        print(f"   ✓ Коммит {commit[:12]} уже проверен ({cache[cache_key]['passed_at']}) — тесты пропущены")
+        return True, {"cached": True, "commit": commit, "shards": cache[cache_key]["shards"]}
+
+    python_exec = VENV_PYTHON if Path(VENV_PYTHON).exists() else sys.executable
+    print(f"Используем интерпретатор Python: {python_exec}")
+
+    checkout = _add_checkout(commit)
+    print(f"   Коммит {commit[:12]} выгружен в {checkout}")
+    try:
+        all_ok, report = _run_shards(commit, python_exec, checkout)
+    finally:
+        _remove_checkout(checkout)
+
+    if all_ok:
+        cache[cache_key] = {"passed_at": _now(), "shards": report["shards"]}
+        try:
+            _save_test_cache(cache)
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить кэш тестов: {e}")
+
+    return all_ok, report
+
+
+def _run_shards(commit, python_exec, checkout):
+    env = os.environ.copy()
+    env["PYTHONPATH"] = f"{checkout}:{os.path.join(checkout, 'tests')}"
+
+    started = time.perf_counter()
+    workers = max(1, min(len(TEST_SHARDS), os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_shard, name, fname, python_exec, env, checkout) for name, fname in TEST_SHARDS]
+        shards = [future.result() for future in futures]
+    wall_seconds = time.perf_counter() - started
+
+    print(f"   Время по шардам ({workers} параллельно, всего {wall_seconds:.1f} с):")
+    for shard in shards:
+        print(f"      {shard['name']:<16} {shard['status']:<8} {shard['seconds']:>7.1f} с")
+
+    # Кэшируется и деплоится только прогон, в котором каждый настроенный шард выполнился и прошёл
+    all_ok = all(shard["status"] == "passed" for shard in shards)
+    report = {"cached": False, "commit": commit, "wall_seconds": round(wall_seconds, 3), "shards": shards}
+    return all_ok, report
+
+
+def run_deploy(commit=None):
+    print("→ Запускаем процедуру деплоя")
+    if not os.path.exists(DEPLOY_SCRIPT):
+        print(f"   ✖ Не найден скрипт деплоя: {DEPLOY_SCRIPT}")
+        return False
+
+    try:
+        # Деплоится именно проверенный коммит, даже если в ветку уже пришёл следующий
+        env = os.environ.copy()
+        if commit:
+            env["DEPLOY_COMMIT"] = commit
+        res = subprocess.run(
+            ["/bin/bash", DEPLOY_SCRIPT],
+            capture_output=True,
+            text=True,
+            timeout=600,
+            env=env,
+        )
+        if res.returncode == 0:
+            print("✓ Деплой выполнен успешно")
+            print("---- stdout деплоя ----")
+            print(res.stdout)
+            print("---- stderr деплоя ----")
+            print(res.stderr)
+            return True
+        else:
+            print("✖ Ошибка во время деплоя")
+            print(f"   Код выхода: {res.returncode}")
+            print("---- stdout деплоя ----")
+            print(res.stdout)
+            print("---- stderr деплоя ----")
+            print(res.stderr)
+            return False
+    except subprocess.TimeoutExpired:
+        print("⏰ Таймаут при выполнении деплоя")
+        return False
+    except Exception as e:
+        print(f"💥 Исключение при деплое:{e}")
+        return False
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class JobQueue:
+    """
+    Очередь задач деплоя с фоновым обработчиком.
+
+    Push-и в одну ветку объединяются: пока задача ждёт в очереди,
+    новый push заменяет её, и деплоится только последний коммит.
+    История задач сохраняется в JSON-файл и переживает перезапуск сервера.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.jobs = OrderedDict()
+        self.pending = OrderedDict()
+        self.cond = threading.Condition()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                jobs = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Не удалось прочитать историю задач {self.path}: {e}")
+            return
+
+        for job in jobs:
+            if job["status"] == "running":
+                job["status"] = "interrupted"
+                job["finished_at"] = _now()
+            elif job["status"] == "queued":
+                self._supersede(job["branch"], job["id"])
+                self.pending[job["branch"]] = job["id"]
+            self.jobs[job["id"]] = job
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(list(self.jobs.values()), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _trim(self):
+        active = set(self.pending.values())
+        removable = [
+            job_id for job_id, job in self.jobs.items()
+            if job_id not in active and job["status"] != "running"
+        ]
+        for job_id in removable[:max(0, len(self.jobs) - JOB_HISTORY_LIMIT)]:
+            del self.jobs[job_id]
+
+    def _supersede(self, branch, new_job_id):
+        previous_id = self.pending.pop(branch, None)
+        if previous_id and previous_id in self.jobs:
+            self.jobs[previous_id].update(
+                status="superseded",
+                superseded_by=new_job_id,
+                finished_at=_now(),
+            )
+            print(f"   ↷ Задача {previous_id} заменена более новой {new_job_id}")
+
+    def enqueue(self, branch, commit):
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "branch": branch,
+            "commit": commit,
+            "status": "queued",
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "superseded_by": None,
+            "tests_passed": None,
+            "test_report": None,
+            "message": None,
+        }
+        with self.cond:
+            self._supersede(branch, job["id"])
+            self.jobs[job["id"]] = job
+            self.pending[branch] = job["id"]
+            self._trim()
+            self._save()
+            self.cond.notify()
+        return dict(job)
+
+    def get(self, job_id):
+        with self.cond:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def recent(self, limit=20):
+        with self.cond:
+            return [dict(job) for job in list(self.jobs.values())[-limit:]][::-1]
+
+    def _update(self, job_id, **fields):
+        with self.cond:
+            self.jobs[job_id].update(fields)
+            self._save()
+
+    def _take(self):
+        with self.cond:
+            while not self.pending:
+                self.cond.wait()
+            _, job_id = self.pending.popitem(last=False)
+            self.jobs[job_id].update(status="running", started_at=_now())
+            self._save()
+            return dict(self.jobs[job_id])
+
+    def _work(self):
+        while True:
+            job = self._take()
+            print(f"→ Задача {job['id']}: ветка {job['branch'] or '<не указана>'}, коммит {job['commit'] or '<неизвестен>'}")
+            try:
+                tests_ok, test_report = run_tests(job["commit"], job["branch"])
+                self._update(job["id"], test_report=test_report)
+                if not tests_ok:
+                    print("✖ Тесты не пройдены — деплой отменён")
+                    self._update(job["id"], status="failed", tests_passed=False,
+                                 message="Тесты не пройдены", finished_at=_now())
+                elif run_deploy(test_report["commit"]):
+                    self._update(job["id"], status="succeeded", tests_passed=True,
+                                 message="Деплой выполнен", finished_at=_now())
+                else:
+                    self._update(job["id"], status="failed", tests_passed=True,
+                                 message="Ошибка деплоя", finished_at=_now())
+            except Exception as e:
+                print(f"💥 Задача {job['id']}: исключение - {e}")
+                self._update(job["id"], status="failed", message=str(e), finished_at=_now())
+
+    def start(self):
+        worker = threading.Thread(target=self._work, name="deploy-worker", daemon=True)
+        worker.start()
+
+
+JOBS = JobQueue(JOBS_FILE)
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"🔔 [{ts}] {format % args}")
+
+    def _safe_write(self, b: bytes):
+        try:
+            self.wfile.write(b)
+        except BrokenPipeError:
+            return False
+        return True
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-type", "text/html; charset=utf-8")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/jobs":
+            self._json(200, {"jobs": JOBS.recent()})
+            return
+        if path.startswith("/jobs/"):
+            job = JOBS.get(path[len("/jobs/"):])
+            if job:
+                self._json(200, job)
+            else:
+                self._err(404, "Задача не найдена")
+            return
+
+        html = f"""
+        <!doctype html>
+        <html lang="ru">
+        <head>
+          <meta charset="utf-8">
+          <meta name="viewport" content="width=device-width,initial-scale=1">
+          <title>Catty Reminders — Webhook</title>
+          <style>
+            body {{ font-family: Inter, Tahoma, Arial, sans-serif; max-width: 720px; margin: 40px auto; color: #222; }}
+            header {{ display:flex; align-items:center; gap:12px; }}
+            h1 {{ margin:0; font-size:1.4rem; }}
+            .meta {{ color:#555; margin-top:8px; }}
+            .box {{ background:#f7fafc; border:1px solid #e2e8f0; padding:16px; border-radius:8px; margin-top:16px; }}
+            a.small {{ color:#2563eb; text-decoration:none; font-size:0.9rem; }}
+          </style>
+        </head>
+        <body>
+          <header>
+            <div style="font-size:28px;">🚀</div>
+            <div>
+              <h1>Catty Reminders — Webhook</h1>
+              <div class="meta">Сервер готов принимать GitHub webhook'ы для автоматического деплоя.</div>
+            </div>
+          </header>
+
+          <div class="box">
+            <p><strong>Статус:</strong> активен</p>
+            <p><strong>Порт:</strong> {PORT}</p>
+            <p><strong>Время сервера:</strong> {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</p>
+            <p>Отправьте POST-запрос с заголовком <code>X-GitHub-Event: push</code>, чтобы поставить деплой в очередь.</p>
+            <p>Статус задачи: <code>GET /jobs/{{id}}</code>, последние задачи: <a class="small" href="/jobs">/jobs</a></p>
+            <p style="margin-top:12px;"><a class="small" href="https://github.com/prafdin/catty-reminders-app">Исходный репозиторий</a></p>
+          </div>
+        </body>
+        </html>
+        """
+        body = html.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self._safe_write(body)
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length) if length else b""
+            print("→ Получен POST-запрос")
+            print(f"   Размер тела: {length} байт")
+
+            try:
+                payload = json.loads(body.decode("utf-8")) if body else {}
+            except json.JSONDecodeError as e:
+                payload = {}
+                print(f"⚠️ Ошибка разбора JSON: {e}")
+
+            event = self.headers.get("X-GitHub-Event", "unknown")
+
+            print(f"Событие от GitHub: {event}")
+            print(f"Репозиторий: {payload.get('repository', {}).get('full_name', 'неизвестен')}")
+
+            if event == "push":
+                job = self.handle_push(payload)
+                self._json(202, {"status": "accepted", "job_id": job["id"], "job_url": f"/jobs/{job['id']}"})
+                return
+            else:
+                print(f"Пропускаем событие типа: {event}")
+
+            self._ok()
+        except Exception as e:
+            print(f"‼️ Ошибка при обработке POST: {e}")
+            self._err(500, str(e))
+
+    def handle_push(self, payload):
+        print("→ Обработка push-события начата")
+        branch = payload.get("ref", "").replace("refs/heads/", "")
+        commits = len(payload.get("commits", []))
+        clone = payload.get("repository", {}).get("clone_url", "")
+        print(f"   Ветка: {branch or '<не указана>'}")
+        print(f"   Количество коммитов: {commits}")
+        print(f"   URL для клона: {clone or '<не указана>'}")
+
+        job = JOBS.enqueue(branch, payload.get("after"))
+        print(f"   ✓ Задача {job['id']} поставлена в очередь")
+        return job
+
+
+    def _ok(self):
+        body = b'{"status":"success","message":"Webhook processed"}'
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self._safe_write(body)
+
+    def _json(self, code, data):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self._safe_write(payload)
+
+    def _err(self, code, msg):
+        payload = json.dumps({"status": "error", "message": msg}).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self._safe_write(payload)
+
+def main():
+    print("Запуск сервера: Catty Reminders Webhook")
+    print(f"Слушаем порт: {PORT}")
+    print(f"Рабочая папка приложения: {APP_DIR}")
+    print(f"Скрипт деплоя: {DEPLOY_SCRIPT}")
+    print(f"История задач: {JOBS_FILE}")
+    print("Ожидаем входящие webhook-запросы...")
+    JOBS.start()
+    server = ThreadingHTTPServer(("0.0.0.0", PORT), WebhookHandler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Сервер остановлен вручную")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
     main()
\ No newline at end of file